@@ -23,6 +23,7 @@
 # OTHER DEALINGS IN THE SOFTWARE.
 # -----------------------------------------------------------------------
 """Implementation of an LP solver using the alternating direction method of multipliers (ADMM) method."""
+import logging
 import time
 
 import numpy as np
@@ -35,11 +36,18 @@ from .gaussSiedel import GaussSeidel
 from .gaussSiedel import boundedGaussSeidelClass
 from .tools import (
     Chrono,
+    ParallelSparseOperator,
+    PhaseProfiler,
+    check_convergence,
     convert_to_py_sparse_format,
     convert_to_standard_form_with_bounds,
     precondition_constraints,
+    projected_gradient_residual,
+    relative_gap,
 )
 
+logger = logging.getLogger(__name__)
+
 # import  scikits.sparse.cholmod
 # @profile
 
@@ -61,8 +69,16 @@ def lp_admm(
     max_time=None,
     use_preconditioning=True,
     nb_iter_plot=10,
+    tol_primal=None,
+    tol_dual=None,
+    tol_gap=None,
+    profiler=None,
+    nb_threads=1,
 ):
     # simple ADMM method with an approximate resolution of a quadratic subproblem using conjugate gradient
+    # stops early once the residuals evaluated every nb_iter_plot iterations are below
+    # the tolerances that are not None
+    # the products with a_eq and its transpose are done with nb_threads threads
     use_lu = False
     use_cholesky = False
     use_amg = False
@@ -70,9 +86,13 @@ def lp_admm(
     use_bounded_gauss_siedel = True
     use_unbounded_gauss_siedel = False
 
+    if profiler is None:
+        profiler = PhaseProfiler()
+    profiler.start("preprocessing")
     n = c.size
     if x0 is None:
         x0 = np.zeros(c.size)
+    profiler.start("preconditioning")
     if a_eq is not None:
         a_eq, beq = precondition_constraints(a_eq, beq, alpha=2)
     if (
@@ -81,15 +101,23 @@ def lp_admm(
         a_ineq, b_lower, b_upper = precondition_constraints(
             a_ineq, b_lower, b_upper, alpha=2
         )
+    profiler.stop("preconditioning")
+    profiler.start("conversion")
     c, a_eq, beq, lb, ub, x0 = convert_to_standard_form_with_bounds(
         c, a_eq, beq, a_ineq, b_lower, b_upper, lb, ub, x0
     )
+    profiler.stop("conversion")
     x = x0
 
     # trying some preconditioning
     if use_preconditioning:
+        profiler.start("preconditioning")
         a_eq, beq = precondition_constraints(a_eq, beq, alpha=2)
+        profiler.stop("preconditioning")
+    a_eq_operator = ParallelSparseOperator(a_eq, nb_threads)
+    profiler.stop("preprocessing")
 
+    profiler.start("factorization")
     a_t_a = a_eq.T * a_eq
     # AAt=a_eq*a_eq.T
     a_t_b = a_eq.T * beq
@@ -103,6 +131,8 @@ def lp_admm(
     lambda_ineq = np.zeros(x.shape)
     if use_lu:
         lu_m = scipy.sparse.linalg.splu(m)
+        factor_nnz = lu_m.L.nnz + lu_m.U.nnz
+        profiler.count_factorization(factor_nnz)
         # luM = scipy.sparse.linalg.spilu(M,drop_tol=0.01)
     elif use_cholesky:
         import scikits.sparse
@@ -110,10 +140,12 @@ def lp_admm(
         ch = Chrono()
         ch.tic()
         chol = scikits.sparse.cholmod.cholesky(m.tocsc())
-        print("cholesky factorization took " + str(ch.toc()) + " seconds")
-        print(
-            "the sparsity ratio between the cholesky decomposition of M and M is "
-            + str(chol.L().nnz / float(m.nnz))
+        logger.debug("cholesky factorization took %s seconds", ch.toc())
+        factor_nnz = chol.L().nnz
+        profiler.count_factorization(factor_nnz)
+        logger.debug(
+            "the sparsity ratio between the cholesky decomposition of M and M is %s",
+            chol.L().nnz / float(m.nnz),
         )
 
     elif use_amg:
@@ -137,20 +169,34 @@ def lp_admm(
 
     order = np.arange(x.size).astype(np.uint32)
     bs = boundedGaussSeidelClass(m)
+    profiler.stop("factorization")
     alpha = 1.4
-    start = time.clock()
+    start = time.perf_counter()
     elapsed = start
+    status = "max_iter"
+    profiler.start("iterations")
     while i <= nb_iter / nb_cg_iter:
+        if i % nb_iter_plot == 0:
+            profiler.lap("iteration_batch")
         # solve the penalized problem with respect to x
         # c +gamma_eq*(a_t_a x-a_t_b) + gamma_ineq*(x -xp)+lambda_eq*a_eq+lambda_ineq
         # M*x=-c+a_t_b+gamma_ineq*xp-lambdas-lambda_eq*a_eq
 
-        y = -c + gamma_eq * a_t_b + gamma_ineq * xp - lambda_eq * a_eq - lambda_ineq
+        y = (
+            -c
+            + gamma_eq * a_t_b
+            + gamma_ineq * xp
+            - a_eq_operator.rmatvec(lambda_eq)
+            - lambda_ineq
+        )
+        profiler.count_spmv(a_eq, transposed=True)
         # print 'iter'+str(i)+' '+str(L(x, xp,lambda_eq,lambda_ineq))
         if use_lu:
             x = lu_m.solve(y)
+            profiler.count_solve(factor_nnz)
         elif use_cholesky:
             x = chol.solve_A(y)
+            profiler.count_solve(factor_nnz)
         elif use_bounded_gauss_siedel:
             xprev = x.copy()
 
@@ -160,6 +206,7 @@ def lp_admm(
             # else:
             # order=np.arange(x.size-1,-1,-1).astype(np.uint32)
             bs.solve(y, lb, ub, x, maxiter=nb_cg_iter, w=1, order=order)
+            profiler.count_solve(m.nnz, nb=nb_cg_iter)
             speed = x - xprev
         elif use_unbounded_gauss_siedel:
             xprev = x.copy()
@@ -169,7 +216,7 @@ def lp_admm(
             ):  # optimal sep along the direction given by the last two iterates, does not seem to improve much speed
                 direction = speed
                 t = -direction.dot(m * xprev - y)
-                print(t)
+                logger.debug("step %s", t)
                 if abs(t) > 0:
                     step_length = t / (direction.dot(m * direction))
                     x = xprev + step_length * direction
@@ -177,6 +224,7 @@ def lp_admm(
                 pass
                 # x=xprev+0.8*speed
             GaussSeidel(m, y, x, maxiter=nb_cg_iter, w=1.0)
+            profiler.count_solve(m.nnz, nb=nb_cg_iter)
             speed = x - xprev
             x = alpha * x + (1 - alpha) * xp
         elif use_cg:
@@ -197,44 +245,42 @@ def lp_admm(
                 pass
             # start conjugate gradient from there (could use previous direction ? )
             x = conjgrad(m, y, maxiter=nb_cg_iter, x0=x)
+            profiler.count_spmv(m, nb=nb_cg_iter)
             speed = x - xprev
             x = alpha * x + (1 - alpha) * xp
         elif use_amg:
             # xprev=x.copy()
             # x=xprev+1*speed
             x = m_amg.solve(y, x0=x, tol=1e-3)
+            profiler.count_solve(m.nnz)
             # speed=x-xprev
             x = alpha * x + (1 - alpha) * xp  # over relaxation
 
         else:
-            print("unkown method")
-            raise
+            raise ValueError("unknown method")
 
         if i % nb_iter_plot == 0:
 
-            elapsed = time.clock() - start
+            elapsed = time.perf_counter() - start
             if max_time is not None and elapsed > max_time:
+                status = "max_time"
                 break
             energy1 = energy(x, xp, lambda_eq, lambda_ineq)
             energy2 = energy1
-            r = a_eq * x - beq
+            r = a_eq_operator.matvec(x) - beq
+            profiler.count_spmv(a_eq, nb=2)
             max_violated_equality = np.max(np.abs(r))
             max_violated_inequality = max(0, -np.min(x))
 
-            print(
-                "iter"
-                + str(i)
-                + ": energy1= "
-                + str(energy1)
-                + " energy2="
-                + str(energy2)
-                + " elapsed "
-                + str(elapsed)
-                + " second"
-                + " max violated inequality:"
-                + str(max_violated_inequality)
-                + " max violated equality:"
-                + str(max_violated_equality)
+            logger.info(
+                "iter%d: energy1= %s energy2=%s elapsed %s second"
+                " max violated inequality:%s max violated equality:%s",
+                i,
+                energy1,
+                energy2,
+                elapsed,
+                max_violated_inequality,
+                max_violated_equality,
             )
             if callback_func is not None:
                 callback_func(
@@ -246,6 +292,21 @@ def lp_admm(
                     max_violated_equality,
                     max_violated_inequality,
                 )
+            # reduced costs using the multipliers after their update below
+            d = c + a_eq_operator.rmatvec(lambda_eq + gamma_eq * r) + lambda_ineq
+            profiler.count_spmv(a_eq, transposed=True)
+            # the standard form variables may have negative lower bounds
+            bounds_violation = max(0, np.max(lb - x), np.max(x - ub))
+            if check_convergence(
+                max(max_violated_equality, bounds_violation),
+                projected_gradient_residual(x, d, lb, ub),
+                relative_gap(c.dot(x), energy1),
+                tol_primal,
+                tol_dual,
+                tol_gap,
+            ):
+                status = "converged"
+                break
 
         # solve the penalized problem with respect to xp
         # -gamma_ineq*(x-xp)-lambda_ineq=0
@@ -259,14 +320,18 @@ def lp_admm(
             xp = x
         # print 'iter'+str(i)+' '+str(L(x, xp,lambda_eq,lambda_ineq))
         lambda_eq = lambda_eq + gamma_eq * (
-            a_eq * x - beq
+            a_eq_operator.matvec(x) - beq
         )  # could use heavy ball instead of gradient step ?
+        profiler.count_spmv(a_eq)
 
         # could try to update the penalty ?
         # gamma_ineq=gamma_ineq+
         # M=gamma_eq*a_t_a+gamma_ineq*Id
         i += 1
-    return x[0:n]
+    profiler.stop("iteration_batch")
+    profiler.stop("iterations")
+    a_eq_operator.close()
+    return x[0:n], status
 
 
 def lp_admm2(
@@ -285,12 +350,18 @@ def lp_admm2(
     max_time=None,
     use_preconditioning=False,
     nb_iter_plot=10,
+    tol_primal=None,
+    tol_dual=None,
+    tol_gap=None,
+    profiler=None,
 ):
     # simple ADMM method with an approximate resolution of a quadratic subproblem using conjugate gradient
     # inspired by Boyd's paper on ADMM
     # Distributed Optimization and Statistical Learning via the Alternating Direction Method of Multipliers
     # the difference with admm_solver is that the linear equality constraints a_eq*x=beq are enforced during the resolution
     # of the subproblem instead of beeing enforced through multipliers
+    # stops early once the primal residual x-xp and the dual residual
+    # gamma_ineq*(xp-xp_prev) from Boyd's paper are below the tolerances that are not None
     use_lu = True
     use_amg = False
     use_cholesky = False
@@ -299,13 +370,17 @@ def lp_admm2(
     # relaxation parameter should be in [0,2] , 1.95 seems to be often a good choice
     alpha = 1.95
 
-    start = time.clock()
+    start = time.perf_counter()
     elapsed = start
+    if profiler is None:
+        profiler = PhaseProfiler()
+    profiler.start("preprocessing")
     n = c.size
     if x0 is None:
         x0 = np.zeros(c.size)
 
     if use_preconditioning:
+        profiler.start("preconditioning")
         if a_eq is not None:
             a_eq, beq = precondition_constraints(a_eq, beq, alpha=2)
         if (
@@ -314,10 +389,13 @@ def lp_admm2(
             a_ineq, b_lower, b_upper = precondition_constraints(
                 a_ineq, b_lower, b_upper, alpha=2
             )
+        profiler.stop("preconditioning")
 
+    profiler.start("conversion")
     c, a_eq, beq, lb, ub, x0 = convert_to_standard_form_with_bounds(
         c, a_eq, beq, a_ineq, b_lower, b_upper, lb, ub, x0
     )
+    profiler.stop("conversion")
     x = x0
 
     xp = x.copy()
@@ -326,8 +404,12 @@ def lp_admm2(
     ch = Chrono()
     # trying some preconditioning
     if use_preconditioning:
+        profiler.start("preconditioning")
         a_eq, beq = precondition_constraints(a_eq, beq, alpha=2)
+        profiler.stop("preconditioning")
+    profiler.stop("preprocessing")
 
+    profiler.start("factorization")
     m = scipy.sparse.vstack(
         (
             scipy.sparse.hstack(
@@ -340,6 +422,8 @@ def lp_admm2(
     ).tocsr()
     if use_lu:
         lu_m = scipy.sparse.linalg.splu(m.tocsc())
+        factor_nnz = lu_m.L.nnz + lu_m.U.nnz
+        profiler.count_factorization(factor_nnz)
         nb_cg_iter = 1
     elif use_cholesky:
         import scikits.sparse
@@ -352,25 +436,29 @@ def lp_admm2(
             m.tocsc(), mode="simplicial"
         )  # pip install scikit-sparse, but difficult to compile in windows
 
-        print("cholesky factorization took " + str(ch.toc()) + " seconds")
-        print(
-            "the sparsity ratio between the cholesky decomposition of M and M is "
-            + str(chol.L().nnz / float(m.nnz))
+        logger.debug("cholesky factorization took %s seconds", ch.toc())
+        factor_nnz = chol.L().nnz
+        profiler.count_factorization(factor_nnz)
+        logger.debug(
+            "the sparsity ratio between the cholesky decomposition of M and M is %s",
+            chol.L().nnz / float(m.nnz),
         )
         nb_cg_iter = 1
     elif use_cholesky2:
         import scikits.umfpack  # pipinstall scikit-umfpack
 
-        print("using UMFPACK_STRATEGY_SYMMETRIC through PySparse")
+        logger.debug("using UMFPACK_STRATEGY_SYMMETRIC through PySparse")
         ch.tic()
         m2 = convert_to_py_sparse_format(m)
-        print("conversion :" + str(ch.toc()))
+        logger.debug("conversion :%s", ch.toc())
         ch.tic()
         lu_umfpack = scikits.umfpack.factorize(
             m2, strategy="UMFPACK_STRATEGY_SYMMETRIC"
         )
-        print("nnz per line :" + str(lu_umfpack.nnz / float(m2.shape[0])))
-        print("factorization :" + str(ch.toc()))
+        logger.debug("nnz per line :%s", lu_umfpack.nnz / float(m2.shape[0]))
+        logger.debug("factorization :%s", ch.toc())
+        factor_nnz = lu_umfpack.nnz
+        profiler.count_factorization(factor_nnz)
         nb_cg_iter = 1
 
     elif use_amg:
@@ -386,11 +474,12 @@ def lp_admm2(
         # Mamg=pyamg.ruge_stuben_solver(I.tocsc())
 
         for l in range(len(m_amg.levels)):
-            print("checking level " + str(l))
+            logger.debug("checking level %d", l)
             assert np.isfinite(m_amg.levels[l].A.data).all()
         nb_cg_iter = 1
     else:
         nb_cg_iter = 100
+    profiler.stop("factorization")
     lambda_ineq = np.zeros(x.shape)
 
     def energy(x, xp, lambda_ineq):
@@ -403,59 +492,66 @@ def lp_admm2(
 
     niter = 0
     xv = np.hstack((x, np.zeros(beq.shape)))
+    status = "max_iter"
 
+    profiler.start("iterations")
     while niter <= nb_iter / nb_cg_iter:
+        if niter % nb_iter_plot == 0:
+            profiler.lap("iteration_batch")
         # solve the penalized problem with respect to x
         # print 'iter'+str(i)+' '+str(L(x, xp,lambda_ineq))
 
         y = np.hstack((-c + gamma_ineq * xp - lambda_ineq, beq))
         if use_lu:
             xv = lu_m.solve(y)
+            profiler.count_solve(factor_nnz)
         elif use_cholesky:
             xv = chol.solve_A(y)
+            profiler.count_solve(factor_nnz)
         elif use_cholesky2:
 
             lu_umfpack.solve(y, xv)
+            profiler.count_solve(factor_nnz)
 
         elif use_amg:
             xv = m_amg.solve(y, x0=xv, tol=1e-12)
+            profiler.count_solve(m.nnz)
             if np.linalg.norm(m * xv - y) > 1e-5:
-                raise
+                raise ValueError("the multigrid solver did not converge")
+            profiler.count_spmv(m)
 
         else:
             xv = conjgrad(m, y, maxiter=nb_cg_iter, x0=xv)
+            profiler.count_spmv(m, nb=nb_cg_iter)
         x = xv[: x.shape[0]]
         x = alpha * x + (1 - alpha) * xp
 
         # print 'iter'+str(i)+' '+str(L(x, xp,lambda_ineq))
         # solve the penalized problem with respect to xp
         # -gamma_ineq*(x-xp)-lambda_ineq=0
+        xp_prev = xp
         xp = x.copy() + lambda_ineq / gamma_ineq
         xp = np.maximum(xp, lb)
         xp = np.minimum(xp, ub)
         if niter % nb_iter_plot == 0:
-            elapsed = time.clock() - start
+            elapsed = time.perf_counter() - start
             if not (max_time is None) and elapsed > max_time:
+                status = "max_time"
                 break
             energy1 = energy(x, xp, lambda_ineq)
             energy2 = energy1
 
             max_violated_equality = 0
             max_violated_inequality = 0
-            print(
-                "iter"
-                + str(niter)
-                + ": energy1= "
-                + str(energy1)
-                + " energy2="
-                + str(energy2)
-                + " elapsed "
-                + str(elapsed)
-                + " second"
-                + " max violated inequality:"
-                + str(max_violated_inequality)
-                + " max violated equality:"
-                + str(max_violated_equality)
+            logger.info(
+                "iter%d: energy1= %s energy2=%s elapsed %s second"
+                " max violated inequality:%s max violated equality:%s",
+                niter,
+                energy1,
+                energy2,
+                elapsed,
+                max_violated_inequality,
+                max_violated_equality,
             )
             if callback_func is not None:
                 callback_func(
@@ -467,8 +563,20 @@ def lp_admm2(
                     max_violated_equality,
                     max_violated_inequality,
                 )
+            if check_convergence(
+                np.max(np.abs(x - xp)),
+                gamma_ineq * np.max(np.abs(xp - xp_prev)),
+                relative_gap(c.dot(x), energy1),
+                tol_primal,
+                tol_dual,
+                tol_gap,
+            ):
+                status = "converged"
+                break
 
         # print 'iter'+str(i)+' '+str(L(x, xp,lambda_ineq))
         lambda_ineq = lambda_ineq + gamma_ineq * (x - xp)
         niter += 1
-    return x[0:n]
+    profiler.stop("iteration_batch")
+    profiler.stop("iterations")
+    return x[0:n], status
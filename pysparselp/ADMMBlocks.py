@@ -24,6 +24,7 @@
 # -----------------------------------------------------------------------
 """LP solver using the alternating direction method of multipliers (ADMM) method with a decomposition of the constraint matrix into blocks."""
 
+import logging
 import time
 
 import numpy as np
@@ -34,11 +35,16 @@ from scipy import sparse
 from .tools import (
     CheckDecrease,
     Chrono,
+    PhaseProfiler,
+    check_convergence,
     convert_to_standard_form_with_bounds,
     precondition_constraints,
     precondition_lp_right,
+    relative_gap,
 )
 
+logger = logging.getLogger(__name__)
+
 # import  scikits.sparse.cholmod
 
 
@@ -59,15 +65,24 @@ def lp_admm_block_decomposition(
     use_preconditioning=True,
     use_lu=True,
     nb_iter_plot=10,
+    tol_primal=None,
+    tol_dual=None,
+    tol_gap=None,
+    profiler=None,
 ):
     # simple ADMM method with an approximate resolution of a quadratic subproblem using conjugate gradient
     # inspired by Boyd's paper on ADMM
     # Distributed Optimization and Statistical Learning via the Alternating Direction Method of Multipliers
     # the difference with admm_solver is that the linear quality constraints a_eq*beq are enforced during the resolution
     # of the subproblem instead of beeing enforced through multipliers
+    # stops early once the disagreement between the copies and xp (primal residual) and
+    # gamma_ineq*(xp-xp_prev) (dual residual) are below the tolerances that are not None
     n = c.size
-    start = time.clock()
+    start = time.perf_counter()
     elapsed = start
+    if profiler is None:
+        profiler = PhaseProfiler()
+    profiler.start("preprocessing")
     if x0 is None:
         x0 = np.zeros(c.size)
     # if a_eq!=None:
@@ -75,9 +90,11 @@ def lp_admm_block_decomposition(
     # if a_ineq!=None:# it seem important to do this preconditioning before converting to standard form
     # a_ineq,b_lower,b_upper=precondition_constraints(a_ineq,b_lower,b_upper,alpha=2)
 
+    profiler.start("conversion")
     c, a_eq, beq, lb, ub, x0 = convert_to_standard_form_with_bounds(
         c, a_eq, beq, a_ineq, b_lower, b_upper, lb, ub, x0
     )
+    profiler.stop("conversion")
     x = x0
 
     xp = x.copy()
@@ -98,7 +115,9 @@ def lp_admm_block_decomposition(
         )
     else:
         r = sparse.eye(a_eq.shape[1])
+    profiler.stop("preprocessing")
 
+    profiler.start("factorization")
     lu_m_s = []
     nb_used = np.zeros(x.shape)
     list_block_ids = []
@@ -106,6 +125,7 @@ def lp_admm_block_decomposition(
     # a_eq.blocks=[(0,a_eq.blocks[-1][1])]
 
     beqs = []
+    factors_nnz = []
     usesparse_lu = True
     xv = []
     # for id_block in range(nb_blocks):
@@ -157,23 +177,23 @@ def lp_admm_block_decomposition(
             )
         ).tocsr()
         lu = scikits.sparse.cholmod.cholesky(m.tocsc(), mode="simplicial")
-        print(
-            "the sparsity ratio between Chol(M) and the  matrix M  is +"
-            + str(lu.L().nnz / float(m.nnz))
+        logger.debug(
+            "the sparsity ratio between Chol(M) and the  matrix M  is +%s",
+            lu.L().nnz / float(m.nnz),
         )
 
-        print(
-            "connected components M" + str(scipy.sparse.csgraph.connected_components(m))
+        logger.debug(
+            "connected components M%s", scipy.sparse.csgraph.connected_components(m)
         )
 
         # scipy.sparse.csgraph.connected_components(subA.T*subA)
         factor_connections = sub_a * sub_a.T
-        print(
-            "connected components F"
-            + str(scipy.sparse.csgraph.connected_components(factor_connections))
+        logger.debug(
+            "connected components F%s",
+            scipy.sparse.csgraph.connected_components(factor_connections),
         )
         spanning_tree = scipy.sparse.csgraph.minimum_spanning_tree(factor_connections)
-        print(spanning_tree)
+        logger.debug("%s", spanning_tree)
 
     for id_block, merge_group in enumerate(merge_groups):
         # find the indices of the variables used by the block
@@ -204,11 +224,13 @@ def lp_admm_block_decomposition(
                 ),
             )
         ).tocsr()
+        profiler.start("block_factorization")
         if usesparse_lu:
 
             ch.tic()
             lu = scipy.sparse.linalg.splu(m.tocsc())
-            print(ch.toc())
+            logger.debug("factorization of block %d took %s", id_block, ch.toc())
+            factors_nnz.append(lu.L.nnz + lu.U.nnz)
         else:
             ch.tic()
             lu = scikits.sparse.cholmod.cholesky(m.tocsc(), mode="simplicial")
@@ -222,25 +244,27 @@ def lp_admm_block_decomposition(
 
             # LU=     scikits.sparse.cholmod.cholesky(M.tocsc(),mode='supernodal')# gives me matrix is not positive definite errors..
 
-            print(
-                "the sparsity ratio between Chol(M) and the  matrix M for block"
-                + str(id_block)
-                + " is +"
-                + str(lu.L().nnz / float(m.nnz))
-                + " took "
-                + str(factorization_duration)
-                + "seconds to factorize"
+            logger.debug(
+                "the sparsity ratio between Chol(M) and the  matrix M for block%d"
+                " is +%s took %sseconds to factorize",
+                id_block,
+                lu.L().nnz / float(m.nnz),
+                factorization_duration,
             )
+            factors_nnz.append(lu.L().nnz)
 
             # LU.__=LU.solve_A
             # M2=convert_to_py_sparse_format(M)
             # LU = umfpack.factorize(M2, strategy="UMFPACK_STRATEGY_SYMMETRIC")
             # print "nnz per line :"+str(LU.nnz/float(M2.shape[0]) )
 
+        profiler.stop("block_factorization")
+        profiler.count_factorization(factors_nnz[-1])
         xv.append(np.empty(m.shape[1], dtype=float))
         lu_m_s.append(lu)
         beqs.append(beq[id_rows])
         pass
+    profiler.stop("factorization")
 
     def energy(x, xp, lambda_ineq):
         en = c.dot(xp)
@@ -261,7 +285,11 @@ def lp_admm_block_decomposition(
     # relaxation parameter should be in [0,2] , 1.95 seems to be often a good choice
     alpha = 1.95
 
+    status = "max_iter"
+    profiler.start("iterations")
     while i <= nb_iter:
+        if i % nb_iter_plot == 0:
+            profiler.lap("iteration_batch")
         # solve the penalized problems with respect to each copy x
         # print 'iter'+str(i)+' '+str(L(x, xp,lambda_ineq))
         # check.set_value(L(x, xp,lambda_ineq))
@@ -278,6 +306,7 @@ def lp_admm_block_decomposition(
                 xv[id_block] = lu_m_s[id_block].solve_A(y)
 
                 # luMs[id_block].solve(y,xv[id_block])
+            profiler.count_solve(factors_nnz[id_block])
             x[id_block] = (
                 alpha * xv[id_block][: x[id_block].shape[0]]
                 + (1 - alpha) * xp[list_block_ids[id_block]]
@@ -287,7 +316,8 @@ def lp_admm_block_decomposition(
         # print 'iter'+str(i)+' '+str(L(x, xp,lambda_ineq))
         # solve the penalized problem with respect to xp
         # c-sum_idblock  gamma_ineq*(x_[id_block]-xp[list_block_ids[id_block]])-lambda_ineq[id_block]=0
-        xp[nb_used > 0] = 0
+        xp_prev = xp
+        xp = np.where(nb_used > 0, 0, xp)
         for id_block in range(nb_blocks):
             xp[list_block_ids[id_block]] += (
                 x[id_block] + lambda_ineq[id_block] / gamma_ineq
@@ -299,8 +329,11 @@ def lp_admm_block_decomposition(
         xp = np.minimum(xp, ub)
         # check.add(L(x, xp,lambda_ineq))
 
+        primal_residual = 0
         for id_block in range(nb_blocks):
             d = gamma_ineq * (x[id_block] - xp[list_block_ids[id_block]])
+            if d.size > 0:
+                primal_residual = max(primal_residual, np.max(np.abs(d)) / gamma_ineq)
             # angle=np.sum(dpred[id_block]*d)/(np.sqrt(np.sum(dpred[id_block]**2))*+np.sqrt(np.sum(d**2)))
             # print angle
             # dpred[id_block]=d.copy()
@@ -309,8 +342,9 @@ def lp_admm_block_decomposition(
 
         if i % nb_iter_plot == 0:
 
-            elapsed = time.clock() - start
-            if elapsed > max_time:
+            elapsed = time.perf_counter() - start
+            if max_time is not None and elapsed > max_time:
+                status = "max_time"
                 break
 
             energy1 = energy(x, xp, lambda_ineq)
@@ -318,20 +352,15 @@ def lp_admm_block_decomposition(
 
             max_violated_equality = 0
             max_violated_inequality = 0
-            print(
-                "iter"
-                + str(i)
-                + ": energy1= "
-                + str(energy1)
-                + " energy2="
-                + str(energy2)
-                + " elapsed "
-                + str(elapsed)
-                + " second"
-                + " max violated inequality:"
-                + str(max_violated_inequality)
-                + " max violated equality:"
-                + str(max_violated_equality)
+            logger.info(
+                "iter%d: energy1= %s energy2=%s elapsed %s second"
+                " max violated inequality:%s max violated equality:%s",
+                i,
+                energy1,
+                energy2,
+                elapsed,
+                max_violated_inequality,
+                max_violated_equality,
             )
             if callback_func is not None:
                 callback_func(
@@ -343,6 +372,18 @@ def lp_admm_block_decomposition(
                     max_violated_equality,
                     max_violated_inequality,
                 )
+            if check_convergence(
+                primal_residual,
+                gamma_ineq * np.max(np.abs(xp - xp_prev)),
+                relative_gap(c.dot(xp), energy1),
+                tol_primal,
+                tol_dual,
+                tol_gap,
+            ):
+                status = "converged"
+                break
         i += 1
+    profiler.stop("iteration_batch")
+    profiler.stop("iterations")
 
-    return (r * xp)[0:n]
+    return (r * xp)[0:n], status
@@ -23,6 +23,7 @@
 # OTHER DEALINGS IN THE SOFTWARE.
 # -----------------------------------------------------------------------
 """LP Solver based on a chambolle-pock algorithm."""
+import logging
 import time
 
 import numpy as np
@@ -30,7 +31,19 @@ import numpy as np
 import scipy.ndimage
 import scipy.sparse
 
-from .tools import convert_to_standard_form_with_bounds
+from .tools import (
+    ParallelSparseOperator,
+    PhaseProfiler,
+    box_support_point,
+    check_convergence,
+    convert_to_standard_form_with_bounds,
+    csr_matvec,
+    project_dual_box,
+    projected_gradient_residual,
+    relative_gap,
+)
+
+logger = logging.getLogger(__name__)
 
 
 def chambolle_pock_ppd(
@@ -51,6 +64,11 @@ def chambolle_pock_ppd(
     save_problem=False,
     force_integer=False,
     nb_iter_plot=10,
+    tol_primal=None,
+    tol_dual=None,
+    tol_gap=None,
+    profiler=None,
+    nb_threads=1,
 ):
     # method adapted from
     # Diagonal preconditioning for first order primal-dual algorithms in convex optimization
@@ -63,31 +81,44 @@ def chambolle_pock_ppd(
     # b_lower<= a_ineq*x<= b_upper               assert(scipy.sparse.issparse(a_ineq))
 
     # lb<=x<=ub
-
-    start = time.clock()
+    # the residuals are evaluated every nb_iter_plot iterations and the iterations stop
+    # once the maximum constraint violation is below tol_primal, the projected reduced
+    # costs are below tol_dual and the relative gap between the primal energy and the
+    # best lagrangian lower bound found so far is below tol_gap (tolerances set to None
+    # are ignored). Once x is feasible the gap certifies the distance to the optimum.
+    # returns the solution, the best integer solution found if force_integer is True,
+    # the best lower bound on the optimal value and the reason why the iterations
+    # stopped ("converged", "max_iter" or "max_time")
+    # the products with the constraints matrices and their transposes are done with
+    # nb_threads threads
+
+    start = time.perf_counter()
     elapsed = start
+    if profiler is None:
+        profiler = PhaseProfiler()
+    profiler.start("preprocessing")
 
     if a_eq.shape[0] == 0:
         a_eq = None
         beq = None
 
-    if (a_ineq is not None) and (b_lower is not None):
-
-        idskeep_upper = np.nonzero(b_upper != np.inf)[0]
-        idskeep_lower = np.nonzero(b_lower != -np.inf)[0]
-        if len(idskeep_lower) > 0 and len(idskeep_upper) > 0:
-            a_ineq = scipy.sparse.vstack(
-                (a_ineq[idskeep_upper, :], -a_ineq[idskeep_lower, :])
-            ).tocsr()
-        elif len(idskeep_lower) > 0:
-            a_ineq = -a_ineq
-        else:
-            a_ineq = a_ineq
-        b_ineq = np.hstack((b_upper[idskeep_upper], -b_lower[idskeep_lower]))
+    # the two-sided inequalities b_lower <= a_ineq*x <= b_upper are handled with a
+    # single dual variable per row, projected on the nonnegative values where only
+    # b_upper is finite, on the nonpositive values where only b_lower is finite and
+    # free where both are finite, without duplicating the rows. The one-sided
+    # a_ineq*x <= b_upper path is kept when b_upper is finite everywhere, infinite
+    # upper bounds would give nan energies with 0*inf in y_ineq.dot(b_ineq)
+    if a_ineq is None:
+        b_lower = None
     else:
-        b_ineq = b_upper
+        if b_lower is None:
+            b_lower = np.full(a_ineq.shape[0], -np.inf)
+        if b_upper is None:
+            b_upper = np.full(a_ineq.shape[0], np.inf)
+        if np.all(b_lower == -np.inf) and np.all(np.isfinite(b_upper)):
+            b_lower = None
+    b_ineq = b_upper
 
-    use_vec_sparsity = False
     if x0 is not None:
         x = x0.copy()
     else:
@@ -103,6 +134,7 @@ def chambolle_pock_ppd(
                 "a_eq": a_eq,
                 "beq": beq,
                 "a_ineq": a_ineq,
+                "b_lower": b_lower,
                 "b_ineq": b_ineq,
                 "lb": lb,
                 "ub": ub,
@@ -119,12 +151,13 @@ def chambolle_pock_ppd(
         )
         a_ineq = None
 
+    profiler.start("preconditioning")
     use_column_preconditioning = True
     if use_column_preconditioning:
         # constructing the preconditioning diagonal matrices
         tmp = 0
         if a_eq is not None:
-            print("a_eq shape=" + str(a_eq.shape))
+            logger.debug("a_eq shape=%s", a_eq.shape)
 
             assert scipy.sparse.issparse(a_eq)
             assert a_eq.shape[1] == c.size
@@ -135,7 +168,7 @@ def chambolle_pock_ppd(
             tmp = tmp + sum_a_eq
             # AeqT=a_eq.T
         if a_ineq is not None:
-            print("a_ineq shape=" + str(a_ineq.shape))
+            logger.debug("a_ineq shape=%s", a_ineq.shape)
             assert scipy.sparse.issparse(a_ineq)
             assert a_ineq.shape[1] == c.size
             assert a_ineq.shape[0] == b_ineq.size
@@ -148,7 +181,9 @@ def chambolle_pock_ppd(
             x = np.zeros_like(lb)
             x[c > 0] = lb[c > 0]
             x[c < 0] = ub[c < 0]
-            return x
+            profiler.stop("preconditioning")
+            profiler.stop("preprocessing")
+            return x, None, c.dot(x), "converged"
         tmp[tmp == 0] = 1
         diag_t = 1 / tmp[0, :]
         # T = scipy.sparse.diags(diag_t[None, :], [0]).tocsr()
@@ -180,139 +215,172 @@ def chambolle_pock_ppd(
 
     # some cleaning
     del tmp
-
-    # del diagSigma
-    # del diag_t
-
-    # iterations
-    # AeqT=AeqT.tocsc()
-    # AineqT=AineqT.tocsc()
-    x3 = x
+    profiler.stop("preconditioning")
+
+    # the iterations are done in place in preallocated buffers with the same
+    # operations as out of place, which gives bit for bit the same iterates
+    # without allocating full length temporaries at each iteration
+    x = x.astype(np.float64)
+    x2 = np.empty_like(x)
+    x3 = x.copy()
+    x3_prev = np.empty_like(x)
+    diff_x3 = np.empty_like(x)
+    d = np.empty_like(x)
+    tmp_x = np.empty_like(x)
+    if a_eq is not None:
+        a_eq_operator = ParallelSparseOperator(a_eq, nb_threads)
+        a_eq = a_eq_operator.a
+        r_eq = np.empty(a_eq.shape[0])
+        tmp_eq = np.empty(a_eq.shape[0])
+    if a_ineq is not None:
+        a_ineq_operator = ParallelSparseOperator(a_ineq, nb_threads)
+        a_ineq = a_ineq_operator.a
+        r_ineq = np.empty(a_ineq.shape[0])
+        tmp_ineq = np.empty(a_ineq.shape[0])
+    profiler.stop("preprocessing")
 
     best_integer_solution_energy = np.inf
     best_integer_solution = None
+    best_lower_bound = -np.inf
+    status = "max_iter"
     niter = 0
+    profiler.start("iterations")
     while niter < nb_max_iter:
+        if niter % nb_iter_plot == 0:
+            profiler.lap("iteration_batch")
 
         # Update he primal variables
-        d = c
+        # d=c+y_eq*a_eq+y_ineq*a_ineq
+        d[:] = c
         if a_eq is not None:
-            if use_vec_sparsity:
-                yeq_sparse = scipy.sparse.coo_matrix(y_eq).T
-                d = (
-                    d + (yeq_sparse * a_eq).toarray().ravel()
-                )  # faster when few constraint are activated
-            else:
-                d = d + y_eq * a_eq
-                # d+=y_eq*a_eq# strangely this does not work, give wrong results
+            np.add(d, a_eq_operator.rmatvec(y_eq, tmp_x), out=d)
+            profiler.count_spmv(a_eq, transposed=True)
 
         if a_ineq is not None:
-            if use_vec_sparsity:
-                y_ineq_sparse = scipy.sparse.coo_matrix(y_ineq).T
-                d = (
-                    d + (y_ineq_sparse * a_ineq).toarray().ravel()
-                )  # faster when few constraint are activated
-            else:
-                d = d + y_ineq * a_ineq
-                # d+=y_ineq*a_ineq
+            np.add(d, a_ineq_operator.rmatvec(y_ineq, tmp_x), out=d)
+            profiler.count_spmv(a_ineq, transposed=True)
 
         # x2=x-T*d
-        x2 = x - diag_t * d
+        np.subtract(x, np.multiply(diag_t, d, out=tmp_x), out=x2)
         np.maximum(x2, lb, x2)
         np.minimum(x2, ub, x2)
-        # x2=np.maximum(x2,lb)
-        # x2=np.minimum(x2,ub)
-        x3_prev = x3
-        x3 = (1 + theta) * x2 - theta * x
-        diff_x3 = x3_prev - x3
-        x = x2
-        if use_vec_sparsity:
-            x3_sparse = scipy.sparse.coo_matrix(x3).T
+        # x3=(1+theta)*x2-theta*x
+        x3_prev, x3 = x3, x3_prev
+        np.multiply(1 + theta, x2, out=x3)
+        np.subtract(x3, np.multiply(theta, x, out=tmp_x), out=x3)
+        np.subtract(x3_prev, x3, out=diff_x3)
+        x, x2 = x2, x
         if a_eq is not None:
-            if use_vec_sparsity:
-                r_eq = (a_eq * x3_sparse).toarray().ravel() - beq
-            else:
-                r_eq = (a_eq * x3) - beq
-        if a_ineq is not None:
-            if use_vec_sparsity:
-                r_ineq = (a_ineq * x3_sparse).toarray().ravel() - b_ineq
-            else:
-                r_ineq = (a_ineq * x3) - b_ineq
+            np.subtract(a_eq_operator.matvec(x3, r_eq), beq, out=r_eq)
+            profiler.count_spmv(a_eq)
+        if a_ineq is not None and b_lower is None:
+            np.subtract(a_ineq_operator.matvec(x3, r_ineq), b_ineq, out=r_ineq)
+            profiler.count_spmv(a_ineq)
+        elif a_ineq is not None:
+            a_ineq_operator.matvec(x3, r_ineq)
+            profiler.count_spmv(a_ineq)
 
         if niter % nb_iter_plot == 0:
             prev_elapsed = elapsed
-            elapsed = time.clock() - start
+            elapsed = time.perf_counter() - start
             mean_iter_period = (elapsed - prev_elapsed) / 10
             if (max_time is not None) and elapsed > max_time:
+                status = "max_time"
                 break
-            energy1 = c.dot(x)
-
-            # x4 is obtained my minimizing with respect to the primal variable while keeping the langrangian coef fix , which give a lower bound on the optimal solution
-            # energy2 is the lower bound
-            # energy1  is the value of the lagrangian at the current (hopefull saddle) point
-            # on problem is that the minimization with respect to the primal variables may actually lead to infintely negative lower bounds...
-            x4 = (
-                -d * 100000
-            )  # pb : the curve is very dependant on that value which make this lower bound a bit useless
-            x4 = np.maximum(x4, lb)
-            x4 = np.minimum(x4, ub)
 
-            x4 = lb.copy()
-            x4[d < 0] = ub[d < 0]
-
-            energy2 = c.dot(x4)
+            # energy2 is obtained by minimizing the lagrangian with respect to the primal
+            # variables while keeping the lagrangian coefficients fixed, which gives a
+            # lower bound on the optimal value as y_ineq >= 0 (weak duality).
+            # energy1 is the value of the lagrangian at the current (hopefully saddle)
+            # point. The minimization uses the reduced costs d computed for the current
+            # dual variables and gives -inf if d has the wrong sign for an unbounded
+            # variable.
+            energy2 = d[d > 0].dot(lb[d > 0]) + d[d < 0].dot(ub[d < 0])
+            if a_eq is not None:
+                energy2 -= y_eq.dot(beq)
+            if a_ineq is not None and b_lower is None:
+                energy2 -= y_ineq.dot(b_ineq)
+            elif a_ineq is not None:
+                energy2 -= y_ineq.dot(box_support_point(y_ineq, b_lower, b_upper))
+            best_lower_bound = max(best_lower_bound, energy2)
+            energy1 = c.dot(x)
+            energy_primal = energy1
             max_violated_equality = 0
             max_violated_inequality = 0
             if a_eq is not None:
-                energy1 += y_eq.T.dot(a_eq * x - beq)
-                energy2 += y_eq.T.dot(a_eq * x4 - beq)
-                max_violated_equality = np.max(np.abs(r_eq))
-            if a_ineq is not None:
-                energy1 += y_ineq.T.dot(a_ineq * x - b_ineq)
-                energy2 += y_ineq.T.dot(a_ineq * x4 - b_ineq)
-                max_violated_inequality = np.max(r_ineq)
+                r_eq_x = a_eq * x - beq
+                profiler.count_spmv(a_eq)
+                energy1 += y_eq.T.dot(r_eq_x)
+                max_violated_equality = np.max(np.abs(r_eq_x))
+            if a_ineq is not None and b_lower is None:
+                r_ineq_x = a_ineq * x - b_ineq
+                profiler.count_spmv(a_ineq)
+                energy1 += y_ineq.T.dot(r_ineq_x)
+                max_violated_inequality = np.max(r_ineq_x)
+            elif a_ineq is not None:
+                a_ineq_x = a_ineq * x
+                profiler.count_spmv(a_ineq)
+                energy1 += y_ineq.dot(
+                    a_ineq_x - box_support_point(y_ineq, b_lower, b_upper)
+                )
+                max_violated_inequality = max(
+                    np.max(a_ineq_x - b_upper), np.max(b_lower - a_ineq_x)
+                )
             if force_integer:
                 x_rounded = np.round(x)
+                energy_rounded = c.dot(x_rounded)
+                if a_eq is not None:
+                    max_violated_equality_rounded = np.max(
+                        np.abs(a_eq * x_rounded - beq)
+                    )
+                    profiler.count_spmv(a_eq)
+                else:
+                    max_violated_equality_rounded = 0
+                if a_ineq is not None:
+                    a_ineq_x_rounded = a_ineq * x_rounded
+                    max_violated_inequality_rounded = np.max(a_ineq_x_rounded - b_ineq)
+                    if b_lower is not None:
+                        max_violated_inequality_rounded = max(
+                            max_violated_inequality_rounded,
+                            np.max(b_lower - a_ineq_x_rounded),
+                        )
+                    profiler.count_spmv(a_ineq)
+                else:
+                    max_violated_inequality_rounded = 0
             else:
                 x_rounded = x
-            energy_rounded = c.dot(x_rounded)
-            if a_eq is not None:
-                max_violated_equality_rounded = np.max(np.abs(a_eq * x_rounded - beq))
-            else:
-                max_violated_equality_rounded = 0
-            max_violated_inequality = np.max(a_ineq * x_rounded - b_ineq)
-            if max_violated_equality_rounded == 0 and max_violated_inequality <= 0:
-                print(
-                    "##########   found feasible solution with energy"
-                    + str(energy_rounded)
+                energy_rounded = energy_primal
+                max_violated_equality_rounded = max_violated_equality
+                max_violated_inequality_rounded = max_violated_inequality
+            if (
+                max_violated_equality_rounded == 0
+                and max_violated_inequality_rounded <= 0
+            ):
+                logger.info(
+                    "##########   found feasible solution with energy%s", energy_rounded
                 )
                 if energy_rounded < best_integer_solution_energy:
                     best_integer_solution_energy = energy_rounded
-                    best_integer_solution = x_rounded
-
-            print(
-                "iter"
-                + str(niter)
-                + ": energy1= "
-                + str(energy1)
-                + " energy2="
-                + str(energy2)
-                + " elapsed "
-                + str(elapsed)
-                + " second"
-                + " max violated inequality:"
-                + str(max_violated_inequality)
-                + " max violated equality:"
-                + str(max_violated_equality)
-                + " x3 has "
-                + str(100 * np.mean(x3 == 0))
-                + " % of zeros "
-                + "diff x3 has "
-                + str(100 * np.mean(diff_x3 == 0))
-                + " % of zeros "
-                + "mean_iter_period="
-                + str(mean_iter_period)
-            )
+                    best_integer_solution = x_rounded.copy()
+
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "iter%d: energy1= %s energy2=%s best lower bound=%s"
+                    " elapsed %s second"
+                    " max violated inequality:%s max violated equality:%s"
+                    " x3 has %s %% of zeros diff x3 has %s %% of zeros"
+                    " mean_iter_period=%s",
+                    niter,
+                    energy1,
+                    energy2,
+                    best_lower_bound,
+                    elapsed,
+                    max_violated_inequality,
+                    max_violated_equality,
+                    100 * np.mean(x3 == 0),
+                    100 * np.mean(diff_x3 == 0),
+                    mean_iter_period,
+                )
             # 'y_eq has '+str(100 * np.mean(y_eq==0))+' % of zeros '+\
             #    'y_ineq has '+str(100 * np.mean(y_ineq==0))+' % of zeros '+\
 
@@ -320,27 +388,399 @@ def chambolle_pock_ppd(
 
                 callback_func(
                     niter,
-                    x,
+                    x.copy(),
                     energy1,
                     energy2,
                     elapsed,
                     max_violated_equality,
                     max_violated_inequality,
                 )
+            if check_convergence(
+                max(max_violated_equality, max_violated_inequality),
+                projected_gradient_residual(x, d, lb, ub),
+                relative_gap(energy_primal, best_lower_bound),
+                tol_primal,
+                tol_dual,
+                tol_gap,
+            ):
+                status = "converged"
+                break
 
         # Update the dual variables
 
         if a_eq is not None:
-            y_eq = y_eq + sigma_eq * r_eq
-            # y_eq=y_eq+diag_sigma_eq*r_eq
-            # y_eq+=diag_sigma_eq*r_eq
+            # y_eq=y_eq+sigma_eq*r_eq
+            np.add(y_eq, csr_matvec(sigma_eq, r_eq, tmp_eq), out=y_eq)
 
-        if a_ineq is not None:
-            y_ineq = y_ineq + sigma_ineq * r_ineq
-            # y_ineq+=diag_sigma_ineq*r_ineq
+        if a_ineq is not None and b_lower is None:
+            # y_ineq=np.maximum(y_ineq+sigma_ineq*r_ineq,0)
+            np.add(y_ineq, csr_matvec(sigma_ineq, r_ineq, tmp_ineq), out=y_ineq)
             np.maximum(y_ineq, 0, y_ineq)
-            # y_ineq=np.maximum(y_ineq, 0)
+        elif a_ineq is not None:
+            # y_ineq=project_dual_box(y_ineq,a_ineq*x3,diag_sigma_ineq,b_lower,b_upper)
+            np.subtract(r_ineq, b_upper, out=tmp_ineq)
+            np.multiply(diag_sigma_ineq, tmp_ineq, out=tmp_ineq)
+            np.add(y_ineq, tmp_ineq, out=tmp_ineq)
+            np.maximum(tmp_ineq, 0, out=tmp_ineq)
+            np.subtract(r_ineq, b_lower, out=r_ineq)
+            np.multiply(diag_sigma_ineq, r_ineq, out=r_ineq)
+            np.add(y_ineq, r_ineq, out=r_ineq)
+            np.minimum(r_ineq, 0, out=r_ineq)
+            np.add(tmp_ineq, r_ineq, out=y_ineq)
         niter += 1
+    profiler.stop("iteration_batch")
+    profiler.stop("iterations")
+    if a_eq is not None:
+        a_eq_operator.close()
+    if a_ineq is not None:
+        a_ineq_operator.close()
     if best_integer_solution is not None:
         best_integer_solution = best_integer_solution[:n]
-    return x[:n], best_integer_solution
+    return x[:n], best_integer_solution, best_lower_bound, status
+
+
+def _equilibrate(a, nb_ruiz_iter=10):
+    # scaling of the rows and columns of a with nb_ruiz_iter iterations of Ruiz
+    # equilibration of the infinity norms followed by the diagonal preconditioning
+    # with alpha=1 of Pock and Chambolle, returns the scaled matrix
+    # diag(row_scale)*a*diag(col_scale) and the two scaling vectors
+    a = scipy.sparse.csr_matrix(a, dtype=np.float64)
+    row_scale = np.ones(a.shape[0])
+    col_scale = np.ones(a.shape[1])
+
+    def rescale(row_norms, col_norms):
+        row_norms[row_norms == 0] = 1
+        col_norms[col_norms == 0] = 1
+        row_scale[:] /= row_norms
+        col_scale[:] /= col_norms
+        return scipy.sparse.diags(1 / row_norms) * a * scipy.sparse.diags(1 / col_norms)
+
+    for _ in range(nb_ruiz_iter):
+        abs_a = abs(a)
+        a = rescale(
+            np.sqrt(abs_a.max(axis=1).toarray().ravel()),
+            np.sqrt(abs_a.max(axis=0).toarray().ravel()),
+        )
+    abs_a = abs(a)
+    a = rescale(
+        np.sqrt(np.asarray(abs_a.sum(axis=1)).ravel()),
+        np.sqrt(np.asarray(abs_a.sum(axis=0)).ravel()),
+    )
+    return a.tocsr(), row_scale, col_scale
+
+
+def _trust_region_max(g, lower, upper, weights, radius):
+    # maximum of g.d over lower <= d <= upper and sum(weights * d**2) <= radius**2
+    # with lower <= 0 <= upper. The maximizer is d(t) = clip(t * g / weights, lower,
+    # upper) for the smallest t reaching the radius, the norm of d(t) being piecewise
+    # simple between the breakpoints of the clipping we sort them to get t exactly
+    nonzero = g != 0
+    g = g[nonzero]
+    lower = lower[nonzero]
+    upper = upper[nonzero]
+    weights = weights[nonzero]
+    bound = np.where(g > 0, upper, lower)
+    t_breaks = bound * weights / g
+    order = np.argsort(t_breaks)
+    t_breaks = t_breaks[order]
+    clipped_sq = np.hstack(([0], np.cumsum((weights * bound**2)[order])))
+    free_sq = np.hstack((np.cumsum((g**2 / weights)[order][::-1])[::-1], [0]))
+    norm_sq = clipped_sq[:-1] + t_breaks**2 * free_sq[:-1]
+    k = np.searchsorted(norm_sq, radius**2)
+    if k == len(t_breaks):
+        d = bound
+    else:
+        t = np.sqrt(max(radius**2 - clipped_sq[k], 0) / free_sq[k])
+        d = np.clip(t * g / weights, lower, upper)
+    return g.dot(d)
+
+
+def pdhg_restarted(
+    c,
+    a_eq,
+    beq,
+    a_ineq,
+    b_lower,
+    b_upper,
+    lb,
+    ub,
+    x0=None,
+    nb_max_iter=100,
+    callback_func=None,
+    max_time=None,
+    nb_iter_plot=10,
+    tol_primal=None,
+    tol_dual=None,
+    tol_gap=None,
+    profiler=None,
+    nb_threads=1,
+    restart_check_period=64,
+):
+    # restarted primal-dual hybrid gradient with adaptive steps, method adapted from
+    # Practical Large-Scale Linear Programming using Primal-Dual Hybrid Gradient
+    # by David Applegate et al. (PDLP)
+    # the equalities and the inequalities are stacked in a single matrix k that is
+    # rescaled by Ruiz equilibration and diagonal preconditioning, with the bounds
+    # row_lower <= k*x <= row_upper and one dual variable per row projected as in
+    # chambolle_pock_ppd (equal bounds for the equalities).
+    # The primal and dual steps are tau=eta/omega and sigma=eta*omega, eta is
+    # adapted at each iteration to stay below the local inverse norm of k estimated
+    # from the last step (steps that are too large are rejected, which counts as an
+    # iteration) and the primal weight omega balances the distances traveled by the
+    # primal and dual variables between restarts.
+    # Every restart_check_period iterations the normalized duality gap (the maximum
+    # of the gap over a ball around the point divided by its radius, the distance
+    # to the last restart point) of the current point and of the average of the
+    # iterates since the last restart are computed, and the iterations restart from
+    # the best of them when its gap decreased enough since the last restart.
+    # the residuals are evaluated every nb_iter_plot iterations on the current
+    # point as in chambolle_pock_ppd, returns the solution, the best lagrangian lower
+    # bound found and the reason why the iterations stopped
+
+    start = time.perf_counter()
+    if profiler is None:
+        profiler = PhaseProfiler()
+    profiler.start("preprocessing")
+
+    if a_eq is not None and a_eq.shape[0] == 0:
+        a_eq = None
+        beq = None
+
+    profiler.start("conversion")
+    blocks = []
+    row_lowers = []
+    row_uppers = []
+    if a_eq is not None:
+        blocks.append(a_eq)
+        row_lowers.append(beq)
+        row_uppers.append(beq)
+    nb_eq = 0 if a_eq is None else a_eq.shape[0]
+    if a_ineq is not None:
+        if b_lower is None:
+            b_lower = np.full(a_ineq.shape[0], -np.inf)
+        if b_upper is None:
+            b_upper = np.full(a_ineq.shape[0], np.inf)
+        # the rows without finite bounds do not constrain x
+        constrained = np.isfinite(b_lower) | np.isfinite(b_upper)
+        if not np.all(constrained):
+            a_ineq = a_ineq[constrained]
+            b_lower = b_lower[constrained]
+            b_upper = b_upper[constrained]
+        if a_ineq.shape[0] > 0:
+            blocks.append(a_ineq)
+            row_lowers.append(b_lower)
+            row_uppers.append(b_upper)
+    if len(blocks) == 0:
+        profiler.stop("conversion")
+        profiler.stop("preprocessing")
+        x = np.zeros_like(lb)
+        x[c > 0] = lb[c > 0]
+        x[c < 0] = ub[c < 0]
+        return x, c.dot(x), "converged"
+    k = scipy.sparse.vstack(blocks, format="csr")
+    row_lower = np.hstack(row_lowers)
+    row_upper = np.hstack(row_uppers)
+    # bounds on the dual variables, nonnegative where only row_upper is finite and
+    # nonpositive where only row_lower is finite
+    y_lower = np.where(np.isfinite(row_lower), -np.inf, 0)
+    y_upper = np.where(np.isfinite(row_upper), np.inf, 0)
+    profiler.stop("conversion")
+
+    profiler.start("preconditioning")
+    k, row_scale, col_scale = _equilibrate(k)
+    c_unscaled = c
+    c = col_scale * c_unscaled
+    row_lower = row_scale * row_lower
+    row_upper = row_scale * row_upper
+    lb_scaled = lb / col_scale
+    ub_scaled = ub / col_scale
+    profiler.stop("preconditioning")
+
+    if x0 is not None:
+        x = np.clip(x0 / col_scale, lb_scaled, ub_scaled)
+    else:
+        x = np.clip(np.zeros(c.size), lb_scaled, ub_scaled)
+    y = np.zeros(k.shape[0])
+    k_operator = ParallelSparseOperator(k, nb_threads)
+    kx = k_operator.matvec(x)
+    kty = k_operator.rmatvec(y)
+    profiler.count_spmv(k)
+    profiler.count_spmv(k, transposed=True)
+
+    norm_c = np.linalg.norm(c)
+    norm_q = np.linalg.norm(np.where(np.isfinite(row_upper), row_upper, row_lower))
+    omega = norm_c / norm_q if norm_c > 0 and norm_q > 0 else 1.0
+    eta = 1 / np.max(np.abs(k.data))
+    profiler.stop("preprocessing")
+
+    def normalized_gap(x, y, kx, kty, x_ref, y_ref):
+        # normalized duality gap of the lagrangian c.x+y.k*x-h(y), with h the support
+        # function of the box of the rows, at (x, y) over the ball centered at (x, y)
+        # whose radius is the distance to (x_ref, y_ref). The lagrangian being
+        # concave in y it is bounded by its linearization at y, which uses the
+        # supergradient closest to zero for the two-sided rows where y is zero
+        weights = np.hstack((np.full(x.size, omega), np.full(y.size, 1 / omega)))
+        delta = np.hstack((x - x_ref, y - y_ref))
+        radius = np.sqrt(weights.dot(delta**2))
+        if radius == 0:
+            return 0
+        g_y = kx - np.clip(kx, row_lower, row_upper)
+        g_y = np.where((y > 0) | (y_lower == 0), kx - row_upper, g_y)
+        g_y = np.where((y < 0) | (y_upper == 0), kx - row_lower, g_y)
+        gap = _trust_region_max(
+            np.hstack((-(c + kty), g_y)),
+            np.hstack((lb_scaled - x, y_lower - y)),
+            np.hstack((ub_scaled - x, y_upper - y)),
+            weights,
+            radius,
+        )
+        return gap / radius
+
+    x_restart, y_restart = x.copy(), y.copy()
+    gap_restart = np.inf
+    gap_previous = np.inf
+    sum_weights = 0
+    x_sum = np.zeros_like(x)
+    y_sum = np.zeros_like(y)
+    kx_sum = np.zeros_like(kx)
+    kty_sum = np.zeros_like(kty)
+    nb_restarts = 0
+    niter_restart = 0
+
+    best_lower_bound = -np.inf
+    status = "max_iter"
+    niter = 0
+    profiler.start("iterations")
+    while niter < nb_max_iter:
+        if niter % nb_iter_plot == 0:
+            profiler.lap("iteration_batch")
+            elapsed = time.perf_counter() - start
+            if (max_time is not None) and elapsed > max_time:
+                status = "max_time"
+                break
+            # the residuals of the unscaled problem are obtained by unscaling those
+            # of the scaled one, with the reduced costs d=c+y*a
+            d = (c + kty) / col_scale
+            violation = np.maximum(kx - row_upper, row_lower - kx) / row_scale
+            support = box_support_point(y, row_lower, row_upper)
+            energy2 = d[d > 0].dot(lb[d > 0]) + d[d < 0].dot(ub[d < 0]) - y.dot(support)
+            best_lower_bound = max(best_lower_bound, energy2)
+            x_unscaled = col_scale * x
+            energy_primal = c_unscaled.dot(x_unscaled)
+            energy1 = energy_primal + y.dot(kx - support)
+            max_violated_equality = np.max(violation[:nb_eq], initial=0)
+            max_violated_inequality = np.max(violation[nb_eq:], initial=0)
+            logger.info(
+                "iter%d: energy1= %s energy2=%s best lower bound=%s elapsed %s second"
+                " max violated inequality:%s max violated equality:%s"
+                " step=%s primal weight=%s restarts=%d",
+                niter,
+                energy1,
+                energy2,
+                best_lower_bound,
+                elapsed,
+                max_violated_inequality,
+                max_violated_equality,
+                eta,
+                omega,
+                nb_restarts,
+            )
+            if callback_func is not None:
+                callback_func(
+                    niter,
+                    x_unscaled,
+                    energy1,
+                    energy2,
+                    elapsed,
+                    max_violated_equality,
+                    max_violated_inequality,
+                )
+            if check_convergence(
+                max(max_violated_equality, max_violated_inequality),
+                projected_gradient_residual(x_unscaled, d, lb, ub),
+                relative_gap(energy_primal, best_lower_bound),
+                tol_primal,
+                tol_dual,
+                tol_gap,
+            ):
+                status = "converged"
+                break
+
+        if (
+            niter_restart > 0
+            and niter_restart % restart_check_period == 0
+            and sum_weights > 0
+        ):
+            gap_current = normalized_gap(x, y, kx, kty, x_restart, y_restart)
+            x_avg = x_sum / sum_weights
+            y_avg = y_sum / sum_weights
+            kx_avg = kx_sum / sum_weights
+            kty_avg = kty_sum / sum_weights
+            gap_avg = normalized_gap(
+                x_avg, y_avg, kx_avg, kty_avg, x_restart, y_restart
+            )
+            if gap_avg < gap_current:
+                candidate = (x_avg, y_avg, kx_avg, kty_avg)
+                gap_candidate = gap_avg
+            else:
+                candidate = (x, y, kx, kty)
+                gap_candidate = gap_current
+            if (
+                gap_candidate <= 0.2 * gap_restart
+                or (gap_candidate <= 0.8 * gap_restart and gap_candidate > gap_previous)
+                or niter_restart >= 0.36 * niter
+            ):
+                x, y, kx, kty = (v.copy() for v in candidate)
+                delta_x = np.linalg.norm(x - x_restart)
+                delta_y = np.linalg.norm(y - y_restart)
+                if delta_x > 1e-10 and delta_y > 1e-10:
+                    omega = np.exp(
+                        0.5 * np.log(delta_y / delta_x) + 0.5 * np.log(omega)
+                    )
+                x_restart, y_restart = x.copy(), y.copy()
+                gap_restart = gap_candidate
+                gap_candidate = np.inf
+                sum_weights = 0
+                x_sum.fill(0)
+                y_sum.fill(0)
+                kx_sum.fill(0)
+                kty_sum.fill(0)
+                niter_restart = 0
+                nb_restarts += 1
+            gap_previous = gap_candidate
+
+        # primal and dual steps using the extrapolated primal point
+        tau = eta / omega
+        sigma = eta * omega
+        x_new = np.clip(x - tau * (c + kty), lb_scaled, ub_scaled)
+        kx_new = k_operator.matvec(x_new)
+        y_new = project_dual_box(y, 2 * kx_new - kx, sigma, row_lower, row_upper)
+        kty_new = k_operator.rmatvec(y_new)
+        profiler.count_spmv(k)
+        profiler.count_spmv(k, transposed=True)
+
+        dx = x_new - x
+        dy = y_new - y
+        interaction = abs(dx.dot(kty_new - kty))
+        movement = 0.5 * omega * dx.dot(dx) + 0.5 / omega * dy.dot(dy)
+        step_limit = movement / interaction if interaction > 0 else np.inf
+        accepted = eta <= step_limit
+        eta_used = eta
+        niter += 1
+        niter_restart += 1
+        eta = min(
+            (1 - (niter + 1) ** -0.3) * step_limit, (1 + (niter + 1) ** -0.6) * eta
+        )
+        if not accepted:
+            continue
+        x, y, kx, kty = x_new, y_new, kx_new, kty_new
+        # the average since the last restart is weighted by the steps
+        sum_weights += eta_used
+        x_sum += eta_used * x
+        y_sum += eta_used * y
+        kx_sum += eta_used * kx
+        kty_sum += eta_used * kty
+    profiler.stop("iteration_batch")
+    profiler.stop("iterations")
+    k_operator.close()
+    return col_scale * x, best_lower_bound, status
@@ -25,6 +25,7 @@
 """LP solver using alternated  coordinate ascend on the dual."""
 
 import copy
+import logging
 import time
 
 import numpy as np
@@ -34,6 +35,9 @@ import scipy.sparse
 
 from .DualGradientAscent import exact_dual_line_search
 from .constraintPropagation import greedy_round
+from .tools import PhaseProfiler
+
+logger = logging.getLogger(__name__)
 
 
 def dual_coordinate_ascent(
@@ -45,6 +49,7 @@ def dual_coordinate_ascent(
     y_ineq=None,
     max_time=None,
     nb_iter_plot=1,
+    profiler=None,
 ):
     """Solve LP using coordinate ascend in the dual.
 
@@ -55,13 +60,18 @@ def dual_coordinate_ascent(
     did not generalize and code the approximation method
     """
     np.random.seed(1)
-    start = time.clock()
+    start = time.perf_counter()
+    if profiler is None:
+        profiler = PhaseProfiler()
+    profiler.start("preprocessing")
     # convert to slack form (augmented form)
     lp2 = copy.deepcopy(lp)
     lp = None
     # LP2.convert_to_slack_form()
     # LP2.convertTo
+    profiler.start("conversion")
     lp2.convert_to_one_sided_inequality_system()
+    profiler.stop("conversion")
 
     # LP2.upper_bounds=np.minimum(10,LP2.upper_bounds)
     # LP2.lower_bounds=np.maximum(-10,LP2.lower_bounds)
@@ -79,13 +89,16 @@ def dual_coordinate_ascent(
         y_ineq = y_ineq.copy()
         assert np.min(y_ineq) >= 0
     # assert (LP2.b_lower is None)
+    profiler.stop("preprocessing")
 
     def get_optim_x(y_eq, y_ineq, tiemethod="round", x0=None, upate_x_cbar_zero=True):
         c_bar = lp2.costsvector.copy()
         if lp2.a_equalities is not None:
             c_bar += y_eq * lp2.a_equalities
+            profiler.count_spmv(lp2.a_equalities, transposed=True)
         if lp2.a_inequalities is not None:
             c_bar += y_ineq * lp2.a_inequalities
+            profiler.count_spmv(lp2.a_inequalities, transposed=True)
         if x0 is None:
             x = np.zeros(lp2.costsvector.size)
         else:
@@ -104,8 +117,7 @@ def dual_coordinate_ascent(
             elif tiemethod == "center":
                 x[c_bar == 0] = 0.5 * (lp2.lower_bounds + lp2.upper_bounds)[c_bar == 0]
             else:
-                print("unkown tie method %s" % tiemethod)
-                raise
+                raise ValueError("unkown tie method %s" % tiemethod)
             x[(c_bar == 0) & np.isinf(lp2.lower_bounds)] = lp2.upper_bounds[
                 (c_bar == 0) & np.isinf(lp2.lower_bounds)
             ]
@@ -171,23 +183,30 @@ def dual_coordinate_ascent(
     #
     energy = evaluate(y_eq, y_ineq)
 
-    print("iter %d energy %f" % (0, energy))
+    logger.info("iter %d energy %f", 0, energy)
     c_bar, x = get_optim_x(y_eq, y_ineq)
     direction = np.zeros(y_ineq.shape)
 
     timeout = False
+    status = "max_iter"
     niter = 0
+    profiler.start("iterations")
     while niter < nb_max_iter:
+        if niter % nb_iter_plot == 0:
+            profiler.lap("iteration_batch")
         if timeout:
             break
         y_ineq_prev = y_ineq.copy()
         c_bar = lp2.costsvector + y_eq * lp2.a_equalities + y_ineq * lp2.a_inequalities
+        profiler.count_spmv(lp2.a_equalities, transposed=True)
+        profiler.count_spmv(lp2.a_inequalities, transposed=True)
 
         grad_y_eq = lp2.a_equalities * x - lp2.b_equalities
+        profiler.count_spmv(lp2.a_equalities)
         list_i = np.nonzero(grad_y_eq)[0]
         for i in list_i:
             if i % 100 == 0:
-                elapsed = time.clock() - start
+                elapsed = time.perf_counter() - start
                 if (max_time is not None) and elapsed > max_time:
                     timeout = True
                     break
@@ -216,25 +235,30 @@ def dual_coordinate_ascent(
             y_eq[i] += alpha_optim
             diff_y_eq = y_eq[i] - prev_y_eq
             c_bar[a_eq_col_i.indices] += diff_y_eq * a_eq_col_i.data
+            profiler.count("coordinate_updates")
+            profiler.count("coordinate_nnz", a_eq_col_i.nnz)
 
         if timeout:
             break
 
         c_bar = lp2.costsvector + y_eq * lp2.a_equalities + y_ineq * lp2.a_inequalities
+        profiler.count_spmv(lp2.a_equalities, transposed=True)
+        profiler.count_spmv(lp2.a_inequalities, transposed=True)
         new_energy = evaluate(y_eq, y_ineq)
         eps = 1e-10
         if new_energy + eps < energy:
-            print("not expected")
+            logger.warning("the dual energy decreased")
 
         energy = new_energy
 
         c_bar, x = get_optim_x(y_eq, y_ineq, x0=None, upate_x_cbar_zero=True)
         grad_y_ineq = lp2.a_inequalities * x - lp2.b_upper
+        profiler.count_spmv(lp2.a_inequalities)
         grad_y_ineq[y_ineq <= 0] = np.maximum(grad_y_ineq[y_ineq <= 0], 0)  #
 
         for i in np.nonzero(grad_y_ineq)[0]:
             if i % 100 == 0:
-                elapsed = time.clock() - start
+                elapsed = time.perf_counter() - start
                 if (max_time is not None) and elapsed > max_time:
                     timeout = True
                     break
@@ -268,6 +292,8 @@ def dual_coordinate_ascent(
             y_ineq[i] = max(y_ineq[i], 0)
             diff_y_ineq = y_ineq[i] - prev_y_ineq
             c_bar[a_ineq_col_i.indices] += diff_y_ineq * a_ineq_col_i.data
+            profiler.count("coordinate_updates")
+            profiler.count("coordinate_nnz", a_ineq_col_i.nnz)
             # new_energy=evaluate(y_eq,y_ineq)
             # assert(new_energy>=prev_energy-1e-5)
             # assert(np.max(y_ineq)<=0)
@@ -276,7 +302,7 @@ def dual_coordinate_ascent(
             break
         new_energy = evaluate(y_eq, y_ineq)
         if new_energy + eps < energy:
-            print("not expected")
+            logger.warning("the dual energy decreased")
 
         c_bar, x = get_optim_x(
             y_eq, y_ineq, tiemethod="center", x0=None, upate_x_cbar_zero=True
@@ -295,7 +321,7 @@ def dual_coordinate_ascent(
 
         energy_upper_bound = lp2.costsvector.dot(x)
 
-        elapsed = time.clock() - start
+        elapsed = time.perf_counter() - start
         if (niter % nb_iter_plot) == 0:
             max_violation = max(
                 np.max(lp2.a_inequalities * x - lp2.b_upper),
@@ -304,29 +330,32 @@ def dual_coordinate_ascent(
             sum_violation = np.sum(
                 np.maximum(lp2.a_inequalities * x - lp2.b_upper, 0)
             ) + np.sum(np.abs(lp2.a_equalities * x - lp2.b_equalities))
-            print(
-                "iter %d time %3.1f dual energy %f, primal %f max violation %f sum_violation %f"
-                % (
-                    niter,
-                    elapsed,
-                    new_energy,
-                    energy_upper_bound,
-                    max_violation,
-                    sum_violation,
-                )
+            profiler.count_spmv(lp2.a_inequalities, nb=2)
+            profiler.count_spmv(lp2.a_equalities, nb=2)
+            logger.info(
+                "iter %d time %3.1f dual energy %f, primal %f max violation %f"
+                " sum_violation %f",
+                niter,
+                elapsed,
+                new_energy,
+                energy_upper_bound,
+                max_violation,
+                sum_violation,
             )
             if max_violation == 0:
 
-                print(
-                    "found feasible primal solution with energy %f" % energy_upper_bound
+                logger.info(
+                    "found feasible primal solution with energy %f", energy_upper_bound
                 )
                 if energy_upper_bound == new_energy:
-                    print("found optimal solution , stop")
+                    logger.info("found optimal solution , stop")
+                    status = "converged"
                     break
                 if energy_upper_bound < new_energy:
-                    print("not expected")
+                    logger.warning("the primal energy is below the dual energy")
                 if new_energy < energy + 1e-10:
-                    print("will not find better solution , stop")
+                    logger.info("will not find better solution , stop")
+                    status = "converged"
                     break
 
         energy = new_energy
@@ -347,12 +376,14 @@ def dual_coordinate_ascent(
             y_ineq = np.maximum(y_ineq, 0)
             # y_ineq=y_ineq+*0.1
             # y_ineq=np.maximum(y_ineq, 0)
-            print("iter %d energy %f" % (niter, evaluate(y_eq, y_ineq)))
+            logger.info("iter %d energy %f", niter, evaluate(y_eq, y_ineq))
 
         if (max_time is not None) and elapsed > max_time:
             timeout = True
             break
         niter += 1
+    profiler.stop("iteration_batch")
+    profiler.stop("iterations")
     max_violation = max(
         np.max(lp2.a_inequalities * x - lp2.b_upper),
         np.max(np.sum(np.abs(lp2.a_equalities * x - lp2.b_equalities))),
@@ -360,8 +391,16 @@ def dual_coordinate_ascent(
     sum_violation = np.sum(
         np.maximum(lp2.a_inequalities * x - lp2.b_upper, 0)
     ) + np.sum(np.abs(lp2.a_equalities * x - lp2.b_equalities))
-    print(
-        "iter %d time %3.1f dual energy %f, primal %f max violation %f sum_violation %f"
-        % (niter, elapsed, new_energy, energy_upper_bound, max_violation, sum_violation)
+    logger.info(
+        "iter %d time %3.1f dual energy %f, primal %f max violation %f"
+        " sum_violation %f",
+        niter,
+        elapsed,
+        new_energy,
+        energy_upper_bound,
+        max_violation,
+        sum_violation,
     )
-    return x, y_eq, y_ineq
+    if timeout:
+        status = "max_time"
+    return x, y_eq, y_ineq, status
@@ -25,6 +25,7 @@
 """LP solver using gradient ascend in the dual. ot efficient but use as baseline"""
 
 import copy
+import logging
 import time
 
 import numpy as np
@@ -32,6 +33,15 @@ import numpy as np
 import scipy.ndimage
 import scipy.sparse
 
+from .tools import (
+    ParallelSparseOperator,
+    PhaseProfiler,
+    check_convergence,
+    relative_gap,
+)
+
+logger = logging.getLogger(__name__)
+
 
 def exact_dual_line_search(direction, a, b, c_bar, upper_bounds, lower_bounds):
 
@@ -74,10 +84,24 @@ def dual_gradient_ascent(
     y_ineq=None,
     max_time=None,
     nb_iter_plot=1,
+    tol_primal=None,
+    tol_dual=None,
+    tol_gap=None,
+    profiler=None,
+    nb_threads=1,
 ):
-    """Gradient ascent in the dual."""
+    """Gradient ascent in the dual.
+
+    The dual iterates are kept feasible and x minimizes the lagrangian, so that the
+    dual residual is zero and only tol_primal and tol_gap are checked every
+    nb_iter_plot iterations. The products with the constraints matrices and their
+    transposes are done with nb_threads threads.
+    """
     np.random.seed(0)
-    start = time.clock()
+    start = time.perf_counter()
+    if profiler is None:
+        profiler = PhaseProfiler()
+    profiler.start("preprocessing")
     # convert to slack form (augmented form)
     lp2 = copy.deepcopy(lp)
     lp = None
@@ -102,13 +126,20 @@ def dual_gradient_ascent(
     else:
         y_ineq = y_ineq.copy()
     # assert (LP2.b_lower is None)
+    if lp2.a_equalities is not None:
+        a_eq_operator = ParallelSparseOperator(lp2.a_equalities, nb_threads)
+    if lp2.a_inequalities is not None:
+        a_ineq_operator = ParallelSparseOperator(lp2.a_inequalities, nb_threads)
+    profiler.stop("preprocessing")
 
     def get_optim_x(y_eq, y_ineq):
         c_bar = lp2.costsvector.copy()
         if lp2.a_equalities is not None:
-            c_bar += y_eq * lp2.a_equalities
+            c_bar += a_eq_operator.rmatvec(y_eq)
+            profiler.count_spmv(lp2.a_equalities, transposed=True)
         if lp2.a_inequalities is not None:
-            c_bar += y_ineq * lp2.a_inequalities
+            c_bar += a_ineq_operator.rmatvec(y_ineq)
+            profiler.count_spmv(lp2.a_inequalities, transposed=True)
         x = np.zeros(lp2.costsvector.size)
         x[c_bar > 0] = lp2.lower_bounds[c_bar > 0]
         x[c_bar < 0] = lp2.upper_bounds[c_bar < 0]
@@ -137,29 +168,42 @@ def dual_gradient_ascent(
     # alpha_i= vector containing the step lengths that lead to a sign change on any of the gradient component
     # when incrementing y[i]
     #
-    print("iter %d energy %f" % (0, evaluate(y_eq, y_ineq)))
-
     prev_energy = evaluate(y_eq, y_ineq)
+    logger.info("iter %d energy %f", 0, prev_energy)
     if prev_energy == -np.inf:
-        print("initial dual point not feasible, you could bound all variables")
+        logger.warning(
+            "initial dual point not feasible, you could bound all variables"
+        )
         c_bar, x = get_optim_x(y_eq, y_ineq)
-        return x, y_eq, y_ineq
+        if lp2.a_equalities is not None:
+            a_eq_operator.close()
+        if lp2.a_inequalities is not None:
+            a_ineq_operator.close()
+        return x, y_eq, y_ineq, "failed"
+    status = "max_iter"
     niter = 0
+    profiler.start("iterations")
     while niter < nb_max_iter:
+        if niter % nb_iter_plot == 0:
+            profiler.lap("iteration_batch")
         c_bar, x = get_optim_x(y_eq, y_ineq)
+        primal_residual = 0
         if lp2.a_inequalities is not None:
             y_ineq_prev = y_ineq.copy()
-            max_violation = np.max(lp2.a_inequalities * x - lp2.b_upper)
-            sum_violation = np.sum(np.maximum(lp2.a_inequalities * x - lp2.b_upper, 0))
-            np.sum(np.maximum(lp2.a_inequalities * x - lp2.b_upper, 0))
+            grad_y_ineq = a_ineq_operator.matvec(x) - lp2.b_upper
+            profiler.count_spmv(lp2.a_inequalities)
+            max_violation = np.max(grad_y_ineq)
+            primal_residual = max(primal_residual, max_violation)
+            sum_violation = np.sum(np.maximum(grad_y_ineq, 0))
             if (niter % nb_iter_plot) == 0:
-                print(
-                    "iter %d energy %f max violation %f sum_violation %f"
-                    % (niter, prev_energy, max_violation, sum_violation)
+                logger.info(
+                    "iter %d energy %f max violation %f sum_violation %f",
+                    niter,
+                    prev_energy,
+                    max_violation,
+                    sum_violation,
                 )
 
-            grad_y_ineq = lp2.a_inequalities * x - lp2.b_upper
-
             grad_y_ineq[y_ineq_prev <= 0] = np.maximum(
                 grad_y_ineq[y_ineq_prev <= 0], 0
             )  # not sure it is correct to do that here
@@ -174,6 +218,7 @@ def dual_gradient_ascent(
                     lp2.upper_bounds,
                     lp2.lower_bounds,
                 )
+                profiler.count_spmv(lp2.a_inequalities, transposed=True)
                 # y_ineq_prev+coef_length*grad_y>0
                 assert coef_length_ineq >= 0
                 maxstep_ineq = np.min(
@@ -198,15 +243,20 @@ def dual_gradient_ascent(
         if lp2.a_equalities is not None and lp2.a_equalities.shape[0] > 0:
 
             y_eq_prev = y_eq.copy()
-            max_violation = np.max(np.abs(lp2.a_equalities * x - lp2.b_equalities))
-            sum_violation = np.sum(np.abs(lp2.a_equalities * x - lp2.b_equalities))
+            grad_y_eq = a_eq_operator.matvec(x) - lp2.b_equalities
+            profiler.count_spmv(lp2.a_equalities)
+            max_violation = np.max(np.abs(grad_y_eq))
+            primal_residual = max(primal_residual, max_violation)
+            sum_violation = np.sum(np.abs(grad_y_eq))
             if (niter % nb_iter_plot) == 0:
-                print(
-                    "iter %d energy %f max violation %f sum_violation %f"
-                    % (niter, prev_energy, max_violation, sum_violation)
+                logger.info(
+                    "iter %d energy %f max violation %f sum_violation %f",
+                    niter,
+                    prev_energy,
+                    max_violation,
+                    sum_violation,
                 )
 
-            grad_y_eq = lp2.a_equalities * x - lp2.b_equalities
             if np.any(grad_y_eq):
                 grad_y_eq_sparse = scipy.sparse.csr.csr_matrix(grad_y_eq)
                 coef_length_eq = exact_dual_line_search(
@@ -217,6 +267,7 @@ def dual_gradient_ascent(
                     lp2.upper_bounds,
                     lp2.lower_bounds,
                 )
+                profiler.count_spmv(lp2.a_equalities, transposed=True)
                 # y_ineq_prev+coef_length*grad_y>0
                 assert coef_length_eq >= 0
 
@@ -233,13 +284,29 @@ def dual_gradient_ascent(
         # break
         new_energy = evaluate(y_eq, y_ineq)
         prev_energy = new_energy
-        elapsed = time.clock() - start
+        elapsed = time.perf_counter() - start
         if callback_func is not None and niter % 100 == 0:
             callback_func(niter, x, 0, 0, elapsed, 0, 0)
 
         if (max_time is not None) and elapsed > max_time:
+            status = "max_time"
+            break
+        if (niter % nb_iter_plot) == 0 and check_convergence(
+            primal_residual,
+            0,
+            relative_gap(lp2.costsvector.dot(x), new_energy),
+            tol_primal,
+            tol_dual,
+            tol_gap,
+        ):
+            status = "converged"
             break
         niter += 1
+    profiler.stop("iteration_batch")
+    profiler.stop("iterations")
+    if lp2.a_equalities is not None:
+        a_eq_operator.close()
+    if lp2.a_inequalities is not None:
+        a_ineq_operator.close()
 
-    print("done")
-    return x, y_eq, y_ineq
+    return x, y_eq, y_ineq, status
@@ -1,196 +1,616 @@
 """Function to load MPS files."""
 
+import concurrent.futures
 import gzip
+import itertools
+import mmap
+import os
+import re
 
 import numpy as np
 
 from scipy import sparse
 
 
-def mps_parser(f, fsol=None):
+def split_fixed_format(line):
+    """Split a line of a fixed MPS file into its fields, allowing spaces in names."""
+    fields = [
+        line[1:3].strip(),
+        line[4:12].strip(),
+        line[14:22].strip(),
+        line[24:36].strip(),
+        line[39:47].strip(),
+        line[49:61].strip(),
+    ]
+    while fields and fields[-1] == b"":
+        fields.pop()
+    if fields and fields[0] == b"":
+        # the first field is only used in the ROWS and BOUNDS sections
+        del fields[0]
+    return fields
+
+
+def tokenize(raw, fixed_format=False):
+    """Split the content of a MPS file into tokens.
+
+    Return the array of tokens (as bytes objects), the index of the line of each
+    token and the indices of the section header lines. Comment lines are removed.
+    In free format the tokens are located with numpy on the bytes of the file and
+    extracted with a single call to split.
+    """
+    buf = np.frombuffer(raw, dtype=np.uint8)
+    is_newline = buf == ord("\n")
+    newlines = np.flatnonzero(is_newline)
+    line_starts = np.hstack(([0], newlines + 1))
+    first_bytes = np.append(buf, np.uint8(ord("\n")))[line_starts]
+    is_comment = first_bytes == ord("*")
+    # white spaces are the bytes in \t\n\v\f\r and the space, as for bytes.split
+    is_header = ~is_comment & (first_bytes != ord(" ")) & ((first_bytes - 9) > 4)
+
+    if fixed_format:
+        lines = raw.split(b"\n")
+        tokens = []
+        token_lines = []
+        for i, line in enumerate(lines):
+            if is_comment[i]:
+                continue
+            fields = line.split() if is_header[i] else split_fixed_format(line.rstrip())
+            tokens += fields
+            token_lines += [i] * len(fields)
+        token_lines = np.array(token_lines, dtype=np.int64)
+    else:
+        is_blank = (buf == ord(" ")) | ((buf - 9) <= 4)
+        previous_blank = np.hstack(([True], is_blank[:-1]))
+        token_starts = np.flatnonzero(~is_blank & previous_blank)
+        token_lines = np.searchsorted(newlines, token_starts)
+        tokens = raw.split()
+    tokens = np.array(tokens, dtype=object)
+    keep = ~is_comment[token_lines]
+    if not np.all(keep):
+        tokens = tokens[keep]
+        token_lines = token_lines[keep]
+    return tokens, token_lines, np.flatnonzero(is_header)
+
+
+def line_structure(token_lines):
+    """Return the index of the first token and the number of tokens of each line."""
+    starts = np.flatnonzero(np.hstack(([True], token_lines[1:] != token_lines[:-1])))
+    if token_lines.size == 0:
+        starts = starts[:0]
+    counts = np.diff(np.hstack((starts, [token_lines.size])))
+    return starts, counts
+
+
+def split_sections(tokens, token_lines, header_lines):
+    """Group the tokens of the data lines by section.
+
+    Return a dictionary mapping the name of each section to a tuple with the tokens of
+    its header line, the tokens of its data lines, the index of the first token of each
+    data line and the number of tokens of each data line.
+    """
+    sections = dict()
+    bounds = np.searchsorted(token_lines, header_lines, side="left")
+    data_starts = np.searchsorted(token_lines, header_lines, side="right")
+    ends = np.hstack((bounds[1:], [len(tokens)]))
+    for start, data_start, end in zip(bounds, data_starts, ends):
+        starts, counts = line_structure(token_lines[data_start:end])
+        name = tokens[start].decode()
+        sections[name] = (
+            tokens[start:data_start],
+            tokens[data_start:end],
+            starts,
+            counts,
+        )
+    return sections
+
+
+def lookup(index, names, kind):
+    """Return the array of the indices of the names given by the dictionary index."""
+    try:
+        return np.fromiter(
+            map(index.__getitem__, names), dtype=np.int64, count=len(names)
+        )
+    except KeyError as e:
+        raise ValueError(f"unknown {kind} {e.args[0].decode()}")
+
+
+def assign_last(target, ids, values):
+    """Assign target[ids] = values with the last value kept for repeated ids."""
+    if len(ids) == 0:
+        return
+    if np.bincount(ids).max() > 1:
+        _, last = np.unique(ids[::-1], return_index=True)
+        last = len(ids) - 1 - last
+        ids = ids[last]
+        values = values[last]
+    target[ids] = values
+
+
+def coo_to_csr(rows, cols, vals, shape):
+    """Build a csr matrix from coordinates given in column major order."""
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=shape[0]), out=indptr[1:])
+    a = sparse.csr_matrix((vals[order], cols[order], indptr), shape=shape)
+    a.sum_duplicates()
+    return a
+
+
+SUPPORTED_SECTIONS = ("NAME", "ROWS", "COLUMNS", "RHS", "RANGES", "BOUNDS", "ENDATA")
+BOUND_TYPES = (b"UP", b"LO", b"FX", b"FR", b"MI", b"PL", b"BV", b"LI", b"UI")
+
+
+def parse_rows(tokens, starts, counts):
+    """Return the types and names of the rows and the dictionary of row indices."""
+    if np.any(counts != 2):
+        raise ValueError("ROWS lines should have two fields")
+    row_types = tokens[starts]
+    row_names = tokens[starts + 1]
+    row_index = dict(zip(row_names, range(row_names.size)))
+    if len(row_index) < row_names.size:
+        raise ValueError("duplicated row names")
+    return row_types, row_names, row_index
+
+
+def parse_columns(tokens, starts, counts, row_index):
+    """Parse data lines of the COLUMNS section.
+
+    Return the dictionary of the indices of the variables in their order of appearance,
+    the variable of each line, the integer markers depth of each line relative to the
+    first line, the depth change over all the lines and the coordinates of the entries.
+    """
+    second_tokens = tokens[np.minimum(starts + 1, tokens.size - 1)]
+    is_marker = (counts >= 3) & (second_tokens == b"'MARKER'")
+    marker_types = tokens[starts[is_marker] + 2]
+    if not np.all((marker_types == b"'INTORG'") | (marker_types == b"'INTEND'")):
+        raise ValueError("unknown marker")
+    integer_depth = np.zeros(starts.size, dtype=np.int64)
+    integer_depth[is_marker] = np.where(marker_types == b"'INTORG'", 1, -1)
+    integer_depth = np.cumsum(integer_depth)
+    depth_change = integer_depth[-1] if integer_depth.size > 0 else 0
+    line_depth = integer_depth[~is_marker]
+    starts = starts[~is_marker]
+    counts = counts[~is_marker]
+    if not np.all((counts == 3) | (counts == 5)):
+        raise ValueError("COLUMNS lines should have three or five fields")
+
+    line_names = tokens[starts]
+    variable_index = dict.fromkeys(line_names)
+    variable_index = dict(zip(variable_index, range(len(variable_index))))
+    line_vars = lookup(variable_index, line_names, "variable")
+
+    second = starts[counts == 5]
+    entries_cols = np.hstack((line_vars, line_vars[counts == 5]))
+    entries_rows = lookup(row_index, tokens[np.hstack((starts + 1, second + 3))], "row")
+    entries_vals = tokens[np.hstack((starts + 2, second + 4))].astype(np.float64)
+    return (
+        variable_index,
+        line_vars,
+        line_depth,
+        depth_change,
+        entries_rows,
+        entries_cols,
+        entries_vals,
+    )
+
+
+def parse_row_values(tokens, starts, counts, row_index):
+    """Parse data lines of the RHS or RANGES sections.
+
+    The lines contain one or two pairs of row name and value, possibly preceded by the
+    name of the set.
+    """
+    has_set = counts % 2
+    second = (starts + has_set + 2)[counts - has_set >= 4]
+    ids = lookup(row_index, tokens[np.hstack((starts + has_set, second))], "row")
+    values = tokens[np.hstack((starts + has_set + 1, second + 1))]
+    return ids, values.astype(np.float64)
+
+
+def parse_bounds(tokens, starts, counts):
+    """Parse data lines of the BOUNDS section.
+
+    Return the bound types, the variable names and the values (nan for the types that
+    do not take a value).
+    """
+    bound_types = tokens[starts]
+    unsupported = set(bound_types) - set(BOUND_TYPES)
+    if unsupported:
+        raise ValueError(f"bound types {unsupported} not supported")
+    without_value = np.isin(bound_types, [b"FR", b"MI", b"PL", b"BV"])
+    # the name of the bound set can be omitted
+    has_set = counts >= np.where(without_value, 3, 4)
+    names = tokens[starts + 1 + has_set]
+    values = np.full(bound_types.size, np.nan)
+    values[~without_value] = tokens[(starts + counts - 1)[~without_value]].astype(
+        np.float64
+    )
+    return bound_types, names, values
+
+
+def parse_section_lines(section, tokens, starts, counts, row_index):
+    if section == "COLUMNS":
+        return parse_columns(tokens, starts, counts, row_index)
+    if section == "BOUNDS":
+        return parse_bounds(tokens, starts, counts)
+    return parse_row_values(tokens, starts, counts, row_index)
+
+
+def merge_columns(chunks):
+    """Merge the results of parse_columns on consecutive chunks of lines."""
+    if len(chunks) == 1:
+        variable_index, line_vars, line_depth, _, rows, cols, vals = chunks[0]
+        return variable_index, line_vars, line_depth, rows, cols, vals
+    variable_index = dict.fromkeys(itertools.chain.from_iterable(c[0] for c in chunks))
+    variable_index = dict(zip(variable_index, range(len(variable_index))))
+    line_vars = []
+    line_depth = []
+    cols = []
+    depth_offset = 0
+    for chunk in chunks:
+        to_global = lookup(variable_index, chunk[0], "variable")
+        line_vars.append(to_global[chunk[1]])
+        line_depth.append(chunk[2] + depth_offset)
+        cols.append(to_global[chunk[5]])
+        depth_offset += chunk[3]
+    return (
+        variable_index,
+        np.hstack(line_vars),
+        np.hstack(line_depth),
+        np.hstack([c[4] for c in chunks]),
+        np.hstack(cols),
+        np.hstack([c[6] for c in chunks]),
+    )
+
+
+def merge_arrays(chunks):
+    """Concatenate the tuples of arrays returned on consecutive chunks of lines."""
+    if len(chunks) == 1:
+        return chunks[0]
+    return tuple(np.hstack(arrays) for arrays in zip(*chunks))
+
+
+def empty_lines():
+    no_lines = np.empty((0), dtype=np.int64)
+    return np.empty((0), dtype=object), no_lines, no_lines
+
+
+def parse_whole(raw, fixed_format):
+    """Parse the sections of the MPS file content in the current process."""
+    sections = split_sections(*tokenize(raw, fixed_format))
+    for section in sections:
+        if section not in SUPPORTED_SECTIONS:
+            raise ValueError(f"section {section} not supported")
+    header = sections["NAME"][0] if "NAME" in sections else [b"", b""]
+    rows = parse_rows(*sections["ROWS"][1:])
+    parsed = dict()
+    for section in ("COLUMNS", "RHS", "RANGES", "BOUNDS"):
+        lines = sections[section][1:] if section in sections else empty_lines()
+        parsed[section] = [parse_section_lines(section, *lines, rows[2])]
+    return header, rows, parsed
+
+
+# state of the worker processes used by parse_chunked
+_worker = dict()
+
+
+def _init_worker(source, fixed_format, row_index):
+    _worker.update(source=source, fixed_format=fixed_format, row_index=row_index)
+
+
+def _parse_chunk(section, start, end):
+    source = _worker["source"]
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            f.seek(start)
+            raw = f.read(end - start)
+    else:
+        raw = source[start:end]
+    tokens, token_lines, _ = tokenize(raw, _worker["fixed_format"])
+    starts, counts = line_structure(token_lines)
+    return parse_section_lines(section, tokens, starts, counts, _worker["row_index"])
+
+
+def chunk_ranges(data, start, end, chunk_size):
+    """Split the bytes range [start, end) into chunks ending at line ends."""
+    while start < end:
+        stop = -1
+        if start + chunk_size < end:
+            stop = data.find(b"\n", start + chunk_size - 1, end)
+        stop = end if stop < 0 else stop + 1
+        yield start, stop
+        start = stop
+
+
+def parse_chunked(f, fixed_format, nb_workers, chunk_size):
+    """Parse the sections of a MPS file with a pool of processes.
+
+    The file is memory mapped when possible and the data lines of the COLUMNS, RHS,
+    RANGES and BOUNDS sections are split into byte ranges of about chunk_size bytes
+    that are parsed by the worker processes, each worker reading its range directly
+    from the file. The per chunk coordinates and names tables are merged in order.
+    """
+    path = getattr(f, "name", None)
+    compressed = isinstance(getattr(f, "buffer", f), gzip.GzipFile)
+    if isinstance(path, str) and os.path.isfile(path) and not compressed:
+        with open(path, "rb") as fb:
+            data = mmap.mmap(fb.fileno(), 0, access=mmap.ACCESS_READ)
+        source = path
+    else:
+        data = f.read()
+        if isinstance(data, str):
+            data = data.encode()
+        source = data
+
+    headers = [
+        (match.start(), match.end() + 1, match.group().split())
+        for match in re.finditer(rb"^[^\s*][^\n]*", data, re.MULTILINE)
+    ]
+    sections = dict()
+    for i, (_, data_start, header) in enumerate(headers):
+        section = header[0].decode()
+        if section not in SUPPORTED_SECTIONS:
+            raise ValueError(f"section {section} not supported")
+        end = headers[i + 1][0] if i + 1 < len(headers) else len(data)
+        sections[section] = (header, min(data_start, end), end)
+
+    header = sections["NAME"][0] if "NAME" in sections else [b"", b""]
+    _, start, end = sections["ROWS"]
+    tokens, token_lines, _ = tokenize(bytes(data[start:end]), fixed_format)
+    rows = parse_rows(tokens, *line_structure(token_lines))
+
+    with concurrent.futures.ProcessPoolExecutor(
+        nb_workers, initializer=_init_worker, initargs=(source, fixed_format, rows[2])
+    ) as pool:
+        futures = dict()
+        for section in ("COLUMNS", "RHS", "RANGES", "BOUNDS"):
+            _, start, end = sections.get(section, (None, 0, 0))
+            futures[section] = [
+                pool.submit(_parse_chunk, section, chunk_start, chunk_end)
+                for chunk_start, chunk_end in chunk_ranges(data, start, end, chunk_size)
+            ]
+        parsed = dict()
+        for section, section_futures in futures.items():
+            parsed[section] = [future.result() for future in section_futures] or [
+                parse_section_lines(section, *empty_lines(), rows[2])
+            ]
+    if isinstance(data, mmap.mmap):
+        data.close()
+    return header, rows, parsed
+
+
+def read_perplex_solution(fsol, variable_index, lower_bounds, upper_bounds):
+    """Read the values of the variables from a solution file generated by perPlex.
+
+    Examples of such files are in http://www.zib.de/koch/perplex/data/netlib/txt/
+    and the paper is here https://opus4.kobv.de/opus4-zib/files/727/ZR-03-05.pdf
+    The lines giving the names, states and values of the variables are located with
+    numpy on the bytes of the file, the names are mapped to the indices of the
+    variables with the dictionary variable_index and the exact rational values are
+    converted to floats with numpy. Non basic variables take the value of the bound
+    given by their state and the variables missing from the file are set to nan.
+    """
+    content = fsol.read()
+    if isinstance(content, str):
+        content = content.encode()
+    end = content.find(b"\n- EOF")
+    if end >= 0:
+        content = content[:end]
+    lines = content.split(b"\n")
+    buf = np.frombuffer(content + b"\n" * 8, dtype=np.uint8)
+    line_starts = np.hstack(([0], np.flatnonzero(buf[: len(content)] == ord("\n")) + 1))
+
+    def lines_starting_with(prefix):
+        selected = np.ones(line_starts.size, dtype=bool)
+        for k, c in enumerate(prefix):
+            selected &= buf[line_starts + k] == c
+        return np.flatnonzero(selected)
+
+    def fields(line_ids, nb_tokens):
+        """Return the tokens following the colon of each line as a 2D array.
+
+        The lines are split at once when they all have nb_tokens tokens (the two words
+        of the key, the colon and the fields), and one by one otherwise.
+        """
+        tokens = b"\n".join([lines[i] for i in line_ids]).split()
+        if len(tokens) == nb_tokens * len(line_ids):
+            tokens = np.array(tokens, dtype=object).reshape(-1, nb_tokens)
+            if np.all(tokens[:, 2] == b":"):
+                return tokens[:, 3:]
+        split_lines = []
+        for i in line_ids:
+            # the last field takes the end of the line, allowing spaces in names
+            tokens = lines[i].partition(b":")[2].split(None, nb_tokens - 4)
+            if len(tokens) != nb_tokens - 3:
+                raise ValueError("unexpected line format in the solution file")
+            split_lines.append(tokens[:-1] + [tokens[-1].strip()])
+        return np.array(split_lines, dtype=object).reshape(-1, nb_tokens - 3)
+
+    solution = np.full(len(lower_bounds), np.nan)
+    name_lines = lines_starting_with(b"V Name")
+    state_lines = lines_starting_with(b"V State")
+    value_lines = lines_starting_with(b"V Value")
+    variables = lookup(variable_index, fields(name_lines, 4)[:, 0], "variable")
+
+    def variables_of_lines(line_ids):
+        """Return the variable named in the closest preceding name line."""
+        positions = np.searchsorted(name_lines, line_ids)
+        if np.any(positions == 0):
+            raise ValueError("variable values given before the name of the variable")
+        return variables[positions - 1]
+
+    # non basic variables take the value of their bound, the states are compared on
+    # the bytes following the colon
+    colons = np.flatnonzero(buf == ord(":"))
+    state_starts = colons[np.searchsorted(colons, line_starts[state_lines])] + 1
+    state_starts += buf[state_starts] == ord(" ")
+
+    def has_state(state):
+        found = np.ones(state_lines.size, dtype=bool)
+        for k, c in enumerate(state):
+            found &= buf[np.minimum(state_starts + k, buf.size - 1)] == c
+        return found
+
+    on_lower = has_state(b"on lower")
+    on_both = has_state(b"on both")
+    on_upper = has_state(b"on upper") | on_both
+    state_vars = variables_of_lines(state_lines)
+    both_vars = state_vars[on_both]
+    if np.any(lower_bounds[both_vars] != upper_bounds[both_vars]):
+        raise ValueError("variable on both bounds with different bounds")
+    is_bound = on_lower | on_upper
+    state_lines = state_lines[is_bound]
+    state_vars = state_vars[is_bound]
+    state_values = np.where(
+        on_lower[is_bound], lower_bounds[state_vars], upper_bounds[state_vars]
+    )
+
+    # values are given as "decimal = rational" and the rational is used unless nan
+    value_vars = variables_of_lines(value_lines)
+    values = np.empty(len(value_lines))
+    if len(value_lines) > 0:
+        value_fields = fields(value_lines, 6)
+        rationals = value_fields[:, 2]
+        numerators = rationals.copy()
+        denominators = np.full(rationals.size, b"1", dtype=object)
+        is_fraction = np.array([b"/" in r for r in rationals], dtype=bool)
+        if np.any(is_fraction):
+            fractions = [r.partition(b"/") for r in rationals[is_fraction]]
+            numerators[is_fraction] = [f[0] for f in fractions]
+            denominators[is_fraction] = [f[2] for f in fractions]
+        exact = numerators.astype(np.float64) / denominators.astype(np.float64)
+        decimals = value_fields[:, 0].astype(np.float64)
+        values = np.where(np.isnan(exact), decimals, exact)
+
+    # the last line given for a variable sets its value
+    order = np.argsort(np.hstack((state_lines, value_lines)), kind="stable")
+    assign_last(
+        solution,
+        np.hstack((state_vars, value_vars))[order],
+        np.hstack((state_values, values))[order],
+    )
+    return solution
+
+
+def mps_parser(f, fsol=None, fixed_format=False, nb_workers=1, chunk_size=2**26):
     """
     Parse Linear programs in the MPS format.
     This file format is described here
     https://en.wikipedia.org/wiki/MPS_(format)
-    This has been coded in a rush and might not handle all cases
-    could have a look at mps2mat.f that is a part of the package LIPSOL by Yin Zhang
-    or https://github.com/YimingYAN/cppipm/blob/master/src/mpsReader.cpp
+    The whole file is tokenized at once with numpy, names are mapped to indices
+    with dictionaries and the constraints matrices are assembled from coordinate
+    arrays. Fields are separated by white spaces as in the free MPS format
+    unless fixed_format is True, in which case the fields are read at the fixed columns
+    positions, allowing spaces in the names. RANGES, integer markers and the integer
+    bounds BV, LI and UI are supported, semi-continuous variables are not.
+    A right hand side given for the objective row is returned negated as
+    objective_offset.
+    For large files, the COLUMNS, RHS, RANGES and BOUNDS sections can be parsed by
+    chunks of about chunk_size bytes in nb_workers processes (all the cores if
+    nb_workers is None).
     """
-    nb_ineq = 0
-    nb_eq = 0
-    nb_var = 0
-    b_lower = dict()
-    b_upper = dict()
-    b_eq = dict()
-    rows = dict()
-    variables = dict()
-    a_ineq_list = []
-    a_eq_list = []
-    v_id_to_var = dict()
-    part_parsing = None
-    while True:
-
-        line = f.readline()
-        line = line.rstrip("\n")
-        line += " " * (len(line) - 61)
-        t = []
-        t.append(line[1:3].strip())
-        t.append(line[4:12].ljust(8))
-        t.append(line[14:22])
-        t.append(line[25:36].strip())
-        t.append(line[39:47])
-        t.append(line[49:61].strip())
-        # t=line.split()
-        # t[0]=
-        # 2-3        5-12      15-22     25-36     40-47     50-61
-        if len(t) == 0:
-            continue
-        if line.startswith("ENDATA"):
-            break
-        if line.startswith("*"):  # this is a comment
-            continue
-        if len(t) == 0:
-            continue
-        if line.startswith("NAME"):
-            problem_name = t[1]
-            continue
-        if line.startswith("ROWS"):
-            part_parsing = "ROWS"
-            continue
-        if line.startswith("COLUMNS"):
-            part_parsing = "COLUMNS"
-            continue
-        if line.startswith("RHS"):
-            part_parsing = "RHS"
-            continue
-        if line.startswith("BOUNDS"):
-            part_parsing = "BOUNDS"
-            continue
-
-        if line.startswith("RANGES"):
-            print("not coded yet")
-            raise
-
-        if part_parsing == "ROWS":
-            if t[0] == "N":
-                costname = t[1]
-
-            if t[1] in rows:
-                raise
-            r = dict()
-            rows[t[1]] = r
-            r["type"] = t[0]
-            if t[0] == "G":
-                r["id"] = nb_ineq
-                b_lower[nb_ineq] = 0
-                b_upper[nb_ineq] = np.inf
-                nb_ineq += 1
-
-            if t[0] == "L":
-                r["id"] = nb_ineq
-                b_lower[nb_ineq] = -np.inf
-                b_upper[nb_ineq] = 0
-                nb_ineq += 1
-            elif t[0] == "E":
-                r["id"] = nb_eq
-                b_eq[nb_eq] = 0  # set default value
-                nb_eq += 1
-
-            continue
-
-        if part_parsing == "COLUMNS":
-
-            if t[1] in variables:
-
-                var = variables[t[1]]
-            else:
-                var = dict()
-                variables[t[1]] = var
-                var["id"] = nb_var
-                var["UP"] = np.inf
-                var[
-                    "LO"
-                ] = 0  # Variables not mentioned in a given BOUNDS set are taken to be non-negative (lower bound zero, no upper bound)
-                var["cost"] = 0
-                v_id_to_var[nb_var] = var
-                nb_var += 1
-
-            j = var["id"]
-            for k in range(int((len(t) - 2) / 2)):
-                if t[2 * k + 2] == "":
-                    break
-                r = rows[t[2 * k + 2]]
-                v = float(t[2 * k + 3])
-                if r["type"] == "N":
-                    var["cost"] = v
-                    continue
-
-                i = r["id"]
-
-                if r["type"] == "L":
-                    a_ineq_list.append((i, j, v))
-                elif r["type"] == "G":
-                    a_ineq_list.append((i, j, v))
-                elif r["type"] == "E":
-                    a_eq_list.append((i, j, v))
-            continue
-
-        if part_parsing == "RHS":
-
-            for k in range(int((len(t) - 2) / 2)):
-                if t[2 * k + 2] == "":
-                    break
-                r = rows[t[2 * k + 2]]
-                i = r["id"]
-                v = float(t[2 * k + 3])
-                if r["type"] == "N":
-                    raise
-                elif r["type"] == "L":
-
-                    b_upper[i] = v
-                elif r["type"] == "G":
-                    b_lower[i] = v
-
-                elif r["type"] == "E":
-                    b_eq[i] = v
-            continue
-
-        if part_parsing == "BOUNDS":
-            var = variables[t[2]]
-            var["name"] = t[2]
-            if t[0] == "UP" or t[0] == "LO":
-                var[t[0]] = float(t[3])
-            elif t[0] == "FR":
-                var["UP"] = np.inf
-                var["LO"] = -np.inf
-            elif t[0] == "FX":
-                var["UP"] = float(t[3])
-                var["LO"] = float(t[3])
-            elif t[0] == "MI":
-                var["LO"] = -np.inf
-            elif t[0] == "PL":
-                var["UP"] = np.inf
-            elif t[0] == "BV" or t[0] == "LI" or t[0] == "UI":
-                print("integer constraints ignored")
-                raise
-
-    cost_vector = np.array([v_id_to_var[i]["cost"] for i in range(nb_var)])
-    upper_bounds = np.array([v_id_to_var[i]["UP"] for i in range(nb_var)])
-    lower_bounds = np.array([v_id_to_var[i]["LO"] for i in range(nb_var)])
-
-    a_ineq = sparse.dok_matrix((nb_ineq, nb_var))
-    for i, j, v in a_ineq_list:
-        a_ineq[i, j] = v
-
-    a_eq = sparse.dok_matrix((nb_eq, nb_var))
-    for i, j, v in a_eq_list:
-        a_eq[i, j] = v
-
-    b_eq = np.array([b_eq[i] for i in range(nb_eq)])
-    b_lower = np.array([b_lower[i] for i in range(nb_ineq)])
-    b_upper = np.array([b_upper[i] for i in range(nb_ineq)])
-
-    # print a_eq
+    if nb_workers is None:
+        nb_workers = os.cpu_count()
+    if nb_workers > 1:
+        header, rows, parsed = parse_chunked(f, fixed_format, nb_workers, chunk_size)
+    else:
+        raw = f.read()
+        if isinstance(raw, str):
+            raw = raw.encode()
+        header, rows, parsed = parse_whole(raw, fixed_format)
+    problem_name = b" ".join(header[1:]).decode()
+
+    row_types, row_names, row_index = rows
+    nb_rows = row_names.size
+    objective_rows = np.flatnonzero(row_types == b"N")
+    objective_row = objective_rows[0] if objective_rows.size > 0 else -1
+    costname = row_names[objective_row].decode() if objective_row >= 0 else None
+
+    # variables are numbered in their order of appearance
+    (
+        variable_index,
+        line_vars,
+        line_depth,
+        entries_rows,
+        entries_cols,
+        entries_vals,
+    ) = merge_columns(parsed["COLUMNS"])
+    nb_var = len(variable_index)
+    variables_names = [name.decode() for name in variable_index]
+
+    is_objective = entries_rows == objective_row
+    cost_vector = np.zeros(nb_var)
+    assign_last(cost_vector, entries_cols[is_objective], entries_vals[is_objective])
+
+    rhs = np.zeros(nb_rows)
+    assign_last(rhs, *merge_arrays(parsed["RHS"]))
+    objective_offset = float(-rhs[objective_row]) if objective_row >= 0 else 0.0
+
+    ranges = np.full(nb_rows, np.nan)
+    assign_last(ranges, *merge_arrays(parsed["RANGES"]))
+
+    is_e = row_types == b"E"
+    row_lower = np.where(is_e | (row_types == b"G"), rhs, -np.inf)
+    row_upper = np.where(is_e | (row_types == b"L"), rhs, np.inf)
+    has_range = ~np.isnan(ranges)
+    abs_ranges = np.abs(ranges)
+    extend_up = has_range & ((row_types == b"G") | (is_e & (ranges > 0)))
+    extend_down = has_range & ((row_types == b"L") | (is_e & (ranges < 0)))
+    row_upper[extend_up] = rhs[extend_up] + abs_ranges[extend_up]
+    row_lower[extend_down] = rhs[extend_down] - abs_ranges[extend_down]
+
+    # split the constraints between equalities and inequalities
+    is_equality = is_e & (row_lower == row_upper)
+    is_inequality = (row_types == b"L") | (row_types == b"G") | (is_e & ~is_equality)
+    local_index = np.full(nb_rows, -1)
+    local_index[is_equality] = np.arange(np.sum(is_equality))
+    local_index[is_inequality] = np.arange(np.sum(is_inequality))
+
+    def constraints_matrix(rows_mask):
+        keep = rows_mask[entries_rows]
+        return coo_to_csr(
+            local_index[entries_rows[keep]],
+            entries_cols[keep],
+            entries_vals[keep],
+            (np.sum(rows_mask), nb_var),
+        )
+
+    a_eq = constraints_matrix(is_equality)
+    a_ineq = constraints_matrix(is_inequality)
+    b_eq = row_lower[is_equality]
+    b_lower = row_lower[is_inequality]
+    b_upper = row_upper[is_inequality]
+
+    # bounds, variables not mentioned in the BOUNDS section are taken to be
+    # non-negative (lower bound zero, no upper bound)
+    lower_bounds = np.zeros(nb_var)
+    upper_bounds = np.full(nb_var, np.inf)
+    is_integer = np.zeros(nb_var, dtype=bool)
+    is_integer[line_vars[line_depth > 0]] = True
+
+    bound_types, bound_names, bound_values = merge_arrays(parsed["BOUNDS"])
+    bound_cols = lookup(variable_index, bound_names, "variable")
+    is_type = {t: bound_types == t for t in set(bound_types)}
+    no_type = np.zeros(bound_types.size, dtype=bool)
+    fx, fr, mi, pl, bv, lo, up, li, ui = (
+        is_type.get(t, no_type)
+        for t in (b"FX", b"FR", b"MI", b"PL", b"BV", b"LO", b"UP", b"LI", b"UI")
+    )
+
+    sets_lower = lo | fx | fr | mi | bv | li
+    new_lower = bound_values.copy()
+    new_lower[fr | mi] = -np.inf
+    new_lower[bv] = 0
+    assign_last(lower_bounds, bound_cols[sets_lower], new_lower[sets_lower])
+
+    sets_upper = up | fx | fr | pl | bv | ui
+    new_upper = bound_values.copy()
+    new_upper[fr | pl] = np.inf
+    new_upper[bv] = 1
+    assign_last(upper_bounds, bound_cols[sets_upper], new_upper[sets_upper])
+
+    is_integer[bound_cols[bv | li | ui]] = True
+
     r = {
         "cost_vector": cost_vector,
         "upper_bounds": upper_bounds,
@@ -202,71 +622,16 @@ def mps_parser(f, fsol=None):
         "b_upper": b_upper,
         "problem_name": problem_name,
         "costname": costname,
+        "objective_offset": objective_offset,
+        "is_integer": is_integer,
+        "variables_names": variables_names,
     }
 
-    # parses Linear Program solution file generated by perPlex Version 1.00
-    # examples of such file in http://www.zib.de/koch/perplex/data/netlib/txt/
-    # paper here https://opus4.kobv.de/opus4-zib/files/727/ZR-03-05.pdf
     r["solution"] = None
     if fsol is not None:
-
-        while True:
-
-            line = fsol.readline()
-            line = line.rstrip("\n")
-            if line == "":
-                continue
-            if len(t) == 0:
-                continue
-            if line.startswith("- EOF"):
-                break
-
-            if line.startswith("* Objvalue"):
-                # objvalue = 4
-                continue
-            if line.startswith("- Variables"):
-                part_parsing = "Variables"
-                continue
-
-            if line.startswith("- Constraints"):
-                part_parsing = "Constraints"
-                continue
-
-            if part_parsing == "Variables":
-                if line.startswith("V Name"):
-                    name = line.split(": ")[1].ljust(8)
-                    var = variables[name]
-                    continue
-
-                if line.startswith("V Value"):
-                    val1 = float(line.split(":")[1].split("=")[0])
-                    frac = line.split(":")[1].split("=")[1].split("/")
-                    if len(frac) == 1:
-                        val = float(frac[0])
-                    else:
-                        val = float(frac[0]) / float(frac[1])
-                    if np.isnan(val):  # happends with PEROLD
-                        var["sol"] = val1
-                    else:
-                        var["sol"] = val
-                    continue
-
-                if line.startswith("V State    : on lower"):
-                    var["sol"] = var["LO"]
-                    continue
-
-                if line.startswith("V State    : on upper"):
-                    var["sol"] = var["UP"]
-                    continue
-
-                if line.startswith("V State    : on both"):
-                    assert var["UP"] == var["LO"]
-                    var["sol"] = var["UP"]
-                    continue
-
-        solution = np.array([v_id_to_var[i]["sol"] for i in range(nb_var)])
-
-        r["solution"] = solution
+        r["solution"] = read_perplex_solution(
+            fsol, variable_index, lower_bounds, upper_bounds
+        )
 
     return r
 
@@ -277,4 +642,4 @@ if __name__ == "__main__":
     filename_sol = "./data/perPlex/afiro.txt.gz"
     file_lp = open(filename_lp, "r")
     fsol = gzip.open(filename_sol, "r")
-    LP = mps_parser(file_lp, fsol)
+    LP = mps_parser(file_lp, fsol, fixed_format=True)
@@ -5,6 +5,8 @@ Interior Point Method" by Sanjay Mehrotra.
 https://www.researchgate.net/publication/230873223_On_the_Implementation_of_a_Primal-Dual_Interior_Point_Method
 this code is largely inspired from https://github.com/YimingYAN/mpc.
 """
+import logging
+
 import numpy as np
 from numpy.linalg import norm
 
@@ -12,8 +14,11 @@ from scipy import sparse
 from scipy.sparse.linalg import spsolve
 
 
+from .tools import PhaseProfiler
 from .xorshift import XorShift
 
+logger = logging.getLogger(__name__)
+
 
 def initial_point(a, b, c, use_umfpack=False):
 
@@ -43,8 +48,12 @@ def initial_point(a, b, c, use_umfpack=False):
     delta_x_c = delta_x + pdct / (np.sum(s) + n * delta_s)
     delta_s_c = delta_s + pdct / (np.sum(x) + n * delta_x)
 
-    print(
-        f"delta_x={delta_x}\ndelta_s={delta_s}\ndelta_x_c={delta_x_c}\ndelta_s_c={delta_s_c}\n"
+    logger.debug(
+        "delta_x=%s\ndelta_s=%s\ndelta_x_c=%s\ndelta_s_c=%s\n",
+        delta_x,
+        delta_s,
+        delta_x_c,
+        delta_s_c,
     )
     # output
     x0 = x + delta_x_c * e
@@ -53,7 +62,9 @@ def initial_point(a, b, c, use_umfpack=False):
     return x0, y0, s0
 
 
-def newton_direction(r_b, r_c, r_x_s, a, m, n, x, s, lu, error_check=0, use_lu=True):
+def newton_direction(
+    r_b, r_c, r_x_s, a, m, n, x, s, lu, error_check=0, use_lu=True, profiler=None
+):
 
     rhs = np.hstack((-r_b, -r_c + r_x_s / x))
     d_2 = -np.minimum(1e16, s / x)
@@ -70,7 +81,11 @@ def newton_direction(r_b, r_c, r_x_s, a, m, n, x, s, lu, error_check=0, use_lu=T
 
     if use_lu:
         if lu is None:
+            if profiler is not None:
+                profiler.start("factorization")
             lu = sparse.linalg.splu(b.tocsc())
+            if profiler is not None:
+                profiler.stop("factorization")
             # wikipedia says it uses Mehrotra cholesky but the matrix i'm getting is not definite positive
             # scikits.sparse.cholmod.cholesky fails without a warning
 
@@ -84,17 +99,15 @@ def newton_direction(r_b, r_c, r_x_s, a, m, n, x, s, lu, error_check=0, use_lu=T
     ds = -(r_x_s + s * dx) / x
 
     if error_check == 1:
-        print(
-            "error = %6.2e"
-            % (
-                norm(a.T * dy + ds + r_c)
-                + norm(a * dx + r_b)
-                + norm(s * dx + x * ds + r_x_s)
-            )
+        logger.info(
+            "error = %6.2e",
+            norm(a.T * dy + ds + r_c)
+            + norm(a * dx + r_b)
+            + norm(s * dx + x * ds + r_x_s),
         )
-        print("\t + err_d = %6.2e" % (norm(a.T * dy + ds + r_c)))
-        print("\t + err_p = %6.2e" % (norm(a * dx + r_b)))
-        print("\t + err_gap = %6.2e\n" % (norm(s * dx + x * ds + r_x_s)))
+        logger.info("\t + err_d = %6.2e", norm(a.T * dy + ds + r_c))
+        logger.info("\t + err_p = %6.2e", norm(a * dx + r_b))
+        logger.info("\t + err_gap = %6.2e\n", norm(s * dx + x * ds + r_x_s))
 
     return dx, dy, ds, lu
 
@@ -117,8 +130,11 @@ def mpc_sol(
     verbose=2,
     error_check=False,
     callback=None,
+    profiler=None,
 ):
-
+    if profiler is None:
+        profiler = PhaseProfiler()
+    profiler.start("preprocessing")
     a = sparse.coo_matrix(a)
     c = np.squeeze(np.array(c))
     b = np.squeeze(np.array(b))
@@ -130,23 +146,33 @@ def mpc_sol(
     alpha_s = 0
 
     if verbose > 1:
-        print(
-            "\n%3s %6s %9s %11s %9s %9s %9s\n"
-            % ("ITER", "COST", "MU", "RESIDUAL", "ALPHAX", "ALPHAS", "MAXVIOL")
+        logger.info(
+            "\n%3s %6s %9s %11s %9s %9s %9s\n",
+            "ITER",
+            "COST",
+            "MU",
+            "RESIDUAL",
+            "ALPHAX",
+            "ALPHAS",
+            "MAXVIOL",
         )
 
     # Choose initial point
     x, y, s = initial_point(a, b, c)
 
     bc = 1 + max([norm(b), norm(c)])
+    profiler.stop("preprocessing")
 
     # Start the loop
     niter_done = 0
+    profiler.start("iterations")
 
     for niter in range(max_iter):
         # Compute residuals and update mu
         r_b = a * x - b
         r_c = a.T * y + s - c
+        profiler.count_spmv(a)
+        profiler.count_spmv(a, transposed=True)
         r_x_s = x * s
         mu = np.mean(r_x_s)
         f = c.T.dot(x)
@@ -154,11 +180,17 @@ def mpc_sol(
         # Check relative decrease in residual, for purposes of convergence test
         residual = norm(np.hstack((r_b, r_c, r_x_s)) / bc)
 
-        if verbose > 1:
+        if verbose > 1 and logger.isEnabledFor(logging.INFO):
             maxviol = max(np.max(np.abs(r_b)), np.max(-x))
-            print(
-                "%3d %9.2e %9.2e %9.2e %9.4g %9.4g %9.2e"
-                % (niter, f, mu, residual, alpha_x, alpha_s, maxviol)
+            logger.info(
+                "%3d %9.2e %9.2e %9.2e %9.4g %9.4g %9.2e",
+                niter,
+                f,
+                mu,
+                residual,
+                alpha_x,
+                alpha_s,
+                maxviol,
             )
 
         if callback is not None:
@@ -171,7 +203,7 @@ def mpc_sol(
 
         # Get affine-scaling direction
         dx_aff, dy_aff, ds_aff, lu = newton_direction(
-            r_b, r_c, r_x_s, a, m, n, x, s, None, error_check
+            r_b, r_c, r_x_s, a, m, n, x, s, None, error_check, profiler=profiler
         )
 
         # Get affine-scaling step length
@@ -190,6 +222,10 @@ def mpc_sol(
         dx_cc, dy_cc, ds_cc, lu = newton_direction(
             r_b, r_c, r_x_s, a, m, n, x, s, lu, error_check
         )
+        # the factorization done for the predictor is reused by the corrector
+        factor_nnz = lu.L.nnz + lu.U.nnz
+        profiler.count_factorization(factor_nnz)
+        profiler.count_solve(factor_nnz, nb=2)
 
         # Compute search direction and step
         dx = dx_aff + dx_cc
@@ -204,11 +240,12 @@ def mpc_sol(
         s = s + alpha_s * ds
 
         if niter == max_iter and verbose > 1:
-            print("max_iter reached!\n")
+            logger.info("max_iter reached!\n")
         niter_done = niter
+    profiler.stop("iterations")
 
     if verbose > 0:
-        print("\nDONE! [m,n] = [%d, %d], N = %d\n" % (m, n, niter))
+        logger.info("\nDONE! [m,n] = [%d, %d], N = %d\n", m, n, niter)
 
     f = c.T.dot(x)
 
@@ -25,6 +25,9 @@
 """Module that implement the class SparseLP to help modeling the LP problem."""
 
 import copy
+import gzip
+import logging
+import os
 import time
 
 import numpy as np
@@ -32,16 +35,24 @@ import numpy as np
 import scipy.ndimage
 import scipy.optimize
 import scipy.sparse
+import scipy.sparse.linalg
 
 
 from .ADMM import lp_admm, lp_admm2
 from .ADMMBlocks import lp_admm_block_decomposition
-from .ChambollePockPPD import chambolle_pock_ppd
+from .ChambollePockPPD import chambolle_pock_ppd, pdhg_restarted
 from .DualCoordinateAscent import dual_coordinate_ascent
 from .DualGradientAscent import dual_gradient_ascent
 from .MehrotraPDIP import mpc_sol
+from .affineExpression import AffineExpression
+from .tools import MatrixCache, MetricsPolicy, PhaseProfiler, load_npz
 
 
+logger = logging.getLogger(__name__)
+
+# version of the file format written by SparseLP.save_npz
+NPZ_FORMAT_VERSION = 1
+
 solving_methods = (
     "osqp",
     "mehrotra",
@@ -50,6 +61,7 @@ solving_methods = (
     "dual_coordinate_ascent",
     "dual_gradient_ascent",
     "chambolle_pock_ppd",
+    "pdhg_restarted",
     "admm",
     "admm2",
     "admm_blocks",
@@ -72,6 +84,17 @@ except Exception:
     print("could not import osqp. The osqp solver will not be available")
 
 
+# matrices derived from a constraints matrix by SparseLP.cached_matrix
+_matrix_derivations = {
+    "csr": lambda a: a.tocsr(),
+    "csc": lambda a: a.tocsc(),
+    "transpose": lambda a: a.T.tocsr(),
+    "gram": lambda a: (a.T * a).tocsr(),
+    "row_norms": lambda a: scipy.sparse.linalg.norm(a, axis=1),
+    "column_norms": lambda a: scipy.sparse.linalg.norm(a, axis=0),
+}
+
+
 def csr_matrix_append_row(a, n, cols, vals):
     a.blocks.append((a.shape[0], a.shape[0]))
     a._shape = (a.shape[0] + 1, n)
@@ -104,6 +127,35 @@ def csr_matrix_append_rows(a, b):
     assert a.indptr[-1] == a.data.size
 
 
+def csr_matrix_append_blocks(a, blocks):
+    """Append a list of csr matrices below the csr matrix a using a single concatenation.
+
+    This avoids the quadratic cost of calling csr_matrix_append_rows once per block.
+    """
+    if len(blocks) == 0:
+        return
+    nb_rows = a.shape[0]
+    nb_cols = a.shape[1]
+    offset = a.indptr[-1]
+    indptr = [a.indptr[:-1]]
+    for b in blocks:
+        a.blocks.append((nb_rows, nb_rows + b.shape[0] - 1))
+        nb_rows += b.shape[0]
+        nb_cols = max(nb_cols, b.shape[1])
+        indptr.append(offset + b.indptr[:-1])
+        offset = offset + b.indptr[-1]
+    indptr.append([offset])
+    a._shape = (nb_rows, nb_cols)
+    a.indices = np.concatenate([a.indices] + [b.indices for b in blocks])
+    a.data = np.concatenate([a.data] + [b.data for b in blocks])
+    a.indptr = np.concatenate(indptr)
+
+    assert a.indices.size == 0 or np.max(a.indices) < a.shape[1]
+    assert a.data.size == a.indices.size
+    assert a.indptr.size == a.shape[0] + 1
+    assert a.indptr[-1] == a.data.size
+
+
 def empty_csr_matrix():
     a = scipy.sparse.csr_matrix((1, 1), dtype=np.float)
     # trick , because it would not let me create and empty matrix
@@ -124,26 +176,131 @@ def unique_rows(data, prec=5):
     return np.unique(b).view(d_r.dtype).reshape(-1, d_r.shape[1]), ia, ic
 
 
-def crd_matrix(cols, vals, broadcast=True):
+def rows_with_duplicates(cols):
+    """Return the indices of the rows of the 2D array cols that contain a repeated value."""
+    nb_cols = cols.shape[1]
+    if nb_cols <= 8:
+        # pairwise comparisons of the columns, cheaper than sorting for short rows
+        duplicated = np.zeros(cols.shape[0], dtype=bool)
+        for i in range(nb_cols):
+            for j in range(i + 1, nb_cols):
+                duplicated |= cols[:, i] == cols[:, j]
+    else:
+        # sorting 32 bits integers is several times faster than sorting 64 bits ones
+        if cols.size > 0 and cols.min() >= 0 and cols.max() < 2 ** 31:
+            sorted_cols = cols.astype(np.int32)
+        else:
+            sorted_cols = np.array(cols)
+        sorted_cols.sort(axis=1)
+        duplicated = np.any(sorted_cols[:, 1:] == sorted_cols[:, :-1], axis=1)
+    return np.nonzero(duplicated)[0]
+
+
+def int_to_chars(ids, prefix="", width=8):
+    """Format the strings prefix + str(ids[i]) as an array of characters.
+
+    Return a 2D uint8 array with the strings left aligned and padded with spaces to the
+    given width, or to the length of the longest string if larger.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    nb_digits = np.ones(ids.size, dtype=np.int64)
+    power = 10
+    while ids.size > 0 and power <= ids.max():
+        nb_digits += ids >= power
+        power *= 10
+    max_digits = nb_digits.max() if ids.size > 0 else 1
+    chars = np.full(
+        (ids.size, max(width, len(prefix) + max_digits)), ord(" "), dtype=np.uint8
+    )
+    chars[:, : len(prefix)] = np.frombuffer(prefix.encode(), dtype=np.uint8)
+    remainder = ids.copy()
+    lines = np.arange(ids.size)
+    for k in range(max_digits):
+        # k-th digit starting from the least significant one
+        valid = k < nb_digits
+        position = len(prefix) + nb_digits[valid] - 1 - k
+        chars[lines[valid], position] = ord("0") + remainder[valid] % 10
+        remainder //= 10
+    return chars
+
+
+def float_to_chars(values, precision=None, width=12):
+    """Format the floats as an array of characters right aligned on the given width.
+
+    The numbers are written with their shortest exact representation unless a number
+    of significant digits is given with precision. Each distinct value is formatted
+    only once.
+    """
+    unique_values, inverse = np.unique(values, return_inverse=True)
+    float_format = "%r" if precision is None else "%%.%dg" % precision
+    strings = np.array([float_format % v for v in unique_values.tolist()], dtype=bytes)
+    width = max(width, strings.dtype.itemsize)
+    strings = np.char.rjust(strings, width)
+    return strings.view(np.uint8).reshape(-1, width)[inverse]
+
+
+def write_lines(f, fields):
+    """Write lines made of the given fields to a binary file.
+
+    Each field is either a byte string repeated on every line or a 2D array with the
+    characters of the field on each line, as given by int_to_chars or float_to_chars.
+    """
+    nb_lines = max(len(field) for field in fields if isinstance(field, np.ndarray))
+    if nb_lines == 0:
+        return
+    widths = [
+        len(field) if isinstance(field, bytes) else field.shape[1] for field in fields
+    ]
+    lines = np.empty((nb_lines, sum(widths) + 1), dtype=np.uint8)
+    start = 0
+    for field, width in zip(fields, widths):
+        if isinstance(field, bytes):
+            field = np.frombuffer(field, dtype=np.uint8)
+        lines[:, start : start + width] = field
+        start += width
+    lines[:, -1] = ord("\n")
+    f.write(lines.tobytes())
+
+
+def crd_matrix(cols, vals, broadcast=True, validate=True):
     """Construct a compressed sparse row matrix with constant number of non zero value per row.
 
     the matrix is in the form m[i,cols[i,j]]=val[i,j]
     By default the array cols and vals are broadcasted in order to make it easier to use
+    validate can be
+    * True : check that no variable appears twice in a row (single sort of the rows)
+    * False : trusted mode, the indices are not checked
+    * "debug" : also check that the indices are non negative integers and the values
+      finite, and report the repeated variables of each invalid row
     """
     assert np.ndim(cols) == 2
     assert np.ndim(vals) == 2
-
-    if not (np.all(np.diff(np.sort(cols, axis=1), axis=1) > 0)):
-        unvalid = np.nonzero(
-            np.any(np.diff(np.sort(cols, axis=1), axis=1) == 0, axis=1)
-        )[0]
-        error_message = (
-            f"you have twice the same variable in {len(unvalid)} constraint"
-            + ["", "s"][len(unvalid) > 0]
-            + ":\n"
-            + str(unvalid)
-        )
-        raise (error_message)
+    assert validate in (True, False, "debug")
+
+    if validate == "debug":
+        if not np.issubdtype(np.asarray(cols).dtype, np.integer):
+            raise ValueError("the indices of the variables should be integers")
+        unvalid = np.nonzero(np.any(cols < 0, axis=1))[0]
+        if unvalid.size > 0:
+            raise ValueError(f"negative variable indices in constraints:\n{unvalid}")
+        unvalid = np.nonzero(~np.all(np.isfinite(vals), axis=1))[0]
+        if unvalid.size > 0:
+            raise ValueError(f"non finite coefficients in constraints:\n{unvalid}")
+
+    if validate:
+        unvalid = rows_with_duplicates(cols)
+        if unvalid.size > 0:
+            error_message = (
+                f"you have twice the same variable in {len(unvalid)} constraint"
+                + ["", "s"][len(unvalid) > 1]
+                + ":\n"
+                + str(unvalid)
+            )
+            if validate == "debug":
+                for i in unvalid:
+                    values, counts = np.unique(cols[i], return_counts=True)
+                    error_message += f"\nrow {i}: repeated variables {values[counts > 1]}"
+            raise ValueError(error_message)
 
     if broadcast:
         cols, vals = np.broadcast_arrays(cols, vals)
@@ -159,18 +316,303 @@ def crd_matrix(cols, vals, broadcast=True):
     return scipy.sparse.csr_matrix((vals_flat, cols_flat, iptr))
 
 
+class ConstraintsBuffer:
+    """Class to store blocks of constraints before they get concatenated into the LP matrices.
+
+    Each block is a csr matrix with the vectors of bounds associated to its rows.
+    The vectors are copied when buffered and the matrices are expected to be owned
+    by the buffer, so that later changes to the caller's arrays do not leak into the
+    LP before the buffer gets flushed.
+    """
+
+    def __init__(self):
+        self.matrices = []
+        self.vectors = []
+        self.nb_rows = 0
+
+    def __len__(self):
+        """Return the number of buffered blocks."""
+        return len(self.matrices)
+
+    def append(self, a, *vectors):
+        self.matrices.append(a)
+        self.vectors.append(tuple(np.array(v, dtype=np.float64) for v in vectors))
+        self.nb_rows += a.shape[0]
+
+    def pop_all(self):
+        """Return the buffered matrices and the concatenated vectors and empty the buffer."""
+        matrices = self.matrices
+        vectors = [np.hstack(v) for v in zip(*self.vectors)]
+        self.matrices = []
+        self.vectors = []
+        self.nb_rows = 0
+        return matrices, vectors
+
+
+class GrowingVector:
+    """1D array with amortized constant time appends.
+
+    The values are stored in a buffer whose capacity doubles when it is full
+    and view() returns the trimmed part of the buffer that is in use.
+    """
+
+    def __init__(self, values):
+        self.data = np.asarray(values)
+        self.size = self.data.size
+
+    def extend(self, values):
+        values = np.asarray(values).ravel()
+        new_size = self.size + values.size
+        dtype = np.promote_types(self.data.dtype, values.dtype)
+        if new_size > self.data.size or dtype != self.data.dtype:
+            data = np.empty(max(new_size, 2 * self.data.size), dtype=dtype)
+            data[: self.size] = self.data[: self.size]
+            self.data = data
+        self.data[self.size : new_size] = values
+        self.size = new_size
+
+    def view(self):
+        return self.data[: self.size]
+
+
+class SolveResult:
+    """Solution of an LP returned by SparseLP.solve with its convergence history.
+
+    status is "converged" when the method met its stopping criterion, "max_iter" or
+    "max_time" when it ran out of iterations or time, and "failed" otherwise.
+    y_eq and y_ineq are the dual variables for the methods that provide them, for
+    the constraints in the form used by the method.
+    Each progress report of the method adds a row to the history, a structured
+    array preallocated from the number of iterations, up to MAX_INITIAL_CAPACITY
+    rows, whose capacity doubles when it is full. The result unpacks as the tuple
+    (x, elapsed).
+    The profiler accumulates the durations of the phases of the solve:
+    preprocessing, factorization, iterations (which includes the callbacks and
+    the factorizations done during the iterations), callback (which includes the
+    evaluation of the metrics, also timed as metrics) and postprocessing, and counts
+    the operations done by the iterative methods.
+    """
+
+    history_dtype = np.dtype(
+        [
+            ("iteration", np.int64),
+            ("duration", np.float64),
+            ("energy1", np.float64),
+            ("energy2", np.float64),
+            ("max_violated_equality", np.float64),
+            ("max_violated_inequality", np.float64),
+            ("max_violated_constraint", np.float64),
+            ("distance_to_ground_truth", np.float64),
+            ("distance_to_ground_truth_after_rounding", np.float64),
+        ]
+    )
+
+    # the number of iterations can be huge or infinite when solving until max_time
+    MAX_INITIAL_CAPACITY = 1024
+
+    def __init__(self, method, capacity=16, record_events=False):
+        self.method = method
+        self.x = None
+        self.y_eq = None
+        self.y_ineq = None
+        self.status = None
+        self.nb_iterations = None
+        self.elapsed = None
+        self.lower_bound = -np.inf
+        self.profiler = PhaseProfiler(record_events=record_events)
+        capacity = int(min(max(capacity, 1), self.MAX_INITIAL_CAPACITY))
+        self._history = np.empty(capacity, dtype=self.history_dtype)
+        self._size = 0
+
+    def __repr__(self):
+        """Return a summary with the method, the status and the duration."""
+        return "SolveResult(method=%s, status=%s, nb_iterations=%s, elapsed=%s)" % (
+            self.method,
+            self.status,
+            self.nb_iterations,
+            self.elapsed,
+        )
+
+    def __iter__(self):
+        """Iterate over (x, elapsed) as the tuple formerly returned by solve."""
+        return iter((self.x, self.elapsed))
+
+    def __getitem__(self, i):
+        """Return the i-th element of the tuple (x, elapsed)."""
+        return (self.x, self.elapsed)[i]
+
+    def record(self, *values):
+        """Add a row to the history with one value per field of history_dtype."""
+        if self._size == self._history.size:
+            history = np.empty(2 * self._history.size, dtype=self.history_dtype)
+            history[: self._size] = self._history
+            self._history = history
+        self._history[self._size] = values
+        self._size += 1
+
+    @property
+    def history(self):
+        return self._history[: self._size]
+
+    @property
+    def timings(self):
+        """Total duration in seconds of each phase of the solve."""
+        return self.profiler.durations()
+
+    @property
+    def operations(self):
+        """Number of sparse products, factorizations and solves and their nonzeros."""
+        return dict(self.profiler.operations)
+
+    def save_chrome_trace(self, filename):
+        """Save the timeline of a solve done with record_trace=True as a Chrome trace."""
+        self.profiler.save_chrome_trace(filename)
+
+
+class ConstraintNames:
+    """Class to store named ranges of constraints and find them by row index or by name.
+
+    The ranges are kept in arrays of starts and ends sorted by start so that the
+    name of a row is found by bisection, and a dictionary maps each name to the
+    list of its ranges. When ranges overlap, which can happen after remapping the
+    rows, the lookups fall back to a scan that returns the first range added that
+    contains the row. For backward compatibility the object behaves as the list of
+    dictionaries {"name", "start", "end"} it replaces, with indexing, slicing,
+    iteration and append.
+    """
+
+    def __init__(self, ranges=()):
+        self.names = []
+        self._starts = GrowingVector(np.empty((0), dtype=np.int64))
+        self._ends = GrowingVector(np.empty((0), dtype=np.int64))
+        self._ranges_from_name = dict()
+        self._order = None  # permutation sorting the ranges by start, None if sorted
+        self._disjoint = None  # (number of ranges checked, ranges are disjoint)
+        for d in ranges:
+            self.append(d)
+
+    @classmethod
+    def from_arrays(cls, names, starts, ends):
+        """Create the ranges from the list of names and the arrays of starts and ends."""
+        constraint_names = cls()
+        constraint_names.names = list(names)
+        constraint_names._starts = GrowingVector(starts)
+        constraint_names._ends = GrowingVector(ends)
+        for i, name in enumerate(constraint_names.names):
+            constraint_names._ranges_from_name.setdefault(name, []).append(i)
+        if np.any(np.diff(starts) < 0):
+            constraint_names._order = np.empty((0), dtype=np.int64)  # flag as unsorted
+        return constraint_names
+
+    def append(self, name, start=None, end=None):
+        """Add a range given by its name, start and end or as a dictionary."""
+        if isinstance(name, dict):
+            name, start, end = name["name"], name["start"], name["end"]
+        if self._order is None and self._starts.size > 0:
+            if start < self._starts.data[self._starts.size - 1]:
+                self._order = np.empty((0), dtype=np.int64)  # flag as unsorted
+        self._ranges_from_name.setdefault(name, []).append(len(self.names))
+        self.names.append(name)
+        self._starts.extend(np.array([start]))
+        self._ends.extend(np.array([end]))
+
+    def __len__(self):
+        """Return the number of ranges."""
+        return len(self.names)
+
+    def __getitem__(self, i):
+        """Return the dictionary of the i-th range, or a list of them for a slice."""
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return {
+            "name": self.names[i],
+            "start": int(self._starts.view()[i]),
+            "end": int(self._ends.view()[i]),
+        }
+
+    def __iter__(self):
+        """Iterate over the dictionaries of the ranges in the order they were added."""
+        return (self[i] for i in range(len(self)))
+
+    def _sorted_ranges(self):
+        starts = self._starts.view()
+        ends = self._ends.view()
+        if self._order is None:
+            return starts, ends, None
+        if self._order.size != starts.size:
+            self._order = np.argsort(starts, kind="stable")
+        return starts[self._order], ends[self._order], self._order
+
+    def _are_disjoint(self):
+        if self._disjoint is None or self._disjoint[0] != len(self):
+            starts, ends, _ = self._sorted_ranges()
+            disjoint = bool(np.all(np.maximum.accumulate(ends)[:-1] < starts[1:]))
+            self._disjoint = (len(self), disjoint)
+        return self._disjoint[1]
+
+    def range_ids_from_rows(self, rows):
+        """Return the index of the range containing each row, -1 for unnamed rows."""
+        shape = np.shape(rows)
+        rows = np.atleast_1d(rows).ravel()
+        if not self._are_disjoint():
+            # the earliest range containing the row wins, as with the list of ranges
+            ids = np.full(rows.shape, -1, dtype=np.int64)
+            starts = self._starts.view()
+            ends = self._ends.view()
+            for i in range(len(self) - 1, -1, -1):
+                ids[(rows >= starts[i]) & (rows <= ends[i])] = i
+            return ids.reshape(shape)
+        starts, ends, order = self._sorted_ranges()
+        ids = np.searchsorted(starts, rows, side="right") - 1
+        found = ids >= 0
+        found[found] = rows[found] <= ends[ids[found]]
+        if order is not None:
+            ids[found] = order[ids[found]]
+        ids[~found] = -1
+        return ids.reshape(shape)
+
+    def from_row(self, row):
+        """Return the dictionary of the range containing the row or None."""
+        i = int(self.range_ids_from_rows(row))
+        if i >= 0:
+            return self[i]
+
+    def names_from_rows(self, rows):
+        """Return an array with the name of each row, None for unnamed rows."""
+        ids = self.range_ids_from_rows(rows)
+        names = np.array(self.names + [None], dtype=object)
+        return names[ids]
+
+    def from_name(self, name):
+        """Return the list of the ranges with the given name."""
+        return [self[i] for i in self._ranges_from_name.get(name, [])]
+
+
 class SparseLP:
-    """Class to help modeling the LP problem."""
+    """Class to help modeling the LP problem.
+
+    The constraints added through the add_*_constraints methods are buffered and
+    concatenated into the csr matrices a_equalities and a_inequalities only once,
+    the first time these matrices or the associated bounds are accessed
+    (or when calling finalize explicitly).
+    The conversions of these matrices used by the solvers and the rounding
+    heuristics are cached, see cached_matrix.
+    The attribute validate_constraints (True, False or "debug") sets how the
+    indices given to these methods are checked, see crd_matrix.
+    """
 
     def __init__(self):
         # start writing the linear program
+        self._equalities_buffer = ConstraintsBuffer()
+        self._inequalities_buffer = ConstraintsBuffer()
+        self._matrix_cache = MatrixCache()
 
         self.nb_variables = 0
         self.variables_dict = dict()
-        self.upper_bounds = np.empty((0), dtype=np.float)
-        self.lower_bounds = np.empty((0), dtype=np.float)
-        self.costsvector = np.empty((0), dtype=np.float)
-        self.is_integer = np.empty((0), dtype=np.bool)
+        self.upper_bounds = np.empty((0), dtype=np.float64)
+        self.lower_bounds = np.empty((0), dtype=np.float64)
+        self.costsvector = np.empty((0), dtype=np.float64)
+        self.is_integer = np.empty((0), dtype=bool)
         self.a_inequalities = empty_csr_matrix()
         self.a_inequalities.__dict__["blocks"] = []
         self.b_lower = np.empty((0), dtype=np.float)
@@ -179,10 +621,159 @@ class SparseLP:
         self.b_equalities = np.empty((0), dtype=np.float)
         self.a_equalities.__dict__["blocks"] = []
         self.solver = "chambolle_pock"
-        self.equalityConstraintNames = []
-        self.inequalityConstraintNames = []
+        self.validate_constraints = True
+        self.equalityConstraintNames = ConstraintNames()
+        self.inequalityConstraintNames = ConstraintNames()
         self.solution = None
 
+    def finalize(self):
+        """Concatenate the buffered constraints into the constraints matrices."""
+        self._flush_equalities()
+        self._flush_inequalities()
+
+    def _flush_equalities(self):
+        if len(self._equalities_buffer) == 0:
+            return
+        matrices, (b,) = self._equalities_buffer.pop_all()
+        csr_matrix_append_blocks(self._a_equalities, matrices)
+        self._b_equalities = np.append(self._b_equalities, b)
+        self._matrix_cache = MatrixCache()
+
+    def _flush_inequalities(self):
+        if len(self._inequalities_buffer) == 0:
+            return
+        matrices, (lower_bounds, upper_bounds) = self._inequalities_buffer.pop_all()
+        csr_matrix_append_blocks(self._a_inequalities, matrices)
+        self._b_lower = np.append(self._b_lower, lower_bounds)
+        self._b_upper = np.append(self._b_upper, upper_bounds)
+        self._matrix_cache = MatrixCache()
+
+    @property
+    def a_equalities(self):
+        self._flush_equalities()
+        return self._a_equalities
+
+    @a_equalities.setter
+    def a_equalities(self, a):
+        self._flush_equalities()
+        self._a_equalities = a
+        self._matrix_cache = MatrixCache()
+
+    @property
+    def b_equalities(self):
+        self._flush_equalities()
+        return self._b_equalities
+
+    @b_equalities.setter
+    def b_equalities(self, b):
+        self._flush_equalities()
+        self._b_equalities = b
+
+    @property
+    def a_inequalities(self):
+        self._flush_inequalities()
+        return self._a_inequalities
+
+    @a_inequalities.setter
+    def a_inequalities(self, a):
+        self._flush_inequalities()
+        self._a_inequalities = a
+        self._matrix_cache = MatrixCache()
+
+    @property
+    def b_lower(self):
+        self._flush_inequalities()
+        return self._b_lower
+
+    @b_lower.setter
+    def b_lower(self, b):
+        self._flush_inequalities()
+        self._b_lower = b
+
+    @property
+    def b_upper(self):
+        self._flush_inequalities()
+        return self._b_upper
+
+    @b_upper.setter
+    def b_upper(self, b):
+        self._flush_inequalities()
+        self._b_upper = b
+
+    # the vectors with one value per variable are stored in GrowingVector instances
+    # in order to make add_variables_array amortized O(1) per variable
+    @property
+    def upper_bounds(self):
+        return None if self._upper_bounds is None else self._upper_bounds.view()
+
+    @upper_bounds.setter
+    def upper_bounds(self, values):
+        self._upper_bounds = None if values is None else GrowingVector(values)
+
+    @property
+    def lower_bounds(self):
+        return None if self._lower_bounds is None else self._lower_bounds.view()
+
+    @lower_bounds.setter
+    def lower_bounds(self, values):
+        self._lower_bounds = None if values is None else GrowingVector(values)
+
+    @property
+    def costsvector(self):
+        return None if self._costsvector is None else self._costsvector.view()
+
+    @costsvector.setter
+    def costsvector(self, values):
+        self._costsvector = None if values is None else GrowingVector(values)
+
+    @property
+    def is_integer(self):
+        return None if self._is_integer is None else self._is_integer.view()
+
+    @is_integer.setter
+    def is_integer(self, values):
+        self._is_integer = None if values is None else GrowingVector(values)
+
+    def cached_matrix(self, name, kind):
+        """Return a matrix derived from a constraints matrix, computed only once.
+
+        name is "a_equalities", "a_inequalities" or "constraints" for the equalities
+        stacked above the inequalities as in convert_to_all_inequalities. kind is
+        "csr", "csc", "transpose" (csr matrix of the transpose), "gram" (a.T * a as a
+        csr matrix), "row_norms" or "column_norms" (euclidean norms). The result is
+        None if the matrix is None, and is shared so it should not be modified.
+        The cache is invalidated when the constraints or the number of variables
+        change, a matrix modified in place should be assigned again.
+        """
+        if name == "constraints":
+            sources = (self.a_equalities, self.a_inequalities)
+        elif name in ["a_equalities", "a_inequalities"]:
+            sources = (getattr(self, name),)
+        else:
+            raise ValueError(
+                "name %s not valid, available names are a_equalities, a_inequalities"
+                " and constraints" % name
+            )
+        if kind not in _matrix_derivations:
+            raise ValueError(
+                "kind %s not valid, available kinds are %s"
+                % (kind, ", ".join(_matrix_derivations))
+            )
+
+        def compute():
+            if name != "constraints":
+                a = sources[0]
+            elif kind == "csr":
+                matrices = [a for a in sources if a is not None]
+                if len(matrices) == 0:
+                    return None
+                return scipy.sparse.vstack(matrices, format="csr")
+            else:
+                a = self.cached_matrix("constraints", "csr")
+            return None if a is None else _matrix_derivations[kind](a)
+
+        return self._matrix_cache.get((name, kind), sources, compute)
+
     def max_constraint_violation(self, solution):
         types, lb, ub = self.get_variables_bounds()
         max_v = 0
@@ -193,14 +784,11 @@ class SparseLP:
                 max_v, np.max(np.abs(self.a_equalities * solution - self.b_equalities))
             )
         if self.a_inequalities.shape[0] > 0:
+            a_ineq_x = self.a_inequalities * solution
             if self.b_upper is not None:
-                max_v = max(
-                    max_v, np.max(self.a_inequalities * solution - self.b_upper)
-                )
+                max_v = max(max_v, np.max(a_ineq_x - self.b_upper))
             if self.b_lower is not None:
-                max_v = max(
-                    max_v, np.max(self.b_lower - self.a_inequalities * solution)
-                )
+                max_v = max(max_v, np.max(self.b_lower - a_ineq_x))
         return max_v
 
     def check_solution(self, solution, tol=1e-6):
@@ -232,161 +820,309 @@ class SparseLP:
             self.lastNameInequalityStart = self.nb_inequality_constraints()
 
     def nb_equality_constraints(self):
-        return self.a_equalities.shape[0]
+        return self._a_equalities.shape[0] + self._equalities_buffer.nb_rows
 
     def nb_inequality_constraints(self):
-        return self.a_inequalities.shape[0]
+        return self._a_inequalities.shape[0] + self._inequalities_buffer.nb_rows
 
     def end_constraint_name(self, name):
         if not (name is None or name == ""):
             assert self.lastNameStart == name
             if self.nb_equality_constraints() > self.lastNameEqualityStart:
                 self.equalityConstraintNames.append(
-                    {
-                        "name": name,
-                        "start": self.lastNameEqualityStart,
-                        "end": self.nb_equality_constraints() - 1,
-                    }
+                    name, self.lastNameEqualityStart, self.nb_equality_constraints() - 1
                 )
             if self.nb_inequality_constraints() > self.lastNameInequalityStart:
                 self.inequalityConstraintNames.append(
-                    {
-                        "name": name,
-                        "start": self.lastNameInequalityStart,
-                        "end": self.nb_inequality_constraints() - 1,
-                    }
+                    name,
+                    self.lastNameInequalityStart,
+                    self.nb_inequality_constraints() - 1,
                 )
 
     def get_inequality_constraint_name_from_id(self, idv):
-        for d in self.inequalityConstraintNames:
-            if idv >= d["start"] and id <= d["end"]:
-                return d
+        return self.inequalityConstraintNames.from_row(idv)
 
     def get_equality_constraint_name_from_id(self, idv):
-        for d in self.equalityConstraintNames:
-            if idv >= d["start"] and id <= d["end"]:
-                return d
+        return self.equalityConstraintNames.from_row(idv)
+
+    def get_inequality_constraint_names_from_ids(self, ids):
+        """Return the array of the names of the inequality constraints (None if unnamed)."""
+        return self.inequalityConstraintNames.names_from_rows(ids)
+
+    def get_equality_constraint_names_from_ids(self, ids):
+        """Return the array of the names of the equality constraints (None if unnamed)."""
+        return self.equalityConstraintNames.names_from_rows(ids)
 
     def find_inequality_constraints_from_name(self, name):
-        constraints = []
-        for d in self.inequalityConstraintNames:
-            if d["name"] == name:
-                constraints.append(d)
-        return constraints
+        return self.inequalityConstraintNames.from_name(name)
 
     def save(self, filename, force_integer=False):
         self.convertToMosek().save(filename, force_integer=force_integer)
 
-    def save_mps(self, filename):
-        assert self.b_lower is None
-
-        f = open(filename, "w")
-        f.write("NAME  exportedFromPython\n")
-        f.write("ROWS\n")
-        f.write(" N  OBJ\n")
-
-        # for i in range(self.b_equalities.size):
-        # f.write(' E  E%d\n'%i)
-        np.savetxt(f, np.arange(self.b_equalities.size), fmt=" E  E%d", newline="\n")
-
-        # for i in range(self.b_upper.size):
-        # f.write(' L  I%d\n'%i)
-        np.savetxt(f, np.arange(self.b_upper.size), fmt=" L  I%d", newline="\n")
-
-        f.write("COLUMNS\n")
-
-        a_eq = self.a_equalities.tocsc().tocoo()
-        a_ineq = self.a_inequalities.tocsc().tocoo()
-
-        k_eq = 0
-        k_ineq = 0
-        n_eq_entries = len(a_eq.col)
-        n_ineq_entries = len(a_ineq.col)
+    def save_mps(self, filename, compress=None, precision=None, chunk_size=100000):
+        """Save the problem in the MPS format.
+
+        The variables are named X0, X1, ... the equalities E0, E1, ... and the
+        inequalities I0, I1, ... Two-sided inequalities are written using RANGES and
+        integer variables are delimited by markers in the COLUMNS section.
+        The fields are aligned on the columns of the fixed MPS format as long as the
+        names and numbers fit in them, they are otherwise simply separated by spaces
+        as in the free MPS format. The numbers are written exactly using their shortest
+        representation unless a number of significant digits is given with precision.
+        The entries of the matrix are formatted with numpy by chunks of chunk_size
+        lines in column major order and streamed to the file, which is compressed with
+        gzip if compress is True (or a compression level) or if compress is None and
+        the filename ends with ".gz". filename can also be a file opened in binary mode.
+        """
+        self.finalize()
+        a_eq = self.a_equalities
+        a_ineq = self.a_inequalities
+        if a_eq is None:
+            a_eq = scipy.sparse.csr_matrix((0, self.nb_variables))
+        if a_ineq is None:
+            a_ineq = scipy.sparse.csr_matrix((0, self.nb_variables))
+        b_eq = np.empty((0)) if self.b_equalities is None else self.b_equalities
+        nb_eq = a_eq.shape[0]
+        nb_ineq = a_ineq.shape[0]
+        b_upper = np.full(nb_ineq, np.inf) if self.b_upper is None else self.b_upper
+        b_lower = np.full(nb_ineq, -np.inf) if self.b_lower is None else self.b_lower
+
+        # type of each inequality, with the rhs and range that encode its bounds
+        ineq_types = np.full(nb_ineq, ord("L"), dtype=np.uint8)
+        ineq_types[np.isinf(b_upper)] = ord("G")
+        ineq_types[np.isinf(b_upper) & np.isinf(b_lower)] = ord("N")
+        ineq_types[b_lower == b_upper] = ord("E")
+        b_ineq = np.where(np.isinf(b_upper), b_lower, b_upper)
+        b_ineq[np.isinf(b_ineq)] = 0
+        ranged = np.isfinite(b_lower) & np.isfinite(b_upper) & (b_lower < b_upper)
+        ranged = np.nonzero(ranged)[0]
+
+        # rows are numbered with the objective first, then equalities and inequalities
+        eq_names = int_to_chars(np.arange(nb_eq), "E")
+        ineq_names = int_to_chars(np.arange(nb_ineq), "I")
+        row_names = np.full(
+            (1 + nb_eq + nb_ineq, max(eq_names.shape[1], ineq_names.shape[1])),
+            ord(" "),
+            dtype=np.uint8,
+        )
+        row_names[0, :3] = np.frombuffer(b"OBJ", dtype=np.uint8)
+        row_names[1 : 1 + nb_eq, : eq_names.shape[1]] = eq_names
+        row_names[1 + nb_eq :, : ineq_names.shape[1]] = ineq_names
+        row_types = np.hstack(([ord("N")], np.full(nb_eq, ord("E")), ineq_types))
+        rhs = np.hstack(([0], b_eq, b_ineq))
+
+        # column major matrix with the costs as first row, keeping zero costs so that
+        # every variable appears in the COLUMNS section
+        a = self.cached_matrix("constraints", "csc")
+        if a is None:
+            a = scipy.sparse.csc_matrix((0, self.nb_variables))
+        if not a.has_sorted_indices:
+            a = a.sorted_indices()
+        counts = np.diff(a.indptr) + 1
+        indptr = np.hstack(([0], np.cumsum(counts)))
+        is_cost = np.zeros(indptr[-1], dtype=bool)
+        is_cost[indptr[:-1]] = True
+        entries_rows = np.zeros(indptr[-1], dtype=np.int64)
+        entries_rows[~is_cost] = a.indices + 1
+        entries_vals = np.empty(indptr[-1])
+        entries_vals[is_cost] = self.costsvector
+        entries_vals[~is_cost] = a.data
+        entries_cols = np.repeat(np.arange(self.nb_variables), counts)
+
+        if hasattr(filename, "write"):
+            f = filename
+        elif compress or (compress is None and str(filename).endswith(".gz")):
+            # the default level 9 is several times slower for a marginal gain in size
+            compresslevel = 6 if compress is None or compress is True else compress
+            f = gzip.open(filename, "wb", compresslevel=compresslevel)
+        else:
+            f = open(filename, "wb")
 
-        for i in range(self.nb_variables):
-            f.write("    X%-9dOBJ       %f\n" % (i, self.costsvector[i]))
+        f.write(b"NAME          exportedFromPython\n")
+        f.write(b"ROWS\n")
+        write_lines(f, [b" ", row_types[:, None].astype(np.uint8), b"  ", row_names])
 
-            while k_eq < n_eq_entries and a_eq.col[k_eq] == i:
-                f.write("    X%-9dE%-9d%f\n" % (i, a_eq.ruse_preconditioning))
-                k_eq += 1
-            while k_ineq < n_ineq_entries and a_ineq.col[k_ineq] == i:
-                f.write(
-                    "    X%-9dI%-9d%f\n" % (i, a_ineq.row[k_ineq], a_ineq.data[k_ineq])
+        f.write(b"COLUMNS\n")
+        # split the columns in runs of continuous and integer variables
+        is_integer = self.is_integer.astype(bool)
+        runs = np.hstack(
+            ([0], np.nonzero(np.diff(is_integer))[0] + 1, [self.nb_variables])
+        )
+        for run_start, run_end in zip(runs[:-1], runs[1:]):
+            if run_start == run_end:
+                continue
+            if is_integer[run_start]:
+                f.write(b"    MARKER    'MARKER'                 'INTORG'\n")
+            for start in range(indptr[run_start], indptr[run_end], chunk_size):
+                chunk = slice(start, min(start + chunk_size, indptr[run_end]))
+                write_lines(
+                    f,
+                    [
+                        b"    ",
+                        int_to_chars(entries_cols[chunk], "X"),
+                        b"  ",
+                        row_names[entries_rows[chunk]],
+                        b"  ",
+                        float_to_chars(entries_vals[chunk], precision),
+                    ],
                 )
-                k_ineq += 1
+            if is_integer[run_start]:
+                f.write(b"    MARKER    'MARKER'                 'INTEND'\n")
 
-        f.write("RHS\n")
-        np.savetxt(
-            f,
-            np.column_stack((np.arange(a_eq.shape[0]), self.b_equalities)),
-            fmt="    RHS0      E%-9d%f",
-            newline="\n",
-        )
-        np.savetxt(
+        f.write(b"RHS\n")
+        rows = np.nonzero(rhs != 0)[0]
+        write_lines(
             f,
-            np.column_stack((np.arange(a_ineq.shape[0]), self.b_upper)),
-            fmt="    RHS0      I%-9d%f",
-            newline="\n",
+            [
+                b"    RHS       ",
+                row_names[rows],
+                b"  ",
+                float_to_chars(rhs[rows], precision),
+            ],
         )
 
-        f.write("RANGES\n")
-        f.write("BOUNDS\n")
-        integer_indices = np.nonzero(self.is_integer)[0]
-        np.savetxt(
-            f,
-            np.column_stack((integer_indices, self.upper_bounds[integer_indices])),
-            fmt=" UI bound     X%-9d%f",
-            newline="\n",
-        )
-        np.savetxt(
-            f,
-            np.column_stack((integer_indices, self.lower_bounds[integer_indices])),
-            fmt=" LI bound     X%-9d%f",
-            newline="\n",
+        if ranged.size > 0:
+            f.write(b"RANGES\n")
+            write_lines(
+                f,
+                [
+                    b"    RNG       ",
+                    row_names[1 + nb_eq + ranged],
+                    b"  ",
+                    float_to_chars(b_upper[ranged] - b_lower[ranged], precision),
+                ],
+            )
+
+        f.write(b"BOUNDS\n")
+        lower = self.lower_bounds
+        upper = self.upper_bounds
+        fixed = lower == upper
+        free = np.isneginf(lower) & np.isposinf(upper)
+        bounds = [
+            (b"FX", np.nonzero(fixed)[0], lower),
+            (b"FR", np.nonzero(free)[0], None),
+            (b"MI", np.nonzero(np.isneginf(lower) & ~free)[0], None),
+            (b"LO", np.nonzero(np.isfinite(lower) & (lower != 0) & ~fixed)[0], lower),
+            (b"UP", np.nonzero(np.isfinite(upper) & ~fixed)[0], upper),
+            # some readers give integer variables a default upper bound of 1
+            (b"PL", np.nonzero(np.isposinf(upper) & is_integer & ~free)[0], None),
+        ]
+        for bound_type, ids, values in bounds:
+            fields = [b" " + bound_type + b" BND       ", int_to_chars(ids, "X")]
+            if values is not None:
+                fields += [b"  ", float_to_chars(values[ids], precision)]
+            write_lines(f, fields)
+
+        f.write(b"ENDATA\n")
+        if f is not filename:
+            f.close()
+
+    def save_npz(self, filename):
+        """Save the problem in a versioned binary file that can be memory mapped.
+
+        The file is an uncompressed npz archive (the extension .npz is appended if
+        missing) with the csr arrays and blocks of the constraints matrices, the
+        constraints bounds, the bounds, costs and integrality of the variables, the
+        constraint names and variables_dict. Names are saved as strings.
+        Use SparseLP.load to read it back.
+        """
+        self.finalize()
+        arrays = {
+            "format_version": np.array(NPZ_FORMAT_VERSION),
+            "nb_variables": np.array(self.nb_variables),
+        }
+        for key in [
+            "lower_bounds",
+            "upper_bounds",
+            "costsvector",
+            "is_integer",
+            "b_equalities",
+            "b_lower",
+            "b_upper",
+        ]:
+            if getattr(self, key) is not None:
+                arrays[key] = np.asarray(getattr(self, key))
+        for key in ["a_equalities", "a_inequalities"]:
+            a = getattr(self, key)
+            if a is None:
+                continue
+            blocks = getattr(a, "blocks", [])
+            a = a.tocsr()
+            arrays[key + "_data"] = a.data
+            arrays[key + "_indices"] = a.indices
+            arrays[key + "_indptr"] = a.indptr
+            arrays[key + "_shape"] = np.array(a.shape)
+            arrays[key + "_blocks"] = np.array(blocks, dtype=np.int64).reshape(-1, 2)
+        for key, constraint_names in [
+            ("equality_names", self.equalityConstraintNames),
+            ("inequality_names", self.inequalityConstraintNames),
+        ]:
+            arrays[key] = np.array([str(name) for name in constraint_names.names])
+            arrays[key + "_starts"] = constraint_names._starts.view()
+            arrays[key + "_ends"] = constraint_names._ends.view()
+        arrays["variables_names"] = np.array([str(name) for name in self.variables_dict])
+        for i, indices in enumerate(self.variables_dict.values()):
+            arrays["variables_%d" % i] = np.asarray(indices)
+        np.savez(filename, **arrays)
+
+    @classmethod
+    def load(cls, filename, mmap=False):
+        """Load a problem saved with save_npz.
+
+        With mmap=True the arrays are memory mapped in copy-on-write mode instead of
+        being read, so that loading is almost instantaneous whatever the size of the
+        problem and the pages of the file are shared between the processes loading it.
+        """
+        arrays = load_npz(filename, mmap_mode="c" if mmap else None)
+        version = int(arrays["format_version"])
+        if version > NPZ_FORMAT_VERSION:
+            raise ValueError(f"unsupported file format version {version}")
+        lp = cls()
+        lp.nb_variables = int(arrays["nb_variables"])
+        for key in [
+            "lower_bounds",
+            "upper_bounds",
+            "costsvector",
+            "is_integer",
+            "b_equalities",
+            "b_lower",
+            "b_upper",
+        ]:
+            setattr(lp, key, arrays.get(key))
+        for key in ["a_equalities", "a_inequalities"]:
+            if key + "_data" not in arrays:
+                setattr(lp, key, None)
+                continue
+            # set the arrays directly as the csr_matrix constructor would scan them
+            a = empty_csr_matrix()
+            a.data = arrays[key + "_data"]
+            a.indices = arrays[key + "_indices"]
+            a.indptr = arrays[key + "_indptr"]
+            a._shape = tuple(int(n) for n in arrays[key + "_shape"])
+            a.__dict__["blocks"] = [tuple(b) for b in arrays[key + "_blocks"].tolist()]
+            setattr(lp, key, a)
+        lp.equalityConstraintNames = ConstraintNames.from_arrays(
+            arrays["equality_names"].tolist(),
+            arrays["equality_names_starts"],
+            arrays["equality_names_ends"],
         )
-        continuous_indices = np.nonzero(~self.is_integer)[0]
-        np.savetxt(
-            f,
-            np.column_stack(
-                (continuous_indices, self.upper_bounds[continuous_indices])
-            ),
-            fmt=" UP bound     X%-9d%f",
-            newline="\n",
+        lp.inequalityConstraintNames = ConstraintNames.from_arrays(
+            arrays["inequality_names"].tolist(),
+            arrays["inequality_names_starts"],
+            arrays["inequality_names_ends"],
         )
-        np.savetxt(
-            f,
-            np.column_stack(
-                (continuous_indices, self.lower_bounds[continuous_indices])
-            ),
-            fmt=" LO bound     X%-9d%f",
-            newline="\n",
-        )
-
-        f.write("ENDATA\n")
-        f.close()
+        for i, name in enumerate(arrays["variables_names"].tolist()):
+            lp.variables_dict[name] = arrays["variables_%d" % i]
+        return lp
 
-    def save_ian_e_h_yen(self, folder):
+    def _ian_e_h_yen_arrays(self):
         if self.b_lower is not None:
-            print(
-                "self.b_lower is not None, you should convert your problem with convert_to_one_sided_inequality_system first"
+            raise ValueError(
+                "self.b_lower is not None, you should convert your problem with"
+                " convert_to_one_sided_inequality_system first"
             )
-            raise
         if not np.all(self.lower_bounds == 0):
-            print("lower bound constraint on variables should at 0")
-            raise
-
-        import os
-
-        a_eq = self.a_equalities.tocoo()
-        tmp = np.row_stack(
-            (
-                [a_eq.shape[0], a_eq.shape[1], 0.0],
-                np.column_stack((a_eq.row + 1, a_eq.col + 1, a_eq.data)),
-            )
-        )
-        np.savetxt(os.path.join(folder, "a_eq"), tmp, fmt="%d %d %f")
-        np.savetxt(os.path.join(folder, "beq"), self.b_equalities, fmt="%f")
-        np.savetxt(os.path.join(folder, "c"), self.costsvector, fmt="%f")
+            raise ValueError("lower bound constraint on variables should at 0")
         nb_variables = self.costsvector.size
         upper_bounded = np.nonzero(~np.isinf(self.upper_bounds))[0]
         nb_upper_bounded = len(upper_bounded)
@@ -396,20 +1132,109 @@ class SparseLP:
         )
         a_ineq = scipy.sparse.vstack((self.a_inequalities, a_ineq2)).tocoo()
         b_upper = np.hstack((self.b_upper, self.upper_bounds[upper_bounded]))
-        tmp = np.row_stack(
-            (
-                [a_ineq.shape[0], a_ineq.shape[1], 0.0],
-                np.column_stack((a_ineq.row + 1, a_ineq.col + 1, a_ineq.data)),
-            )
-        )
-        np.savetxt(os.path.join(folder, "A"), tmp, fmt="%d %d %f")
-        np.savetxt(os.path.join(folder, "b"), b_upper, fmt="%f")
+        return {
+            "a_eq": self.a_equalities.tocoo(),
+            "beq": self.b_equalities,
+            "c": self.costsvector,
+            "A": a_ineq,
+            "b": b_upper,
+        }
+
+    def save_ian_e_h_yen(self, folder, binary=False, precision=None, chunk_size=100000):
+        """Save the problem in the format of the LPsparse solver of Ian En-Hsu Yen.
+
+        The inequalities should be one-sided (see
+        convert_to_one_sided_inequality_system) and the lower bounds of the variables
+        zero, the finite upper bounds being saved as inequalities. The matrices a_eq and
+        A are saved as a header line with their shape followed by their 1-based
+        coordinates and the vectors beq, c and b with one value per line. The text is
+        formatted by chunks of chunk_size lines with the shortest exact representation
+        of the numbers, unless a number of significant digits is given with precision.
+        With binary=True the files are written with tofile and get the extension .bin,
+        the matrices as the int64 array [nb_rows, nb_cols, nnz] followed by the int64
+        1-based rows and columns and the float64 values, and the vectors as float64.
+        Use SparseLP.load_ian_e_h_yen to read the files back.
+        """
+        arrays = self._ian_e_h_yen_arrays()
+        for name, value in arrays.items():
+            filename = os.path.join(folder, name + (".bin" if binary else ""))
+            with open(filename, "wb") as f:
+                if binary and scipy.sparse.issparse(value):
+                    header = [value.shape[0], value.shape[1], value.nnz]
+                    np.array(header, dtype=np.int64).tofile(f)
+                    (value.row.astype(np.int64) + 1).tofile(f)
+                    (value.col.astype(np.int64) + 1).tofile(f)
+                    value.data.astype(np.float64).tofile(f)
+                elif binary:
+                    np.asarray(value, dtype=np.float64).tofile(f)
+                elif scipy.sparse.issparse(value):
+                    f.write(b"%d %d 0.0\n" % value.shape)
+                    for start in range(0, value.nnz, chunk_size):
+                        chunk = slice(start, start + chunk_size)
+                        fields = [
+                            int_to_chars(value.row[chunk] + 1, width=1),
+                            b" ",
+                            int_to_chars(value.col[chunk] + 1, width=1),
+                            b" ",
+                            float_to_chars(value.data[chunk], precision, width=1),
+                        ]
+                        write_lines(f, fields)
+                else:
+                    for start in range(0, len(value), chunk_size):
+                        chunk = value[start : start + chunk_size]
+                        write_lines(f, [float_to_chars(chunk, precision, width=1)])
 
         with open(os.path.join(folder, "meta"), "w") as f:
-            f.write("nb	%d\n" % nb_variables)
+            f.write("nb	%d\n" % arrays["c"].size)
             f.write("nf	%d\n" % 0)
-            f.write("mI	%d\n" % a_ineq.shape[0])
-            f.write("mE	%d\n" % a_eq.shape[0])
+            f.write("mI	%d\n" % arrays["A"].shape[0])
+            f.write("mE	%d\n" % arrays["a_eq"].shape[0])
+
+    @classmethod
+    def load_ian_e_h_yen(cls, folder):
+        """Load a problem saved with save_ian_e_h_yen, in text or binary format.
+
+        The variables have zero lower bounds and no upper bounds as the upper bounds
+        are part of the inequalities, which are one sided.
+        """
+        binary = os.path.isfile(os.path.join(folder, "c.bin"))
+        arrays = dict()
+        for name in ["a_eq", "beq", "c", "A", "b"]:
+            filename = os.path.join(folder, name + (".bin" if binary else ""))
+            is_matrix = name in ["a_eq", "A"]
+            if binary and is_matrix:
+                with open(filename, "rb") as f:
+                    shape = np.fromfile(f, dtype=np.int64, count=3)
+                    nnz = shape[2]
+                    rows = np.fromfile(f, dtype=np.int64, count=nnz) - 1
+                    cols = np.fromfile(f, dtype=np.int64, count=nnz) - 1
+                    vals = np.fromfile(f, dtype=np.float64, count=nnz)
+            elif binary:
+                arrays[name] = np.fromfile(filename, dtype=np.float64)
+                continue
+            else:
+                with open(filename, "rb") as f:
+                    values = np.array(f.read().split(), dtype=np.float64)
+                if not is_matrix:
+                    arrays[name] = values
+                    continue
+                shape = values[:3].astype(np.int64)
+                rows = values[3::3].astype(np.int64) - 1
+                cols = values[4::3].astype(np.int64) - 1
+                vals = values[5::3]
+            arrays[name] = scipy.sparse.csr_matrix(
+                (vals, (rows, cols)), shape=(shape[0], shape[1])
+            )
+
+        lp = cls()
+        lp.add_variables_bulk(arrays["c"].size, 0, np.inf, costs=arrays["c"])
+        lp.add_equality_constraints_sparse(arrays["a_eq"], arrays["beq"])
+        a_ineq = arrays["A"]
+        a_ineq.__dict__["blocks"] = [(0, a_ineq.shape[0] - 1)]
+        lp.a_inequalities = a_ineq
+        lp.b_upper = arrays["b"]
+        lp.b_lower = None
+        return lp
 
     def get_variables_bounds(self):
         types = None
@@ -428,8 +1253,9 @@ class SparseLP:
         indices = np.arange(nb_variables_added).reshape(shape) + self.nb_variables
         self.nb_variables = self.nb_variables + nb_variables_added
 
-        self.a_inequalities._shape = (self.a_inequalities.shape[0], self.nb_variables)
-        self.a_equalities._shape = (self.a_equalities.shape[0], self.nb_variables)
+        # the buffered blocks get their number of columns fixed when flushed
+        self._a_inequalities._shape = (self._a_inequalities.shape[0], self.nb_variables)
+        self._a_equalities._shape = (self._a_equalities.shape[0], self.nb_variables)
 
         if isinstance(costs, type(0)) or isinstance(costs, type(0.0)):
             v = costs
@@ -443,18 +1269,48 @@ class SparseLP:
         assert np.all(lower_bounds.shape == shape)
         assert np.all(upper_bounds.shape == shape)
 
-        self.upper_bounds = np.append(self.upper_bounds, upper_bounds.ravel())
-        self.lower_bounds = np.append(self.lower_bounds, lower_bounds.ravel())
-        self.costsvector = np.append(self.costsvector, costs.ravel())
-        self.is_integer = np.append(
-            self.is_integer, np.full((nb_variables_added), is_integer, dtype=np.bool)
-        )
+        self._upper_bounds.extend(upper_bounds)
+        self._lower_bounds.extend(lower_bounds)
+        self._costsvector.extend(costs)
+        self._is_integer.extend(np.full((nb_variables_added), is_integer, dtype=bool))
 
         if name:
             self.variables_dict[name] = indices
         self.set_bounds_on_variables(indices, lower_bounds, upper_bounds)
         return indices
 
+    def add_variables_bulk(
+        self,
+        nb_variables,
+        lower_bounds=None,
+        upper_bounds=None,
+        costs=0,
+        is_integer=False,
+        name=None,
+    ):
+        """Add nb_variables variables in a single call.
+
+        Unlike add_variables_array, the bounds, costs and integrality flags can be
+        given either as scalars or as 1D arrays of size nb_variables.
+        Return the 1D array of indices of the new variables.
+        """
+        indices = np.arange(self.nb_variables, self.nb_variables + nb_variables)
+        if lower_bounds is None:
+            lower_bounds = -np.inf
+        if upper_bounds is None:
+            upper_bounds = np.inf
+        shape = (nb_variables,)
+        self._lower_bounds.extend(np.broadcast_to(lower_bounds, shape))
+        self._upper_bounds.extend(np.broadcast_to(upper_bounds, shape))
+        self._costsvector.extend(np.broadcast_to(costs, shape))
+        self._is_integer.extend(np.broadcast_to(is_integer, shape))
+        self.nb_variables += nb_variables
+        self._a_inequalities._shape = (self._a_inequalities.shape[0], self.nb_variables)
+        self._a_equalities._shape = (self._a_equalities.shape[0], self.nb_variables)
+        if name:
+            self.variables_dict[name] = indices
+        return indices
+
     def convert_bounds_to_vectors(self, shape, lower_bounds, upper_bounds):
 
         if (
@@ -509,8 +1365,8 @@ class SparseLP:
         self.costsvector[indices.ravel()] = costs.ravel()
 
     def add_equality_constraints_sparse(self, a, b):
-        csr_matrix_append_rows(self.a_equalities, a.tocsr())
-        self.b_equalities = np.append(self.b_equalities, b)
+        b = np.broadcast_to(b, (a.shape[0],))
+        self._equalities_buffer.append(a.tocsr(copy=True), b)
 
     def add_inequality_constraints_sparse(
         self, a, lower_bounds=None, upper_bounds=None
@@ -525,16 +1381,117 @@ class SparseLP:
             lower_bounds, upper_bounds = self.convert_bounds_to_vectors(
                 (a.shape[0],), lower_bounds, upper_bounds
             )
-            csr_matrix_append_rows(self.a_equalities, a.tocsr())
-            self.b_equalities = np.append(self.b_equalities, lower_bounds)
+            self._equalities_buffer.append(a.tocsr(copy=True), lower_bounds)
 
         else:
             lower_bounds, upper_bounds = self.convert_bounds_to_vectors(
                 (a.shape[0],), lower_bounds, upper_bounds
             )
-            csr_matrix_append_rows(self.a_inequalities, a.tocsr())
-            self.b_lower = np.append(self.b_lower, lower_bounds)
-            self.b_upper = np.append(self.b_upper, upper_bounds)
+            self._inequalities_buffer.append(
+                a.tocsr(copy=True), lower_bounds, upper_bounds
+            )
+
+    def add_constraints_coo(
+        self, rows, cols, vals, lower_bounds=None, upper_bounds=None, nb_rows=None
+    ):
+        """Add the constraints lower_bounds[i] <= y[i] <= upper_bounds[i] given in coordinate format.
+
+        with y[i] = sum_{k | rows[k]=i} vals[k]*x[cols[k]]
+        The rows can have different numbers of non zeros and duplicated (row, col)
+        entries are summed. The csr matrix is built using a single sort of the triplets.
+        The number of rows is taken from nb_rows, or from the size of the bounds
+        if they are arrays, or from the largest row index.
+        """
+        rows = np.asarray(rows).ravel()
+        cols = np.asarray(cols).ravel()
+        vals = np.broadcast_to(vals, rows.shape)
+        assert cols.size == rows.size
+        if nb_rows is None:
+            for b in (lower_bounds, upper_bounds):
+                if b is not None and np.ndim(b) > 0:
+                    nb_rows = np.size(b)
+                    break
+            else:
+                nb_rows = np.max(rows) + 1 if rows.size > 0 else 0
+        assert rows.size == 0 or (np.min(rows) >= 0 and np.max(rows) < nb_rows)
+        assert cols.size == 0 or (np.min(cols) >= 0 and np.max(cols) < self.nb_variables)
+        a = scipy.sparse.coo_matrix(
+            (vals, (rows, cols)), shape=(nb_rows, self.nb_variables)
+        ).tocsr()
+        a.sum_duplicates()
+        if lower_bounds is not None and np.ndim(lower_bounds) == 0:
+            if np.all(lower_bounds == upper_bounds):
+                self.add_equality_constraints_sparse(a, lower_bounds)
+                return
+        lower_bounds, upper_bounds = [
+            None if b is None else np.broadcast_to(np.ravel(b), (nb_rows,)).astype(float)
+            for b in (lower_bounds, upper_bounds)
+        ]
+        self.add_inequality_constraints_sparse(
+            a, lower_bounds=lower_bounds, upper_bounds=upper_bounds
+        )
+
+    def expr(self, indices):
+        """Return the affine expression with value x[indices] that has the shape of indices.
+
+        Expressions can be scaled by arrays, added, subtracted, indexed and summed
+        along axes with numpy broadcasting rules, for example
+        lp.expr(ids1) * w - lp.expr(ids2[:, None]) or lp.expr(ids).sum(axis=1),
+        and then added to the problem as a single batch of constraints with add_constraints.
+        """
+        return AffineExpression.from_indices(indices)
+
+    def add_constraints(self, expression, lower_bounds=None, upper_bounds=None):
+        """Add the constraints lower_bounds <= expression <= upper_bounds.
+
+        The bounds are broadcasted to the shape of the expression and all the
+        constraints are added as a single block of rows, in the flattened order
+        of the expression. Repeated variables in an element are summed.
+        """
+        index_dtype = np.int32 if self.nb_variables < 2 ** 31 else np.int64
+        cols, vals, constant = expression.compile(index_dtype)
+        nb_rows, nb_cols = cols.shape
+        if cols.size > 0 and (cols.min() < 0 or cols.max() >= self.nb_variables):
+            unvalid = np.unique(cols[(cols < 0) | (cols >= self.nb_variables)])
+            raise ValueError(
+                f"variable indices out of range [0, {self.nb_variables}) in "
+                f"constraints: {unvalid}"
+            )
+        if rows_with_duplicates(cols).size > 0:
+            rows = np.repeat(np.arange(nb_rows), cols.shape[1])
+            a = scipy.sparse.coo_matrix(
+                (vals.ravel(), (rows, cols.ravel())), shape=(nb_rows, self.nb_variables)
+            ).tocsr()
+            a.sum_duplicates()
+            a.eliminate_zeros()
+        elif np.all(vals):
+            # same number of non zeros in each row, the stacked arrays are used as is
+            nnz = nb_rows * nb_cols
+            indptr_dtype = index_dtype if nnz < 2 ** 31 else np.int64
+            indptr = np.arange(0, nnz + 1, nb_cols, dtype=indptr_dtype)
+            a = scipy.sparse.csr_matrix(
+                (vals.ravel(), cols.ravel(), indptr), shape=(nb_rows, self.nb_variables)
+            )
+        else:
+            keep = vals != 0
+            indptr = np.hstack(([0], np.cumsum(np.sum(keep, axis=1))))
+            a = scipy.sparse.csr_matrix(
+                (vals[keep], cols[keep], indptr), shape=(nb_rows, self.nb_variables)
+            )
+
+        def shift_bounds(b):
+            if b is None:
+                return None
+            if np.ndim(b) == 0 and np.all(constant == constant[:1]):
+                # keep scalar bounds scalar so that equalities are detected
+                return float(b) - (constant[0] if nb_rows > 0 else 0.0)
+            return np.broadcast_to(b, expression.shape).ravel() - constant
+
+        self.add_inequality_constraints_sparse(
+            a,
+            lower_bounds=shift_bounds(lower_bounds),
+            upper_bounds=shift_bounds(upper_bounds),
+        )
 
     def add_equality_constraints(self, cols, vals, b):
         """Add a set of equalities to the problem in the form
@@ -581,7 +1538,7 @@ class SparseLP:
         this is done by adding auxiliary variables.
         """
         if np.all(coef_penalization == np.inf):
-            a = crd_matrix(cols, vals)
+            a = crd_matrix(cols, vals, validate=self.validate_constraints)
             self.add_inequality_constraints_sparse(
                 a, lower_bounds=lower_bounds, upper_bounds=upper_bounds
             )
@@ -841,22 +1798,17 @@ class SparseLP:
             mapping_lower = np.hstack(([0], np.cumsum(self.b_lower != np.inf)))
             if len(idskeep_lower) > 0 and len(idskeep_upper) > 0:
 
-                new_inequality_constraint_names = []
+                new_inequality_constraint_names = ConstraintNames()
                 for d in self.inequalityConstraintNames:
-                    d = {
-                        "name": d["name"],
-                        "start": mapping_upper[d["start"]],
-                        "end": mapping_upper[d["end"]],
-                    }
-                    new_inequality_constraint_names.append(d)
+                    new_inequality_constraint_names.append(
+                        d["name"], mapping_upper[d["start"]], mapping_upper[d["end"]]
+                    )
                 for d in self.inequalityConstraintNames:
-
-                    d = {
-                        "name": d["name"],
-                        "start": idskeep_upper.size + mapping_lower[d["start"]],
-                        "end": idskeep_upper.size + mapping_lower[d["end"]],
-                    }
-                    new_inequality_constraint_names.append(d)
+                    new_inequality_constraint_names.append(
+                        d["name"],
+                        idskeep_upper.size + mapping_lower[d["start"]],
+                        idskeep_upper.size + mapping_lower[d["end"]],
+                    )
 
                 self.inequalityConstraintNames = new_inequality_constraint_names
                 self.a_inequalities = scipy.sparse.vstack(
@@ -887,19 +1839,17 @@ class SparseLP:
             if self.b_upper is None:
                 self.b_upper = np.full((self.a_inequalities.shape[0]), np.inf)
 
-            new_inequality_constraint_names = []
-            for d in self.equalityConstraintNames:
-                new_inequality_constraint_names.append(d)
+            new_inequality_constraint_names = ConstraintNames(
+                self.equalityConstraintNames
+            )
             for d in self.inequalityConstraintNames:
-
-                d = {
-                    "name": d["name"],
-                    "start": self.a_equalities.shape[0] + d["start"],
-                    "end": self.a_equalities.shape[0] + d["end"],
-                }
-                new_inequality_constraint_names.append(d)
+                new_inequality_constraint_names.append(
+                    d["name"],
+                    self.a_equalities.shape[0] + d["start"],
+                    self.a_equalities.shape[0] + d["end"],
+                )
             self.inequalityConstraintNames = new_inequality_constraint_names
-            self.equalityConstraintNames = []
+            self.equalityConstraintNames = ConstraintNames()
 
             self.a_inequalities = scipy.sparse.vstack(
                 (self.a_equalities, self.a_inequalities)
@@ -999,7 +1949,56 @@ class SparseLP:
         plot_solution=None,
         ground_truth=None,
         ground_truth_indices=None,
+        tol_primal=None,
+        tol_dual=None,
+        tol_gap=None,
+        record_trace=False,
+        metrics_policy=None,
+        nb_threads=1,
     ):
+        """Solve the LP with the given method.
+
+        The iterative methods chambolle_pock_ppd, pdhg_restarted, admm, admm2,
+        admm_blocks and dual_gradient_ascent stop before nb_iter iterations once the
+        residuals they evaluate every nb_iter_plot iterations are below all the
+        tolerances tol_primal (constraints violation), tol_dual (dual residual) and
+        tol_gap (relative gap between the primal energy and the lagrangian) that are
+        not None. For chambolle_pock_ppd and pdhg_restarted the gap is measured to the
+        best lagrangian lower bound found during the iterations, which is stored in
+        result.lower_bound. pdhg_restarted is a primal-dual hybrid gradient with
+        adaptive steps, restarts and primal weight updates as in PDLP.
+
+        Return a SolveResult with the solution and the convergence history, which
+        also unpacks as (x, elapsed), or only x if get_timing is False. The progress
+        is reported through the logging module at the INFO level. The durations
+        of the phases of the solve are available in result.timings and the
+        operations counts in result.operations. If record_trace is True the nested
+        spans of the phases are also recorded and can be saved with
+        result.save_chrome_trace.
+
+        The constraints violation and the distance to the ground truth stored in the
+        history are evaluated at the progress reports selected by metrics_policy, a
+        tools.MetricsPolicy that defaults to evaluating them at each report, and are
+        nan for the other reports.
+
+        The methods chambolle_pock_ppd, pdhg_restarted, admm and dual_gradient_ascent
+        split the products with the constraints matrices over nb_threads threads.
+        """
+        result = SolveResult(
+            method,
+            capacity=nb_iter / max(nb_iter_plot, 1) + 2,
+            record_events=record_trace,
+        )
+        profiler = result.profiler
+        profiler.start("preprocessing")
+        if metrics_policy is None:
+            metrics_policy = MetricsPolicy()
+        metrics_policy.reset()
+        # the violations reported by the primal-dual methods are computed on the
+        # reduced problem, whose iterates stay within the bounds, and are those of the
+        # lp
+        violations_from_solver = method in ["chambolle_pock_ppd", "pdhg_restarted"]
+        self.finalize()
 
         if not (self.a_inequalities is None) and self.a_inequalities.shape[0] > 0:
             check_csr_matrix(self.a_inequalities)
@@ -1013,53 +2012,63 @@ class SparseLP:
             a_eq = None
             b_eq = None
 
-        start = time.clock()
+        start = time.perf_counter()
+        user_callback_func = callback_func
 
-        self.distance_to_ground_truth = []
-        self.distanceToGroundTruthAfterRounding = []
-        self.opttime_curve = []
-        self.dopttime_curve = []
-        self.pobj_curve = []
-        self.dobj_curve = []
-        self.pobjbound = []
-        self.max_violated_inequality = []
-        self.max_violated_equality = []
-        self.max_violated_constraint = []
-        self.itrn_curve = []
-
-        def scipy_call_back(solution, **kwargs):
-            if ground_truth is not None:
-                self.distance_to_ground_truth.append(
-                    np.mean(np.abs(ground_truth - solution["x"][ground_truth_indices]))
-                )
-                self.distanceToGroundTruthAfterRounding.append(
-                    np.mean(
-                        np.abs(
-                            ground_truth - np.round(solution["x"][ground_truth_indices])
-                        )
+        def record(
+            niter,
+            solution,
+            duration,
+            energy1=np.nan,
+            energy2=np.nan,
+            max_violated_equality=np.nan,
+            max_violated_inequality=np.nan,
+            max_violated_constraint=None,
+        ):
+            distance = np.nan
+            distance_after_rounding = np.nan
+            if metrics_policy.should_evaluate(niter, duration):
+                profiler.start("metrics")
+                metrics_start = time.perf_counter()
+                if ground_truth is not None:
+                    distance = np.mean(
+                        np.abs(ground_truth - solution[ground_truth_indices])
                     )
-                )
-            duration = time.clock() - start
-            self.opttime_curve.append(duration)
-            self.pobj_curve.append(self.costsvector.dot(solution["x"].T))
-            maxv = self.max_constraint_violation(solution["x"])
-            self.max_violated_constraint.append(maxv)
-
-        def simplex_call_back(solution, **kwargs):
-            if ground_truth is not None:
-                self.distance_to_ground_truth.append(
-                    np.mean(np.abs(ground_truth - solution[ground_truth_indices]))
-                )
-                self.distanceToGroundTruthAfterRounding.append(
-                    np.mean(
+                    distance_after_rounding = np.mean(
                         np.abs(ground_truth - np.round(solution[ground_truth_indices]))
                     )
+                if max_violated_constraint is None:
+                    max_violated_constraint = self.max_constraint_violation(solution)
+                metrics_policy.evaluated(
+                    niter, duration, time.perf_counter() - metrics_start
                 )
-            duration = time.clock() - start
-            self.opttime_curve.append(duration)
-            self.pobj_curve.append(self.costsvector.dot(solution.T))
-            maxv = self.max_constraint_violation(solution)
-            self.max_violated_constraint.append(maxv)
+                profiler.stop("metrics")
+            elif max_violated_constraint is None:
+                max_violated_constraint = np.nan
+            result.record(
+                niter,
+                duration,
+                energy1,
+                energy2,
+                max_violated_equality,
+                max_violated_inequality,
+                max_violated_constraint,
+                distance,
+                distance_after_rounding,
+            )
+
+        def scipy_call_back(solution, **kwargs):
+            profiler.start("callback")
+            duration = time.perf_counter() - start
+            x = solution["x"]
+            record(solution["nit"], x, duration, self.costsvector.dot(x))
+            profiler.stop("callback")
+
+        def simplex_call_back(solution, niter=0, **kwargs):
+            profiler.start("callback")
+            duration = time.perf_counter() - start
+            record(niter, solution, duration, self.costsvector.dot(solution))
+            profiler.stop("callback")
 
         def callback_func(
             niter,
@@ -1071,42 +2080,48 @@ class SparseLP:
             max_violated_inequality,
             is_active_variable=None,
         ):
-            if ground_truth is not None:
-                self.distance_to_ground_truth.append(
-                    np.mean(np.abs(ground_truth - solution[ground_truth_indices]))
-                )
-                self.distanceToGroundTruthAfterRounding.append(
-                    np.mean(
-                        np.abs(ground_truth - np.round(solution[ground_truth_indices]))
-                    )
-                )
-            self.itrn_curve.append(niter)
-            self.opttime_curve.append(duration)
-            self.dopttime_curve.append(duration)
-            self.dobj_curve.append(energy2)
-            self.pobj_curve.append(energy1)
-            maxv = self.max_constraint_violation(solution)
-            self.max_violated_constraint.append(maxv)
-            self.max_violated_equality.append(max_violated_equality)
-            self.max_violated_inequality.append(max_violated_inequality)
+            profiler.start("callback")
+            record(
+                niter,
+                solution,
+                duration,
+                energy1,
+                energy2,
+                max_violated_equality,
+                max_violated_inequality,
+                max(0, max_violated_equality, max_violated_inequality)
+                if violations_from_solver
+                else None,
+            )
             if plot_solution is not None:
                 plot_solution(niter, solution, is_active_variable=is_active_variable)
+            if user_callback_func is not None:
+                user_callback_func(
+                    niter,
+                    solution,
+                    energy1,
+                    energy2,
+                    duration,
+                    max_violated_equality,
+                    max_violated_inequality,
+                )
+            profiler.stop("callback")
 
+        profiler.stop("preprocessing")
         if method not in solving_methods:
-            print("method %s not valid" % method)
-            print("avalaible method are")
-            for vmethod in solving_methods:
-                print(vmethod)
-            raise
+            raise ValueError(
+                "method %s not valid, available methods are %s"
+                % (method, ", ".join(solving_methods))
+            )
         if method in ["scipy_simplex", "scipy_interior_point"]:
 
             if not (self.b_lower is None) and not (
                 np.all(np.isinf(self.b_lower) & (self.b_lower < 0))
             ):
-                print(
-                    "you need to convert your lp to a one side inequality system using convert_to_one_sided_inequality_system"
+                raise ValueError(
+                    "you need to convert your lp to a one side inequality system using"
+                    " convert_to_one_sided_inequality_system"
                 )
-                raise
             if a_eq is None:
                 a_eq = None
                 b_eq = None
@@ -1130,40 +2145,46 @@ class SparseLP:
             # if not sol['success']:
             # raise BaseException(sol['message'])
             x = sol["x"]
+            result.status = "converged" if sol["success"] else "failed"
+            result.nb_iterations = sol["nit"]
 
         elif method == "mehrotra":
-
+            profiler.start("preprocessing")
             lp_slack = copy.deepcopy(self)
+            profiler.start("conversion")
             (
                 m_change1,
                 shift1,
             ) = lp_slack.remove_fixed_variables()  # removed fixed variables
             m_change2, shift2 = lp_slack.convert_to_slack_form()
+            profiler.stop("conversion")
+            profiler.stop("preprocessing")
 
             def mehrotra_call_back(solution, niter, **kwargs):
                 x = m_change2 * solution - shift2
                 x = m_change1 * x - shift1
-                self.itrn_curve.append(niter)
-                simplex_call_back(x)
+                simplex_call_back(x, niter)
 
             f, x, y, s, n = mpc_sol(
                 lp_slack.a_equalities,
                 lp_slack.b_equalities,
                 lp_slack.costsvector,
                 callback=mehrotra_call_back,
+                verbose=2 if logger.isEnabledFor(logging.INFO) else 0,
+                profiler=profiler,
             )
-            lp_slack.check_solution(x)
             x = m_change2 * x - shift2
             x = m_change1 * x - shift1
-            self.check_solution(x)
-            self.max_constraint_violation(x)
+            result.status = "converged" if self.check_solution(x) else "failed"
+            result.nb_iterations = n
 
         elif method == "CVXOPT":
 
             prob, x = self.convert_to_cvxpy()
             # The optimal objective is returned by prob.solve().
-            result = prob.solve(verbose=True, solver=cvxpy.CVXOPT)
+            prob.solve(verbose=logger.isEnabledFor(logging.INFO), solver=cvxpy.CVXOPT)
             x = np.array(x.value).flatten()
+            result.status = "converged" if prob.status == "optimal" else "failed"
 
             # from cvxopt import matrix, solvers
             # the format axcpt
@@ -1179,19 +2200,24 @@ class SparseLP:
         elif method == "SCS":
             prob, x = self.convert_to_cvxpy()
             # The optimal objective is returned by prob.solve().
-            result = prob.solve(
-                verbose=True, solver=cvxpy.SCS, max_iters=10000, eps=1e-5
+            prob.solve(
+                verbose=logger.isEnabledFor(logging.INFO),
+                solver=cvxpy.SCS,
+                max_iters=10000,
+                eps=1e-5,
             )
             x = np.array(x.value).flatten()
+            result.status = "converged" if prob.status == "optimal" else "failed"
 
         elif method == "ECOS":
             prob, x = self.convert_to_cvxpy()
             # The optimal objective is returned by prob.solve().
-            result = prob.solve(verbose=True, solver=cvxpy.ECOS)
-            x = np.array(result).flatten()
+            prob.solve(verbose=logger.isEnabledFor(logging.INFO), solver=cvxpy.ECOS)
+            x = np.array(x.value).flatten()
+            result.status = "converged" if prob.status == "optimal" else "failed"
 
         elif method == "admm":
-            x = lp_admm(
+            x, result.status = lp_admm(
                 self.costsvector,
                 a_eq,
                 b_eq,
@@ -1205,10 +2231,15 @@ class SparseLP:
                 callback_func=callback_func,
                 max_time=max_time,
                 nb_iter_plot=nb_iter_plot,
+                tol_primal=tol_primal,
+                tol_dual=tol_dual,
+                tol_gap=tol_gap,
+                profiler=profiler,
+                nb_threads=nb_threads,
             )
 
         elif method == "admm_blocks":
-            x = lp_admm_block_decomposition(
+            x, result.status = lp_admm_block_decomposition(
                 self.costsvector,
                 a_eq,
                 b_eq,
@@ -1222,9 +2253,13 @@ class SparseLP:
                 x0=x0,
                 callback_func=callback_func,
                 max_time=max_time,
+                tol_primal=tol_primal,
+                tol_dual=tol_dual,
+                tol_gap=tol_gap,
+                profiler=profiler,
             )
         elif method == "admm2":
-            x = lp_admm2(
+            x, result.status = lp_admm2(
                 self.costsvector,
                 a_eq,
                 b_eq,
@@ -1238,14 +2273,22 @@ class SparseLP:
                 callback_func=callback_func,
                 max_time=max_time,
                 nb_iter_plot=nb_iter_plot,
+                tol_primal=tol_primal,
+                tol_dual=tol_dual,
+                tol_gap=tol_gap,
+                profiler=profiler,
             )
 
         elif method == "chambolle_pock_ppd":
+            profiler.start("preprocessing")
             lp_reduced = copy.deepcopy(self)
+            profiler.start("conversion")
             (
                 m_change1,
                 shift1,
             ) = lp_reduced.remove_fixed_variables()  # removed fixed variables
+            profiler.stop("conversion")
+            profiler.stop("preprocessing")
 
             def this_back(
                 niter,
@@ -1267,7 +2310,12 @@ class SparseLP:
                     max_violated_inequality,
                 )
 
-            x, best_integer_solution = chambolle_pock_ppd(
+            (
+                x,
+                best_integer_solution,
+                lower_bound,
+                result.status,
+            ) = chambolle_pock_ppd(
                 lp_reduced.costsvector,
                 lp_reduced.a_equalities,
                 lp_reduced.b_equalities,
@@ -1284,11 +2332,56 @@ class SparseLP:
                 max_time=max_time,
                 save_problem=False,
                 nb_iter_plot=nb_iter_plot,
+                tol_primal=tol_primal,
+                tol_dual=tol_dual,
+                tol_gap=tol_gap,
+                profiler=profiler,
+                nb_threads=nb_threads,
             )
             x = m_change1 * x - shift1
+            # the removed variables add a constant to the objective
+            result.lower_bound = lower_bound + self.costsvector.dot(shift1)
+
+        elif method == "pdhg_restarted":
+            profiler.start("preprocessing")
+            lp_reduced = copy.deepcopy(self)
+            profiler.start("conversion")
+            m_change1, shift1 = lp_reduced.remove_fixed_variables()
+            profiler.stop("conversion")
+            profiler.stop("preprocessing")
+
+            def this_back(niter, solution, *args):
+                callback_func(niter, m_change1 * solution - shift1, *args)
+
+            x, lower_bound, result.status = pdhg_restarted(
+                lp_reduced.costsvector,
+                lp_reduced.a_equalities,
+                lp_reduced.b_equalities,
+                lp_reduced.a_inequalities,
+                lp_reduced.b_lower,
+                lp_reduced.b_upper,
+                lp_reduced.lower_bounds,
+                lp_reduced.upper_bounds,
+                nb_max_iter=nb_iter,
+                callback_func=this_back,
+                max_time=max_time,
+                nb_iter_plot=nb_iter_plot,
+                tol_primal=tol_primal,
+                tol_dual=tol_dual,
+                tol_gap=tol_gap,
+                profiler=profiler,
+                nb_threads=nb_threads,
+            )
+            x = m_change1 * x - shift1
+            result.lower_bound = lower_bound + self.costsvector.dot(shift1)
 
         elif method == "dual_gradient_ascent":
-            x, y_eq, y_ineq = dual_gradient_ascent(
+            (
+                x,
+                result.y_eq,
+                result.y_ineq,
+                result.status,
+            ) = dual_gradient_ascent(
                 x=x0,
                 lp=self,
                 nb_max_iter=nb_iter,
@@ -1297,13 +2390,22 @@ class SparseLP:
                 y_ineq=None,
                 max_time=max_time,
                 nb_iter_plot=nb_iter_plot,
+                tol_primal=tol_primal,
+                tol_dual=tol_dual,
+                tol_gap=tol_gap,
+                profiler=profiler,
+                nb_threads=nb_threads,
             )
         elif method == "dual_coordinate_ascent":
+            profiler.start("preprocessing")
             lp_reduced = copy.deepcopy(self)
+            profiler.start("conversion")
             (
                 m_change1,
                 shift1,
             ) = lp_reduced.remove_fixed_variables()  # removed fixed variables
+            profiler.stop("conversion")
+            profiler.stop("preprocessing")
 
             def this_back(
                 niter,
@@ -1325,7 +2427,12 @@ class SparseLP:
                     max_violated_inequality,
                 )
 
-            x, y_eq, y_ineq = dual_coordinate_ascent(
+            (
+                x,
+                result.y_eq,
+                result.y_ineq,
+                result.status,
+            ) = dual_coordinate_ascent(
                 x=None,
                 lp=lp_reduced,
                 nb_max_iter=nb_iter,
@@ -1334,20 +2441,25 @@ class SparseLP:
                 y_ineq=None,
                 max_time=max_time,
                 nb_iter_plot=nb_iter_plot,
+                profiler=profiler,
             )
             x = m_change1 * x - shift1
 
         elif method == "osqp":
+            profiler.start("preprocessing")
             lp_osqp_form = copy.deepcopy(self)
+            profiler.start("conversion")
             lp_osqp_form.convert_to_all_inequalities_without_bounds()
+            profiler.stop("conversion")
             b_lower = lp_osqp_form.b_lower
             b_lower = np.maximum(-1000, b_lower)
             b_upper = lp_osqp_form.b_upper
             b_upper = np.minimum(1000, b_upper)
             p = scipy.sparse.csc_matrix((self.nb_variables, self.nb_variables))
+            profiler.stop("preprocessing")
 
             opts = {
-                "verbose": True,
+                "verbose": logger.isEnabledFor(logging.INFO),
                 "eps_abs": 1e-09,
                 "eps_rel": 1e-09,
                 "max_iter": nb_iter,
@@ -1369,15 +2481,46 @@ class SparseLP:
             )
             res = model.solve()
             x = res.x
-            simplex_call_back(x)
-            self.itrn_curve = [res.info.iter]
+            simplex_call_back(x, res.info.iter)
+            result.status = "converged" if res.info.status == "solved" else "failed"
+            result.nb_iterations = res.info.iter
 
         else:
-            print("unkown LP solver method " + method)
-            raise
-        elapsed = time.clock() - start
+            raise ValueError("unkown LP solver method " + method)
+        result.elapsed = time.perf_counter() - start
+        profiler.start("postprocessing")
+        result.x = x
+        history = result.history
+        if result.nb_iterations is None:
+            if result.status == "max_iter":
+                result.nb_iterations = nb_iter
+            elif len(history) > 0:
+                result.nb_iterations = int(history["iteration"][-1])
+            else:
+                result.nb_iterations = 0
+
+        # curves stored on the instance by previous versions
+        self.itrn_curve = history["iteration"].tolist()
+        self.opttime_curve = history["duration"].tolist()
+        self.dopttime_curve = self.opttime_curve
+        self.pobj_curve = history["energy1"].tolist()
+        self.dobj_curve = history["energy2"].tolist()
+        self.pobjbound = []
+        self.max_violated_equality = history["max_violated_equality"].tolist()
+        self.max_violated_inequality = history["max_violated_inequality"].tolist()
+        self.max_violated_constraint = history["max_violated_constraint"].tolist()
+        if ground_truth is not None:
+            self.distance_to_ground_truth = history["distance_to_ground_truth"].tolist()
+            self.distanceToGroundTruthAfterRounding = history[
+                "distance_to_ground_truth_after_rounding"
+            ].tolist()
+        else:
+            self.distance_to_ground_truth = []
+            self.distanceToGroundTruthAfterRounding = []
+        self.lower_bound = result.lower_bound
+        profiler.stop("postprocessing")
 
         if get_timing:
-            return x, elapsed
+            return result
         else:
             return x
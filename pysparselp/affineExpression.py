@@ -0,0 +1,154 @@
+"""Vectorized affine expressions over arrays of variable indices."""
+
+import numpy as np
+
+
+def _broadcast_shape(shape1, shape2):
+    # np.broadcast_shapes requires numpy>=1.20, zero strided views cost nothing
+    dummy = np.empty((), dtype=bool)
+    return np.broadcast(
+        np.broadcast_to(dummy, shape1), np.broadcast_to(dummy, shape2)
+    ).shape
+
+
+class AffineExpression:
+    """Array of affine expressions of the LP variables.
+
+    Each element of the array is given by
+    e[i] = constant[i] + sum_t sum_k vals_t[i, k] * x[cols_t[i, k]]
+    where each term (cols_t, vals_t) is stored with arrays that are broadcastable
+    to shape + (w_t,), w_t being the number of variables the term adds to each element.
+    The expressions combine using numpy broadcasting rules and the arrays are only
+    broadcasted when the expression is compiled into a single batch of sparse rows,
+    so that adding a scalar weighted array of indices does not allocate anything.
+    Expressions are usually created with SparseLP.expr.
+    """
+
+    __array_ufunc__ = None  # make numpy defer to our reflected operators
+
+    def __init__(self, terms, constant, shape):
+        self.terms = terms
+        self.constant = constant
+        self.shape = tuple(shape)
+
+    @classmethod
+    def from_indices(cls, indices):
+        indices = np.asarray(indices)
+        assert np.issubdtype(indices.dtype, np.integer)
+        return cls([(indices[..., None], np.ones(1))], 0.0, indices.shape)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __repr__(self):
+        """Return a short description with the shape and number of terms."""
+        return "AffineExpression(shape=%s, nb_terms=%d)" % (self.shape, len(self.terms))
+
+    def __add__(self, other):
+        """Add an expression, a scalar or an array of constants."""
+        if isinstance(other, AffineExpression):
+            terms = self.terms + other.terms
+            constant = self.constant + other.constant
+            shape = _broadcast_shape(self.shape, other.shape)
+        else:
+            other = np.asarray(other, dtype=np.float64)
+            terms = self.terms
+            constant = self.constant + other
+            shape = _broadcast_shape(self.shape, other.shape)
+        return AffineExpression(terms, constant, shape)
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        """Negate the expression."""
+        return self * -1.0
+
+    def __sub__(self, other):
+        """Subtract an expression, a scalar or an array of constants."""
+        return self + (-other)
+
+    def __rsub__(self, other):
+        """Subtract the expression from a scalar or an array of constants."""
+        return (-self) + other
+
+    def __mul__(self, other):
+        """Multiply the expression by a scalar or an array of coefficients."""
+        if isinstance(other, AffineExpression):
+            raise TypeError("the product of two expressions is not affine")
+        other = np.asarray(other, dtype=np.float64)
+        terms = [(cols, vals * other[..., None]) for cols, vals in self.terms]
+        constant = self.constant * other
+        shape = _broadcast_shape(self.shape, other.shape)
+        return AffineExpression(terms, constant, shape)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        """Divide the expression by a scalar or an array of coefficients."""
+        return self * (1.0 / np.asarray(other, dtype=np.float64))
+
+    def _broadcasted_terms(self):
+        for cols, vals in self.terms:
+            width = max(cols.shape[-1], vals.shape[-1])
+            full_shape = self.shape + (width,)
+            yield np.broadcast_to(cols, full_shape), np.broadcast_to(vals, full_shape)
+
+    def __getitem__(self, key):
+        """Select a sub-array of expressions with numpy indexing."""
+        if not isinstance(key, tuple):
+            key = (key,)
+        terms = [
+            (cols[key + (slice(None),)], vals[key + (slice(None),)])
+            for cols, vals in self._broadcasted_terms()
+        ]
+        constant = np.broadcast_to(self.constant, self.shape)[key]
+        return AffineExpression(terms, constant, constant.shape)
+
+    def sum(self, axis=None):  # noqa: A003
+        """Sum the expressions along the given axis (or all of them if axis is None)."""
+        if axis is None:
+            terms = [
+                (cols.reshape(-1), vals.reshape(-1))
+                for cols, vals in self._broadcasted_terms()
+            ]
+            constant = np.sum(np.broadcast_to(self.constant, self.shape))
+            return AffineExpression(terms, constant, ())
+
+        axis = axis % self.ndim
+        shape = self.shape[:axis] + self.shape[axis + 1 :]
+        terms = []
+        for cols, vals in self._broadcasted_terms():
+            cols = np.moveaxis(cols, axis, -2).reshape(shape + (-1,))
+            vals = np.moveaxis(vals, axis, -2).reshape(shape + (-1,))
+            terms.append((cols, vals))
+        constant = np.sum(np.broadcast_to(self.constant, self.shape), axis=axis)
+        return AffineExpression(terms, constant, shape)
+
+    def compile(self, index_dtype=np.int64):  # noqa: A003
+        """Stack all the terms into dense arrays with one row per element.
+
+        Return the arrays cols and vals of shape (size, nb_terms_per_row) such that
+        the flattened expression is e[i] = constant[i] + sum_k vals[i, k] * x[cols[i, k]],
+        and the constant broadcasted to the shape of the expression and flattened.
+        """
+        widths = [max(cols.shape[-1], vals.shape[-1]) for cols, vals in self.terms]
+        nb_cols = sum(widths)
+        cols_stacked = np.empty(self.shape + (nb_cols,), dtype=index_dtype)
+        vals_stacked = np.empty(self.shape + (nb_cols,), dtype=np.float64)
+        start = 0
+        for (cols, vals), width in zip(self.terms, widths):
+            # assignments broadcast in place without temporary arrays
+            cols_stacked[..., start : start + width] = cols
+            vals_stacked[..., start : start + width] = vals
+            start += width
+        constant = np.broadcast_to(self.constant, self.shape).ravel()
+        return (
+            cols_stacked.reshape(self.size, nb_cols),
+            vals_stacked.reshape(self.size, nb_cols),
+            constant,
+        )
@@ -196,28 +196,30 @@ def greedy_round(
             pickle.dump(d, f)
     if callback_func is not None:
         callback_func(0, np.round(x), 0, 0, 0, 0, 0)
-    lp2 = copy.copy(lp)
-    lp2.convert_to_all_inequalities()
-    assert lp2.a_equalities is None
 
-    x_u = lp2.upper_bounds.copy()
-    x_l = lp2.lower_bounds.copy()
+    x_u = lp.upper_bounds.copy()
+    x_l = lp.lower_bounds.copy()
 
     if fixed is not None:
         x_l[fixed] = x[fixed]
         x_u[fixed] = x[fixed]
 
-    a_ineq = lp2.a_inequalities
-    b_l = lp2.b_lower.copy()
-    b_u = lp2.b_upper.copy()
+    # the equalities are treated as inequalities as in convert_to_all_inequalities,
+    # with the stacked matrix cached in lp as greedy_round is called repeatedly on it
+    nb_ineq = lp.a_inequalities.shape[0]
+    b_l = np.full(nb_ineq, -np.inf) if lp.b_lower is None else lp.b_lower.copy()
+    b_u = np.full(nb_ineq, np.inf) if lp.b_upper is None else lp.b_upper.copy()
+    if lp.a_equalities is not None:
+        b_l = np.hstack((lp.b_equalities, b_l))
+        b_u = np.hstack((lp.b_equalities, b_u))
 
     # callback_func(0,np.maximum(x_r.astype(np.float),0),0,0,0,0,0)
-    a_ineq_csr = a_ineq.tocsr()
-    a_ineq_csc = a_ineq.tocsc()
+    a_ineq_csr = lp.cached_matrix("constraints", "csr")
+    a_ineq_csc = lp.cached_matrix("constraints", "csc")
     if order is None:
         # sort from the less fractional to the most fractional
         # order=np.argsort(np.abs(x-np.round(x))+c*np.round(x))
-        order = np.argsort(lp2.costsvector * (2 * np.round(x) - 1))
+        order = np.argsort(lp.costsvector * (2 * np.round(x) - 1))
         # order=np.argsort(LP2.costsvector*np.round(x))
         # order=np.arange(x.size)
         # order=np.arange(x.size)[::-1]
@@ -229,7 +231,7 @@ def greedy_round(
     # callback_func(0,x,0,0,0,0,0)
 
     valid, id_constraints = propagate_constraints(
-        np.arange(a_ineq.shape[1]), x_l, x_u, a_ineq_csr, a_ineq_csc, b_l, b_u, []
+        np.arange(a_ineq_csr.shape[1]), x_l, x_u, a_ineq_csr, a_ineq_csc, b_l, b_u, []
     )
     if valid == 0:
         return x_r, valid
@@ -332,7 +334,7 @@ def greedy_round(
                 # raise # need a way to save the bound constraint to restore it
     # callback_func(0,np.maximum(x_r.astype(np.float),0),0,0,0,0,0)
     valid = propagate_constraints(
-        np.arange(a_ineq.shape[1]), x_l, x_u, a_ineq_csr, a_ineq_csc, b_l, b_u, []
+        np.arange(a_ineq_csr.shape[1]), x_l, x_u, a_ineq_csr, a_ineq_csc, b_l, b_u, []
     )
     # assert(valid)
 
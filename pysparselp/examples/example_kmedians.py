@@ -31,17 +31,14 @@ def clustering(points, k, n_center_candidates):
         lower_bounds=0,
         upper_bounds=k,
     )
-    lp.add_inequality_constraints(
-        labeling, np.ones((n, n_center_candidates)), lower_bounds=1, upper_bounds=1
-    )
+    lp.add_constraints(lp.expr(labeling).sum(axis=1), lower_bounds=1, upper_bounds=1)
     # max(labeling,axis=0)<used_as_center
     # the binary variable associated to each  column should be greater than all binary variables on that row
-    id_columns = np.ones((n, 1)).dot(used_as_center[None, :])
-    columns = np.column_stack((labeling.reshape(-1, 1), id_columns.reshape(-1, 1)))
-    values = np.column_stack(
-        (np.ones((n * n_center_candidates)), -np.ones((n * n_center_candidates)))
+    lp.add_constraints(
+        lp.expr(labeling) - lp.expr(used_as_center[None, :]),
+        lower_bounds=None,
+        upper_bounds=0,
     )
-    lp.add_inequality_constraints(columns, values, lower_bounds=None, upper_bounds=0)
 
     s = lp.solve(method="admm", nb_iter=1000, max_time=np.inf, nb_iter_plot=500)[0]
 
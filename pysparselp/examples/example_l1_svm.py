@@ -25,13 +25,10 @@ class L1SVM(SparseLP):
 
         # start by adding auxiliary variables
 
-        aux_ravel = aux.ravel()
-        indices_ravel = indices.ravel()
-        cols = np.column_stack((indices_ravel, aux_ravel))
-        vals = np.tile(np.array([1, -1]), [indices.size, 1])
-        self.add_inequality_constraints(cols, vals, lower_bounds=None, upper_bounds=0)
-        vals = np.tile(np.array([-1, -1]), [indices.size, 1])
-        self.add_inequality_constraints(cols, vals, lower_bounds=None, upper_bounds=0)
+        x = self.expr(indices.ravel())
+        s = self.expr(aux)
+        self.add_constraints(x - s, lower_bounds=None, upper_bounds=0)
+        self.add_constraints(-x - s, lower_bounds=None, upper_bounds=0)
 
     def set_data(self, x, classes, nb_classes=None):
         nb_examples = x.shape[0]
@@ -53,18 +50,14 @@ class L1SVM(SparseLP):
 
         # sum(x*weights[classes,:]),axis=1)[:,None]- x.dot(weights)+epsilon>e
 
-        cols1 = self.weightsIndices[classes, :]
-        vals1 = xh
+        score_true_class = (self.expr(self.weightsIndices[classes, :]) * xh).sum(axis=1)
+        epsilons = self.expr(self.epsilonsIndices[:, 0])
         for k in range(nb_classes):
             keep = classes != k
-            cols2 = np.tile(self.weightsIndices[[k], :], [nb_examples, 1])
-            vals2 = -xh
-            vals3 = np.ones(self.epsilonsIndices.shape)
-            cols3 = self.epsilonsIndices
-            vals = np.column_stack((vals1, vals2, vals3))
-            cols = np.column_stack((cols1, cols2, cols3))
-            self.add_inequality_constraints(
-                cols[keep, :], vals[keep, :], lower_bounds=e[keep, k], upper_bounds=None
+            score_k = (self.expr(self.weightsIndices[k, :]) * xh).sum(axis=1)
+            margin = score_true_class - score_k + epsilons
+            self.add_constraints(
+                margin[keep], lower_bounds=e[keep, k], upper_bounds=None
             )
 
     def train(self, method="mehrotra"):
@@ -27,14 +27,11 @@ class ImageLP(SparseLP):
         else:
             assert coef_penalization.shape == aux.shape
             assert np.min(coef_penalization) >= 0
-        aux_ravel = aux.ravel()
-        row_ravel = ids1.ravel()
-        col_ravel = ids2.ravel()
-        cols = np.column_stack((row_ravel, col_ravel, aux_ravel))
-        vals = np.tile(np.array([1, -1, -1]), [ids1.size, 1])
-        self.add_inequality_constraints(cols, vals, lower_bounds=None, upper_bounds=0)
-        vals = np.tile(np.array([-1, 1, -1]), [ids1.size, 1])
-        self.add_inequality_constraints(cols, vals, lower_bounds=None, upper_bounds=0)
+        x1 = self.expr(ids1)
+        x2 = self.expr(ids2)
+        d = self.expr(aux)
+        self.add_constraints(x1 - x2 - d, lower_bounds=None, upper_bounds=0)
+        self.add_constraints(-x1 + x2 - d, lower_bounds=None, upper_bounds=0)
 
     def add_pott_horizontal(self, indices, coef_penalization):
         self.add_penalized_differences(
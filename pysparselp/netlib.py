@@ -22,21 +22,58 @@
 # ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
 # OTHER DEALINGS IN THE SOFTWARE.
 # -----------------------------------------------------------------------
-"""Module to download netlib problems."""
+"""Module to download netlib problems and cache them locally."""
 
 
+import glob
 import gzip
+import hashlib
 import os
+import tempfile
 import urllib.request
 
+import numpy as np
+
+import scipy.sparse
+
 from .MPSparser import mps_parser
+from .tools import load_npz
+
+# version of the snapshots content, to be incremented when the parser output changes
+SNAPSHOT_VERSION = 2
+
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFAULT_CACHE_FOLDER = os.path.join(
+    os.path.expanduser("~"), ".cache", "pysparselp", "netlib"
+)
 
 
-def get_problem(problem_name):
-    thisfilepath = os.path.dirname(os.path.abspath(__file__))
+def local_problems(data_folder=DATA_FOLDER):
+    """Index the netlib problems available in the netlib and perPlex sub-folders.
 
-    netlib_folder = os.path.join(thisfilepath, "data", "netlib")
-    sol_folder = os.path.join(thisfilepath, "data", "perPlex")
+    Return a dictionary mapping the upper case name of each problem to the tuple of
+    the path of its SIF file and the path of its perPlex solution (None if absent).
+    """
+    problems = dict()
+    pattern = os.path.join(data_folder, "netlib", "*.SIF")
+    for filename_lp in sorted(glob.glob(pattern)):
+        name = os.path.basename(filename_lp)[:-4].upper()
+        filename_sol = None
+        for extension in [".txt", ".txt.gz"]:
+            candidate = os.path.join(data_folder, "perPlex", name.lower() + extension)
+            if os.path.isfile(candidate):
+                filename_sol = candidate
+                break
+        problems[name] = (filename_lp, filename_sol)
+    return problems
+
+
+def download_problem(problem_name, data_folder=DATA_FOLDER):
+    """Download a netlib problem and its perPlex solution in the data folder."""
+    # netlib problems ftp://ftp.numerical.rl.ac.uk/pub/cuter/netlib.tar.gz
+    # netlib exact solutions http://www.zib.de/koch/perplex/data/netlib/txt/
+    netlib_folder = os.path.join(data_folder, "netlib")
+    sol_folder = os.path.join(data_folder, "perPlex")
     os.makedirs(netlib_folder, exist_ok=True)
     os.makedirs(sol_folder, exist_ok=True)
     filename_lp = os.path.join(netlib_folder, problem_name.upper() + ".SIF")
@@ -56,20 +93,112 @@ def get_problem(problem_name):
         )
         fgz = gzip.open(filename_sol + ".gz")
         f = open(filename_sol, "wb")
-        for l in fgz.readlines():
-            f.write(l)
+        for line in fgz.readlines():
+            f.write(line)
         f.close()
+    return filename_lp, filename_sol
 
-    # netlib problems ftp://ftp.numerical.rl.ac.uk/pub/cuter/netlib.tar.gz
-    # netlib exact solutions http://www.zib.de/koch/perplex/data/netlib/txt/
 
-    file_lp = open(filename_lp, "r")
-    if filename_sol is not None:
-        f_sol = open(filename_sol, "r")
+def files_hash(filenames):
+    """Return the sha256 hex digest of the content of the files and SNAPSHOT_VERSION."""
+    h = hashlib.sha256(b"snapshot version %d" % SNAPSHOT_VERSION)
+    for filename in filenames:
+        if filename is None:
+            h.update(b"no file")
+            continue
+        with open(filename, "rb") as f:
+            for block in iter(lambda: f.read(2**20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+def save_snapshot(filename, lp_dict):
+    """Save the dictionary returned by mps_parser in a npz file."""
+    arrays = dict()
+    for key, value in lp_dict.items():
+        if value is None:
+            continue
+        if scipy.sparse.issparse(value):
+            value = value.tocsr()
+            arrays[key + "_data"] = value.data
+            arrays[key + "_indices"] = value.indices
+            arrays[key + "_indptr"] = value.indptr
+            arrays[key + "_shape"] = np.array(value.shape)
+        else:
+            arrays[key] = np.asarray(value)
+    # write to a temporary file first so that concurrent loads never see partial files
+    fd, tmp_filename = tempfile.mkstemp(suffix=".npz", dir=os.path.dirname(filename))
+    with os.fdopen(fd, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_filename, filename)
+
+
+def load_snapshot(filename):
+    """Load a dictionary saved by save_snapshot."""
+    arrays = load_npz(filename)
+    lp_dict = {"costname": None, "solution": None}
+    for key in ["a_eq", "a_ineq"]:
+        csr_arrays = tuple(arrays.pop(key + k) for k in ["_data", "_indices", "_indptr"])
+        shape = tuple(arrays.pop(key + "_shape"))
+        lp_dict[key] = scipy.sparse.csr_matrix(csr_arrays, shape=shape)
+    for key, value in arrays.items():
+        if key == "variables_names":
+            value = value.tolist()
+        elif value.ndim == 0:
+            value = value.item()
+        lp_dict[key] = value
+    return lp_dict
+
+
+def get_problem(
+    problem_name,
+    nb_workers=1,
+    cache_folder=DEFAULT_CACHE_FOLDER,
+    download=True,
+    data_folder=DATA_FOLDER,
+):
+    """Load a netlib problem and its perPlex solution.
+
+    The problems found in the data folder (see local_problems) are used without any
+    network access, the other ones are downloaded if download is True.
+    The first load of a problem saves the parsed problem in a binary snapshot in
+    cache_folder (None to disable the cache), named after the hash of the problem and
+    solution files, and the next loads read this snapshot instead of parsing the files.
+    nb_workers processes are used to parse the problem file, see mps_parser.
+    """
+    problems = local_problems(data_folder)
+    if problem_name.upper() in problems:
+        filename_lp, filename_sol = problems[problem_name.upper()]
+    elif download:
+        filename_lp, filename_sol = download_problem(problem_name, data_folder)
     else:
+        raise FileNotFoundError(
+            f"netlib problem {problem_name} not found in {data_folder}"
+        )
+
+    if cache_folder is not None:
+        key = files_hash([filename_lp, filename_sol])
+        snapshot = os.path.join(cache_folder, f"{problem_name.upper()}_{key[:16]}.npz")
+        if os.path.isfile(snapshot):
+            return load_snapshot(snapshot)
+
+    file_lp = open(filename_lp, "r")
+    if filename_sol is None:
         f_sol = None
+    elif filename_sol.endswith(".gz"):
+        f_sol = gzip.open(filename_sol, "rt")
+    else:
+        f_sol = open(filename_sol, "r")
+
+    # netlib files are in the fixed MPS format, names may contain spaces
+    lp_dict = mps_parser(file_lp, f_sol, fixed_format=True, nb_workers=nb_workers)
+    file_lp.close()
+    if f_sol is not None:
+        f_sol.close()
 
-    lp_dict = mps_parser(file_lp, f_sol)
+    if cache_folder is not None:
+        os.makedirs(cache_folder, exist_ok=True)
+        save_snapshot(snapshot, lp_dict)
     return lp_dict
 
 
@@ -79,4 +208,4 @@ if __name__ == "__main__":
     filename_sol = "./data/perPlex/afiro.txt"
     file_lp = open(filename_lp, "r")
     fsol = open(filename_sol, "r")
-    LP = mps_parser(file_lp, fsol)
+    LP = mps_parser(file_lp, fsol, fixed_format=True)
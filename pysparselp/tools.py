@@ -24,11 +24,19 @@
 # -----------------------------------------------------------------------
 """Model that implements various utils functions used in LP solvers."""
 
+import ast
+import json
+import os
+import struct
+import threading
 import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 
 import scipy.sparse
+from scipy.sparse import _sparsetools
 
 
 class Chrono:
@@ -38,10 +46,122 @@ class Chrono:
         pass
 
     def tic(self):
-        self.start = time.clock()
+        self.start = time.perf_counter()
 
     def toc(self):
-        return time.clock() - self.start
+        return time.perf_counter() - self.start
+
+
+class PhaseProfiler:
+    """Accumulate the durations of the named phases of a solver.
+
+    The durations are measured with time.perf_counter_ns and summed over the
+    successive start/stop calls with the same name. Phases can be nested,
+    for example the iterations phase includes the callback phase.
+    The profiler also counts the operations that dominate the cost of the
+    solvers (sparse matrix vector products, factorizations and solves with the
+    factors) together with the number of nonzeros they touch, which allows to
+    compare the methods by their work independently of the machine.
+    If record_events is True each start/stop span is also kept with the thread
+    that ran it, so that the timeline of the solve can be exported in the Chrome
+    trace event format and opened in chrome://tracing, Perfetto or speedscope.
+    """
+
+    def __init__(self, record_events=False):
+        self.durations_ns = {}
+        self.counts = {}
+        self.operations = {}
+        self.events = [] if record_events else None
+        self._starts = {}
+        self._origin_ns = time.perf_counter_ns()
+
+    def start(self, name):
+        self._starts[(threading.get_ident(), name)] = time.perf_counter_ns()
+
+    def stop(self, name):
+        """Stop the phase started with the same name in this thread, if any."""
+        end = time.perf_counter_ns()
+        thread_id = threading.get_ident()
+        start = self._starts.pop((thread_id, name), None)
+        if start is None:
+            return
+        self.add(name, end - start)
+        if self.events is not None:
+            self.events.append((name, thread_id, start, end))
+
+    def lap(self, name):
+        """Stop the current span of the phase if any and start a new one."""
+        self.stop(name)
+        self.start(name)
+
+    def add(self, name, duration_ns):
+        self.durations_ns[name] = self.durations_ns.get(name, 0) + duration_ns
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def durations(self):
+        """Return the total duration of each phase in seconds."""
+        return {name: d * 1e-9 for name, d in self.durations_ns.items()}
+
+    def count(self, name, value=1):
+        self.operations[name] = self.operations.get(name, 0) + value
+
+    def count_spmv(self, a, transposed=False, nb=1):
+        """Count nb products of the sparse matrix a or of its transpose by vectors."""
+        self.count("spmv_transposed" if transposed else "spmv", nb)
+        self.count("spmv_nnz", nb * a.nnz)
+
+    def count_factorization(self, nnz):
+        """Count a factorization whose factors have nnz nonzeros (the fill)."""
+        self.count("factorizations")
+        self.count("factorization_nnz", nnz)
+
+    def count_solve(self, nnz, nb=1):
+        """Count nb solves with factors or sweeps over a matrix with nnz nonzeros."""
+        self.count("solves", nb)
+        self.count("solve_nnz", nb * nnz)
+
+    def chrome_trace(self):
+        """Return the recorded spans as a dictionary in the Chrome trace format."""
+        if self.events is None:
+            raise ValueError("the profiler has been created with record_events=False")
+        pid = os.getpid()
+        lanes = {}
+        trace_events = []
+        # sort by start and then by decreasing end so that parents precede children
+        for name, thread_id, start, end in sorted(
+            self.events, key=lambda event: (event[2], -event[3])
+        ):
+            if thread_id not in lanes:
+                lanes[thread_id] = len(lanes)
+                trace_events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": pid,
+                        "tid": lanes[thread_id],
+                        "args": {"name": "thread %d" % lanes[thread_id]},
+                    }
+                )
+            trace_events.append(
+                {
+                    "name": name,
+                    "cat": "pysparselp",
+                    "ph": "X",
+                    "ts": (start - self._origin_ns) / 1000,
+                    "dur": (end - start) / 1000,
+                    "pid": pid,
+                    "tid": lanes[thread_id],
+                }
+            )
+        return {
+            "traceEvents": trace_events,
+            "displayTimeUnit": "ms",
+            "otherData": {"operations": self.operations},
+        }
+
+    def save_chrome_trace(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.chrome_trace(), f)
 
 
 class CheckDecrease:
@@ -59,6 +179,269 @@ class CheckDecrease:
         self.val = val
 
 
+class MetricsPolicy:
+    """Decide at which progress reports of a solve the monitoring metrics are evaluated.
+
+    The metrics (constraints violation and distance to the ground truth) are
+    always evaluated at the first report. Then they are evaluated once at least
+    every iterations or period seconds have passed since the last evaluation, or at
+    each report if both are None. If max_overhead is not None an evaluation is
+    also skipped when it would bring the time spent evaluating the metrics above
+    this fraction of the elapsed time, the cost of an evaluation being estimated
+    from the previous ones.
+    """
+
+    def __init__(self, every=None, period=None, max_overhead=None):
+        self.every = every
+        self.period = period
+        self.max_overhead = max_overhead
+        self.reset()
+
+    def reset(self):
+        self.nb_evaluations = 0
+        self.duration = 0
+        self._last_iteration = None
+        self._last_elapsed = None
+
+    def should_evaluate(self, iteration, elapsed):
+        if self._last_iteration is None:
+            return True
+        if self.every is None and self.period is None:
+            due = True
+        else:
+            due = (
+                self.every is not None
+                and iteration - self._last_iteration >= self.every
+            ) or (
+                self.period is not None and elapsed - self._last_elapsed >= self.period
+            )
+        if due and self.max_overhead is not None:
+            expected = self.duration / self.nb_evaluations
+            due = self.duration + expected <= self.max_overhead * elapsed
+        return due
+
+    def evaluated(self, iteration, elapsed, duration):
+        """Register an evaluation of the metrics that took duration seconds."""
+        self.nb_evaluations += 1
+        self.duration += duration
+        self._last_iteration = iteration
+        self._last_elapsed = elapsed
+
+
+def projected_gradient_residual(x, d, lb, ub):
+    """Return the infinity norm of x - proj_[lb,ub](x - d).
+
+    It is zero iff the reduced costs d satisfy the optimality conditions of the bound
+    constraints at x, which gives a cheap estimate of the dual residual.
+    """
+    step = x - d
+    np.maximum(step, lb, step)
+    np.minimum(step, ub, step)
+    step -= x
+    return np.max(np.abs(step)) if step.size > 0 else 0
+
+
+def relative_gap(energy1, energy2):
+    """Return the gap between two energies relative to their magnitude."""
+    if not (np.isfinite(energy1) and np.isfinite(energy2)):
+        return np.inf
+    return abs(energy1 - energy2) / max(1, abs(energy1), abs(energy2))
+
+
+def box_support_point(y, lower, upper):
+    """Return the point of the box [lower, upper] maximizing y.z, zero where y is zero.
+
+    y.dot(box_support_point(y, lower, upper)) is the term of the lagrangian of the
+    constraints lower <= a*x <= upper with a single dual variable y per row, the
+    infinite bounds being only selected where y is zero.
+    """
+    return np.where(y > 0, upper, np.where(y < 0, lower, 0))
+
+
+def project_dual_box(y, r, sigma, lower, upper):
+    """Return the dual step y+sigma*r projected for the constraints lower <= r <= upper.
+
+    This is the proximal operator of the support function of the box, which gives
+    max(y+sigma*(r-upper), 0)+min(y+sigma*(r-lower), 0), nonnegative where only the
+    upper bound is finite and nonpositive where only the lower bound is finite.
+    """
+    return np.maximum(y + sigma * (r - upper), 0) + np.minimum(
+        y + sigma * (r - lower), 0
+    )
+
+
+def check_convergence(
+    primal_residual,
+    dual_residual,
+    gap,
+    tol_primal=None,
+    tol_dual=None,
+    tol_gap=None,
+):
+    """Return True if all the tolerances that are not None are met.
+
+    Return False when no tolerance is given so that the solvers keep iterating until
+    they reach their maximum number of iterations or maximum duration.
+    """
+    tests = [
+        (value, tol)
+        for value, tol in (
+            (primal_residual, tol_primal),
+            (dual_residual, tol_dual),
+            (gap, tol_gap),
+        )
+        if tol is not None
+    ]
+    return len(tests) > 0 and all(value <= tol for value, tol in tests)
+
+
+def csr_matvec(a, x, out):
+    """Compute a * x in out without allocating, a being a csr matrix.
+
+    It calls the same kernel as scipy and gives bit for bit the same result.
+    """
+    out.fill(0)
+    _sparsetools.csr_matvec(
+        a.shape[0], a.shape[1], a.indptr, a.indices, a.data, x, out
+    )
+    return out
+
+
+def csr_rmatvec(y, a, out):
+    """Compute y * a in out without allocating, a being a csr matrix.
+
+    The arrays of a are used as those of the csc matrix a.T, as scipy does.
+    """
+    out.fill(0)
+    _sparsetools.csc_matvec(
+        a.shape[1], a.shape[0], a.indptr, a.indices, a.data, y, out
+    )
+    return out
+
+
+def _csr_matvec_rows(a, row_start, row_end, x, out):
+    out[row_start:row_end].fill(0)
+    _sparsetools.csr_matvec(
+        row_end - row_start,
+        a.shape[1],
+        a.indptr[row_start : row_end + 1],
+        a.indices,
+        a.data,
+        x,
+        out[row_start:row_end],
+    )
+
+
+def _balanced_row_chunks(indptr, nb_chunks):
+    """Split the rows in at most nb_chunks ranges with about as many nonzeros."""
+    bounds = np.searchsorted(indptr, np.linspace(0, indptr[-1], nb_chunks + 1))
+    bounds[0] = 0
+    bounds[-1] = indptr.size - 1
+    bounds = np.unique(bounds)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+class ParallelSparseOperator:
+    """Products of a sparse matrix and of its transpose by vectors on several threads.
+
+    The rows of the csr matrix, and those of a csr copy of its transpose made once
+    when nb_threads > 1, are split into nb_threads ranges with about the same number
+    of nonzeros. Each range is multiplied in its own thread by the scipy sparsetools
+    kernel, which releases the GIL, so the products are bit for bit those of scipy.
+    The results are written in out when it is given, which avoids allocations.
+    nb_threads defaults to the number of cpus. close releases the threads.
+    """
+
+    def __init__(self, a, nb_threads=None):
+        if nb_threads is None:
+            nb_threads = os.cpu_count()
+        self.a = scipy.sparse.csr_matrix(a, dtype=np.float64)
+        self.shape = self.a.shape
+        self.nnz = self.a.nnz
+        self.nb_threads = nb_threads
+        if nb_threads > 1:
+            self.a_t = self.a.T.tocsr()
+            self._chunks = _balanced_row_chunks(self.a.indptr, nb_threads)
+            self._chunks_t = _balanced_row_chunks(self.a_t.indptr, nb_threads)
+            self._pool = ThreadPoolExecutor(nb_threads)
+        else:
+            self.a_t = None
+            self._pool = None
+
+    def _run(self, a, chunks, x, out):
+        futures = [
+            self._pool.submit(_csr_matvec_rows, a, row_start, row_end, x, out)
+            for row_start, row_end in chunks
+        ]
+        for future in futures:
+            future.result()
+        return out
+
+    def matvec(self, x, out=None):
+        """Return a * x."""
+        x = np.asarray(x, dtype=np.float64)
+        if out is None:
+            out = np.empty(self.shape[0])
+        if self._pool is None:
+            return csr_matvec(self.a, x, out)
+        return self._run(self.a, self._chunks, x, out)
+
+    def rmatvec(self, y, out=None):
+        """Return y * a."""
+        y = np.asarray(y, dtype=np.float64)
+        if out is None:
+            out = np.empty(self.shape[1])
+        if self._pool is None:
+            return csr_rmatvec(y, self.a, out)
+        return self._run(self.a_t, self._chunks_t, y, out)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+class MatrixCache:
+    """Matrices derived from other matrices, computed once and reused.
+
+    get returns the value computed by compute the last time it was called with the
+    same key, as long as the source matrices are the same objects with the same
+    shapes and numbers of nonzeros, and calls compute again otherwise. The changes
+    of the values of the nonzeros done in place are not detected. The copies of a
+    cache are empty, so that the copies of a model do not share its cached matrices.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.nb_hits = 0
+        self.nb_misses = 0
+
+    def get(self, key, sources, compute):
+        signature = tuple(
+            None if a is None else (id(a), a.shape, a.nnz) for a in sources
+        )
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == signature:
+            self.nb_hits += 1
+            return entry[1]
+        self.nb_misses += 1
+        value = compute()
+        self._entries[key] = (signature, value)
+        return value
+
+    def __len__(self):
+        """Return the number of cached entries."""
+        return len(self._entries)
+
+    def __copy__(self):
+        """Return an empty cache, the copy of the LP gets its own conversions."""
+        return MatrixCache()
+
+    def __deepcopy__(self, memo):
+        """Return an empty cache, the copy of the LP gets its own conversions."""
+        return MatrixCache()
+
+
 def convert_to_py_sparse_format(a):
     # check symmetric
     import spmatrix
@@ -132,14 +515,12 @@ def convert_to_one_sided_inequality_system(a_ineq, b_lower, b_upper):
 
         idskeep_upper = np.nonzero(b_upper != np.inf)[0]
         idskeep_lower = np.nonzero(b_lower != -np.inf)[0]
-        if len(idskeep_lower) > 0 and len(idskeep_upper) > 0:
-            a_ineq = scipy.sparse.vstack(
-                (a_ineq[idskeep_upper, :], -a_ineq[idskeep_lower, :])
-            ).tocsr()
-        elif len(idskeep_lower) > 0:
-            a_ineq = -a_ineq
-        else:
-            a_ineq = a_ineq
+        # the rows are selected at once and those of the lower bounds are negated in
+        # place, the solvers handle the two-sided inequalities without this copy
+        a_ineq = scipy.sparse.csr_matrix(a_ineq)[
+            np.hstack((idskeep_upper, idskeep_lower))
+        ]
+        a_ineq.data[a_ineq.indptr[len(idskeep_upper)] :] *= -1
         b_ineq = np.hstack((b_upper[idskeep_upper], -b_lower[idskeep_lower]))
     else:
         b_ineq = b_upper
@@ -185,13 +566,13 @@ class SolutionStat:
         self.callback_func = callback_func
 
     def start_timer(self):
-        self.start = time.clock()
+        self.start = time.perf_counter()
         self.elapsed = self.start
 
     def evaluate(self, x, i):
 
         self.prev_elapsed = self.elapsed
-        elapsed = time.clock() - self.start
+        elapsed = time.perf_counter() - self.start
         nb_iter_since_last_call = i - self.self.iprev
         mean_iter_period = (elapsed - self.prev_elapsed) / nb_iter_since_last_call
 
@@ -269,6 +650,63 @@ def save_arguments(filename):
         pickle.dump(d, f)
 
 
+def read_npy_header(f):
+    """Read the header of a npy file and return the shape, fortran order and dtype.
+
+    Unlike np.lib.format.read_array_header_1_0 this skips the filtering of the
+    headers written by python 2, which takes most of the time for small arrays.
+    """
+    version = np.lib.format.read_magic(f)
+    length_size = 2 if version == (1, 0) else 4
+    header_length = int.from_bytes(f.read(length_size), "little")
+    encoding = "utf8" if version >= (3, 0) else "latin1"
+    header = ast.literal_eval(f.read(header_length).decode(encoding))
+    dtype = np.lib.format.descr_to_dtype(header["descr"])
+    return tuple(header["shape"]), header["fortran_order"], dtype
+
+
+def load_npz(filename, mmap_mode=None):
+    """Load the dictionary of arrays of a npz file, possibly memory mapped.
+
+    np.load ignores mmap_mode for npz files, so the arrays are memory mapped directly
+    at their offset in the zip archive, which is possible for the members stored
+    without compression as written by np.savez. Other members are read in memory.
+    Arrays of python objects are not supported.
+    """
+    arrays = dict()
+    with zipfile.ZipFile(filename) as archive, open(filename, "rb") as f:
+        for info in archive.infolist():
+            name = info.filename
+            if name.endswith(".npy"):
+                name = name[:-4]
+            with archive.open(info) as member:
+                shape, fortran_order, dtype = read_npy_header(member)
+                if dtype.hasobject:
+                    raise ValueError(f"array {name} contains python objects")
+                order = "F" if fortran_order else "C"
+                size = int(np.prod(shape))
+                stored = info.compress_type == zipfile.ZIP_STORED
+                if mmap_mode is not None and stored and size > 0:
+                    # skip the zip local file header and the npy header
+                    f.seek(info.header_offset + 26)
+                    name_length, extra_length = struct.unpack("<HH", f.read(4))
+                    offset = info.header_offset + 30 + name_length + extra_length
+                    arrays[name] = np.memmap(
+                        filename,
+                        dtype=dtype,
+                        mode=mmap_mode,
+                        offset=offset + member.tell(),
+                        shape=shape,
+                        order=order,
+                    )
+                else:
+                    array = np.empty(size, dtype=dtype)
+                    if member.readinto(array.view(np.uint8)) != array.nbytes:
+                        raise ValueError(f"array {name} is truncated")
+                    arrays[name] = array.reshape(shape, order=order)
+    return arrays
+
+
 def precondition_constraints(a, b, b2=None, alpha=2):
     # alpha=2
     a_copy = a.copy()
@@ -3,22 +3,26 @@
 import copy
 import json
 import os
+import pathlib
+import tempfile
 
 
 import matplotlib.pyplot as plt
 
 import numpy as np
 
-
 from pysparselp.SparseLP import SparseLP, solving_methods
-from pysparselp.netlib import get_problem
+from pysparselp.netlib import get_problem, local_problems
+
+import pytest
 
 __folder__ = os.path.dirname(__file__)
 
 
-def solve_netlib(problem_name, display=False, max_time_seconds=30):
+def solve_netlib(problem_name, display=False, max_time_seconds=30, cache_folder=None):
 
-    lp_dict = get_problem(problem_name)
+    # no snapshot cache by default so that the tests do not write in the home folder
+    lp_dict = get_problem(problem_name, cache_folder=cache_folder)
     ground_truth = lp_dict["solution"]
 
     lp = SparseLP()
@@ -117,7 +121,28 @@ def test_netlib(
             np.testing.assert_almost_equal(*trim_length(v1, v2))
 
 
+def test_netlib_cache(tmp_path):
+    assert list(local_problems()) == ["AFIRO", "KB2", "SC105", "SC50A", "SC50B"]
+    lp_dict = get_problem("sc50a", cache_folder=tmp_path, download=False)
+    snapshots = os.listdir(tmp_path)
+    assert len(snapshots) == 1 and snapshots[0].startswith("SC50A_")
+    lp_dict2 = get_problem("SC50A", cache_folder=tmp_path, download=False)
+    assert os.listdir(tmp_path) == snapshots
+    assert set(lp_dict2) == set(lp_dict)
+    for key, value in lp_dict.items():
+        if key in ["a_eq", "a_ineq"]:
+            assert (lp_dict2[key] != value).nnz == 0
+        elif isinstance(value, np.ndarray):
+            np.testing.assert_array_equal(lp_dict2[key], value)
+        else:
+            assert lp_dict2[key] == value
+
+    with pytest.raises(FileNotFoundError):
+        get_problem("ADLITTLE", cache_folder=tmp_path, download=False)
+
+
 if __name__ == "__main__":
+    test_netlib_cache(pathlib.Path(tempfile.mkdtemp()))
 
     # test_netlib('afiro')# seems like the solution is not unique
     # test_netlib('SC50B')
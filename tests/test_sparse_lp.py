@@ -0,0 +1,903 @@
+"""Tests of the SparseLP modeling class."""
+
+import gzip
+import io
+import json
+import logging
+import os
+import pathlib
+import tempfile
+
+import numpy as np
+
+from pysparselp.ChambollePockPPD import chambolle_pock_ppd
+from pysparselp.MPSparser import mps_parser, read_perplex_solution
+from pysparselp.SparseLP import ConstraintNames, SparseLP, crd_matrix
+from pysparselp.tools import (
+    MetricsPolicy,
+    ParallelSparseOperator,
+    csr_matvec,
+    csr_rmatvec,
+)
+
+import pytest
+
+import scipy.sparse
+
+__folder__ = os.path.dirname(__file__)
+
+
+TEST_MPS = """NAME          TESTLP
+* comment line
+ROWS
+ N  COST
+ L  LIM1
+ G  LIM2
+ E  MYEQN
+ E  MYRNG
+COLUMNS
+    X1  COST  1.0  LIM1  1.0
+    X1  LIM2  1.0
+    MARKER  'MARKER'  'INTORG'
+    X2  COST  2.0  LIM1  1.0
+    X2  MYEQN  -1.0
+    MARKER  'MARKER'  'INTEND'
+    X3  COST  -1.0  MYEQN  1.0
+    X3  MYRNG  1.0
+RHS
+    RHS  COST  -3.5
+    RHS  LIM1  4.0  LIM2  1.0
+    RHS  MYEQN  7.0
+    MYRNG  2.0
+RANGES
+    RNG  LIM1  2.5  MYRNG  -1.5
+BOUNDS
+ UP BND  X1  4.0
+ MI BND  X2
+ UP BND  X2  1.0
+ BV BND  X3
+ENDATA
+"""
+
+
+def build_chain_lp(n=20, nb_groups=5):
+    np.random.seed(0)
+    lp = SparseLP()
+    ids = lp.add_variables_array((nb_groups, n), 0, 1, np.random.rand(nb_groups, n))
+    for k in range(nb_groups):
+        lp.start_constraint_name(f"group{k}")
+        aux = lp.add_variables_array(n - 1, 0, None, 1.0)
+        cols = np.column_stack((ids[k, 1:], ids[k, :-1], aux))
+        lp.add_inequality_constraints(
+            cols, np.array([[1, -1, -1]]), lower_bounds=None, upper_bounds=0
+        )
+        lp.add_inequality_constraints(
+            cols, np.array([[-1, 1, -1]]), lower_bounds=-5, upper_bounds=0
+        )
+        lp.add_equality_constraints(ids[[k], :], np.ones((1, n)), 1)
+        lp.end_constraint_name(f"group{k}")
+    return lp, ids
+
+
+def test_buffered_constraints():
+    n = 20
+    nb_groups = 5
+    lp, ids = build_chain_lp(n, nb_groups)
+    nb_rows_group = 2 * (n - 1)
+
+    # the counts are available before the buffered blocks get concatenated
+    assert lp.nb_inequality_constraints() == nb_groups * nb_rows_group
+    assert lp.nb_equality_constraints() == nb_groups
+    assert lp.inequalityConstraintNames[1] == {
+        "name": "group1",
+        "start": nb_rows_group,
+        "end": 2 * nb_rows_group - 1,
+    }
+
+    lp.finalize()
+    a_ineq = lp.a_inequalities
+    assert scipy.sparse.isspmatrix_csr(a_ineq)
+    assert a_ineq.shape == (nb_groups * nb_rows_group, lp.nb_variables)
+    assert len(a_ineq.blocks) == 2 * nb_groups
+    assert a_ineq.blocks[2] == (nb_rows_group, nb_rows_group + n - 2)
+    assert lp.a_equalities.shape == (nb_groups, lp.nb_variables)
+    assert lp.b_lower.shape == (a_ineq.shape[0],)
+    assert np.all(lp.b_upper == 0)
+    assert np.all(lp.b_lower[: n - 1] == -np.inf)
+    assert np.all(lp.b_lower[n - 1 : 2 * (n - 1)] == -5)
+    np.testing.assert_array_equal(lp.b_equalities, np.ones(nb_groups))
+
+    # a feasible point with all the chain variables equal
+    x = np.zeros(lp.nb_variables)
+    x[ids] = 1.0 / n
+    assert lp.check_solution(x)
+
+    # adding constraints after the first concatenation
+    lp.add_inequality_constraints(
+        ids[:, :1], np.ones((nb_groups, 1)), lower_bounds=None, upper_bounds=1
+    )
+    assert lp.a_inequalities.shape[0] == nb_groups * nb_rows_group + nb_groups
+    assert lp.b_upper.size == lp.a_inequalities.shape[0]
+
+    # the buffered blocks do not see later changes of the caller's arrays
+    a = scipy.sparse.csr_matrix(np.ones((1, lp.nb_variables)))
+    b = np.ones(1)
+    lp.add_equality_constraints_sparse(a, b)
+    a.data[:] = 2
+    b[:] = 2
+    assert np.all(lp.a_equalities[-1].data == 1)
+    assert lp.b_equalities[-1] == 1
+
+
+def test_constraint_names():
+    n = 20
+    nb_groups = 5
+    lp, ids = build_chain_lp(n, nb_groups)
+    nb_rows_group = 2 * (n - 1)
+    assert len(lp.inequalityConstraintNames) == nb_groups
+    assert lp.get_inequality_constraint_name_from_id(nb_rows_group + 3)["name"] == "group1"
+    assert lp.get_equality_constraint_name_from_id(4) == {
+        "name": "group4",
+        "start": 4,
+        "end": 4,
+    }
+    assert lp.get_equality_constraint_name_from_id(5) is None
+
+    lp.add_inequality_constraints(ids[:, :1], np.ones((nb_groups, 1)), None, 1)
+    names = lp.get_inequality_constraint_names_from_ids(
+        [0, nb_rows_group, 3 * nb_rows_group - 1, nb_groups * nb_rows_group]
+    )
+    assert list(names) == ["group0", "group1", "group2", None]
+
+    lp.start_constraint_name("group1")
+    lp.add_inequality_constraints(ids[:, :1], np.ones((nb_groups, 1)), None, 1)
+    lp.end_constraint_name("group1")
+    ranges = lp.find_inequality_constraints_from_name("group1")
+    assert [(d["start"], d["end"]) for d in ranges] == [
+        (nb_rows_group, 2 * nb_rows_group - 1),
+        (nb_groups * (nb_rows_group + 1), nb_groups * (nb_rows_group + 2) - 1),
+    ]
+    assert lp.find_inequality_constraints_from_name("unknown") == []
+
+    # list behaviours and overlapping ranges
+    constraint_names = ConstraintNames()
+    constraint_names.append({"name": "a", "start": 0, "end": 9})
+    constraint_names.append("b", 2, 3)
+    constraint_names.append("c", 10, 12)
+    assert constraint_names[1:] == [
+        {"name": "b", "start": 2, "end": 3},
+        {"name": "c", "start": 10, "end": 12},
+    ]
+    assert constraint_names.from_row(3)["name"] == "a"
+    assert constraint_names.from_row(11)["name"] == "c"
+    names = constraint_names.names_from_rows([0, 2, 9, 10, 13])
+    assert list(names) == ["a", "a", "a", "c", None]
+
+
+def test_add_variables_array_growth():
+    lp = SparseLP()
+    ids = [lp.add_variables_array(k + 1, 0, k, costs=float(k)) for k in range(50)]
+    nb_variables = 50 * 51 // 2
+    assert lp.nb_variables == nb_variables
+    for v in (lp.lower_bounds, lp.upper_bounds, lp.costsvector, lp.is_integer):
+        assert v.shape == (nb_variables,)
+    np.testing.assert_array_equal(lp.upper_bounds[ids[10]], 10)
+    np.testing.assert_array_equal(lp.costsvector[ids[49]], 49)
+
+    # the exposed arrays are views on the storage
+    lp.set_costs_variables(ids[3], np.full(ids[3].shape, -1.0))
+    lp.lower_bounds[ids[4]] = -2
+    assert np.all(lp.costsvector[ids[3]] == -1)
+    assert np.all(lp.lower_bounds[ids[4]] == -2)
+
+    ids_int = lp.add_variables_array(3, 0, 1, is_integer=True)
+    assert np.all(lp.is_integer[ids_int])
+    assert np.sum(lp.is_integer) == 3
+
+
+def test_add_constraints_coo():
+    lp = SparseLP()
+    x = lp.add_variables_bulk(
+        6, lower_bounds=np.zeros(6), upper_bounds=1, costs=np.arange(6)
+    )
+    z = lp.add_variables_bulk(2, is_integer=np.array([True, False]), name="z")
+    assert lp.nb_variables == 8
+    np.testing.assert_array_equal(lp.costsvector, [0, 1, 2, 3, 4, 5, 0, 0])
+    np.testing.assert_array_equal(lp.is_integer[z], [True, False])
+    assert np.all(np.isinf(lp.lower_bounds[z]))
+    assert lp.get_variables_indices("z") is z
+
+    # ragged rows with a duplicated entry in the last row
+    rows = np.array([0, 0, 1, 2, 2, 2, 2])
+    cols = np.array([x[0], x[1], z[0], x[2], x[3], z[1], x[2]])
+    vals = np.array([1.0, 2.0, 3.0, 1.0, -1.0, 1.0, 2.0])
+    lp.add_constraints_coo(rows, cols, vals, lower_bounds=None, upper_bounds=[1, 2, 3])
+    lp.add_constraints_coo([0, 0], [x[4], x[5]], 1, lower_bounds=1, upper_bounds=1)
+
+    expected = np.zeros((3, 8))
+    expected[0, [0, 1]] = [1, 2]
+    expected[1, 6] = 3
+    expected[2, [2, 3, 7]] = [3, -1, 1]
+    np.testing.assert_array_equal(lp.a_inequalities.toarray(), expected)
+    np.testing.assert_array_equal(lp.b_upper, [1, 2, 3])
+    assert lp.a_inequalities.nnz == 6
+    np.testing.assert_array_equal(lp.a_equalities.toarray(), [[0, 0, 0, 0, 1, 1, 0, 0]])
+    np.testing.assert_array_equal(lp.b_equalities, [1])
+
+
+def test_affine_expressions():
+    lp = SparseLP()
+    x = lp.add_variables_array((3, 4), 0, 1)
+    y = lp.add_variables_array(4, 0, 1)
+    w = np.arange(1, 5)
+
+    # broadcasting of y over the rows of x, with a constant
+    lp.add_constraints(
+        lp.expr(x) * w - 2 * lp.expr(y[None, :]) + 1, lower_bounds=None, upper_bounds=3
+    )
+    # sum along an axis, indexing and repeated variables
+    lp.add_constraints(lp.expr(x).sum(axis=1)[1:], lower_bounds=1, upper_bounds=1)
+    lp.add_constraints(lp.expr(y) - 0.5 * lp.expr(y) + lp.expr(y[::-1]), 0, 2)
+
+    a = lp.a_inequalities.toarray()
+    assert a.shape == (12 + 4, 16)
+    expected = np.zeros((12, 16))
+    expected[np.arange(12), x.ravel()] = np.tile(w, 3)
+    expected[np.arange(12), y[np.tile(np.arange(4), 3)]] = -2
+    np.testing.assert_array_equal(a[:12], expected)
+    np.testing.assert_array_equal(lp.b_upper[:12], 2)
+
+    expected = 0.5 * np.eye(4) + np.eye(4)[::-1]
+    np.testing.assert_array_equal(a[12:, y], expected)
+    np.testing.assert_array_equal(lp.b_lower[12:], 0)
+
+    expected = np.zeros((2, 16))
+    expected[[0] * 4 + [1] * 4, x[1:].ravel()] = 1
+    np.testing.assert_array_equal(lp.a_equalities.toarray(), expected)
+    np.testing.assert_array_equal(lp.b_equalities, [1, 1])
+
+    # out of range indices are rejected before the block gets buffered
+    for indices in [np.array([5, 16]), np.array([-1, 0])]:
+        with pytest.raises(ValueError, match="out of range"):
+            lp.add_constraints(lp.expr(indices), upper_bounds=1)
+    assert lp.a_inequalities.shape == (12 + 4, 16)
+
+
+def test_crd_matrix_validation():
+    np.random.seed(0)
+    cols = np.argsort(np.random.rand(50, 300), axis=1)[:, :200]
+    vals = np.random.rand(50, 200)
+    a = crd_matrix(cols, vals)
+    np.testing.assert_array_equal(a[np.arange(50)[:, None], cols].toarray(), vals)
+
+    cols[7, 3] = cols[7, 150]
+    with pytest.raises(ValueError, match="twice the same variable in 1 constraint:"):
+        crd_matrix(cols, vals)
+    with pytest.raises(ValueError, match=f"row 7: repeated variables \\[{cols[7, 3]}\\]"):
+        crd_matrix(cols, vals, validate="debug")
+    # trusted mode, the duplicated entry is kept as is
+    assert crd_matrix(cols, vals, validate=False).nnz == cols.size
+    with pytest.raises(ValueError, match="negative variable indices"):
+        crd_matrix(-cols, vals, validate="debug")
+
+    lp = SparseLP()
+    x = lp.add_variables_array(3, 0, 1)
+    with pytest.raises(ValueError):
+        lp.add_inequality_constraints(x[[[0, 1, 0]]], np.ones((1, 3)), None, 1)
+    lp.validate_constraints = False
+    lp.add_inequality_constraints(x[[[0, 1, 0]]], np.ones((1, 3)), None, 1)
+    assert lp.nb_inequality_constraints() == 1
+
+
+def test_save_mps(tmp_path):
+    lp = SparseLP()
+    lp.add_variables_array(
+        3, np.array([0, -1, -np.inf]), np.array([4, 1, np.inf]), np.array([1, 4, 9.0])
+    )
+    lp.add_variables_array(2, 0, np.array([np.inf, 3]), costs=0.1, is_integer=True)
+    lp.add_variables_array(1, 2, 2)
+    lp.add_inequality_constraints(
+        np.array([[0, 1], [0, 2]]),
+        np.ones((1, 2)),
+        np.array([-np.inf, 10]),
+        np.array([5, np.inf]),
+    )
+    lp.add_inequality_constraints(np.array([[3, 4]]), np.array([[1, -2.5]]), -1, 2.25)
+    lp.add_equality_constraints(np.array([[1, 2]]), np.array([[-1, 1]]), 7)
+
+    f = io.BytesIO()
+    lp.save_mps(f, chunk_size=4)
+    lines = f.getvalue().decode().splitlines()
+    sections = ["ROWS", "COLUMNS", "RHS", "RANGES", "BOUNDS", "ENDATA"]
+    assert [line for line in lines if line in sections] == sections
+    assert lines[lines.index("ROWS") + 1 : lines.index("COLUMNS")] == [
+        " N  OBJ     ",
+        " E  E0      ",
+        " L  I0      ",
+        " G  I1      ",
+        " L  I2      ",
+    ]
+    columns = lines[lines.index("COLUMNS") + 1 : lines.index("RHS")]
+    assert columns[4] == "    X1        E0                -1.0"
+    assert columns[9].split() == ["MARKER", "'MARKER'", "'INTORG'"]
+    assert columns[10].split() == ["X3", "OBJ", "0.1"]
+    assert columns[14].split() == ["MARKER", "'MARKER'", "'INTEND'"]
+    assert "    RNG       I2                3.25" in lines
+    bounds = [line.split() for line in lines[lines.index("BOUNDS") + 1 : -1]]
+    assert sorted(bounds) == sorted(
+        [
+            ["FX", "BND", "X5", "2.0"],
+            ["FR", "BND", "X2"],
+            ["LO", "BND", "X1", "-1.0"],
+            ["UP", "BND", "X0", "4.0"],
+            ["UP", "BND", "X1", "1.0"],
+            ["UP", "BND", "X4", "3.0"],
+            ["PL", "BND", "X3"],
+        ]
+    )
+
+    # round trip of a netlib problem through the parser
+    filename = os.path.join(__folder__, "..", "pysparselp", "data", "netlib", "SC50A.SIF")
+    lp_dict = mps_parser(open(filename, "r"))
+    lp = SparseLP()
+    lp.add_variables_array(
+        len(lp_dict["cost_vector"]),
+        lp_dict["lower_bounds"],
+        lp_dict["upper_bounds"],
+        costs=lp_dict["cost_vector"],
+    )
+    lp.add_equality_constraints_sparse(
+        scipy.sparse.csr_matrix(lp_dict["a_eq"]), lp_dict["b_eq"]
+    )
+    lp.add_inequality_constraints_sparse(
+        scipy.sparse.csr_matrix(lp_dict["a_ineq"]),
+        lp_dict["b_lower"],
+        lp_dict["b_upper"],
+    )
+    lp.save_mps(str(tmp_path / "sc50a.mps.gz"))
+    lp_dict2 = mps_parser(gzip.open(tmp_path / "sc50a.mps.gz", "rt"))
+    for key in ["cost_vector", "lower_bounds", "upper_bounds", "b_eq", "b_upper"]:
+        np.testing.assert_array_equal(lp_dict2[key], lp_dict[key])
+    for key in ["a_eq", "a_ineq"]:
+        assert (lp_dict2[key] != lp_dict[key]).nnz == 0
+
+
+def test_mps_parser():
+    lp_dict = mps_parser(io.StringIO(TEST_MPS))
+    assert lp_dict["problem_name"] == "TESTLP"
+    assert lp_dict["costname"] == "COST"
+    assert lp_dict["variables_names"] == ["X1", "X2", "X3"]
+    assert lp_dict["objective_offset"] == 3.5
+    np.testing.assert_array_equal(lp_dict["cost_vector"], [1, 2, -1])
+    np.testing.assert_array_equal(lp_dict["is_integer"], [False, True, True])
+    np.testing.assert_array_equal(lp_dict["lower_bounds"], [0, -np.inf, 0])
+    np.testing.assert_array_equal(lp_dict["upper_bounds"], [4, 1, 1])
+    np.testing.assert_array_equal(lp_dict["a_eq"].toarray(), [[0, -1, 1]])
+    np.testing.assert_array_equal(lp_dict["b_eq"], [7])
+    np.testing.assert_array_equal(
+        lp_dict["a_ineq"].toarray(), [[1, 1, 0], [1, 0, 0], [0, 0, 1]]
+    )
+    np.testing.assert_array_equal(lp_dict["b_lower"], [1.5, 1, 0.5])
+    np.testing.assert_array_equal(lp_dict["b_upper"], [4, np.inf, 2])
+
+    # fixed format allows spaces in names
+    fixed = "\n".join(
+        [
+            "NAME          FIXED",
+            "ROWS",
+            " N  COST",
+            " L  LIM 1",
+            "COLUMNS",
+            "    %-8s  %-8s  %12s   %-8s  %12s" % ("X ONE", "COST", 1.0, "LIM 1", 2.0),
+            "RHS",
+            "    %-8s  %-8s  %12s" % ("RHS", "LIM 1", 4.0),
+            "ENDATA",
+        ]
+    )
+    lp_dict = mps_parser(io.StringIO(fixed), fixed_format=True)
+    assert lp_dict["variables_names"] == ["X ONE"]
+    np.testing.assert_array_equal(lp_dict["a_ineq"].toarray(), [[2]])
+    np.testing.assert_array_equal(lp_dict["b_upper"], [4])
+
+    with pytest.raises(ValueError, match="unknown row"):
+        mps_parser(io.StringIO(TEST_MPS.replace("X3  MYRNG", "X3  NOROW")))
+
+
+def test_mps_parser_chunked(tmp_path):
+    def assert_same_problem(lp_dict, lp_dict2):
+        for key, value in lp_dict.items():
+            if key in ["a_eq", "a_ineq"]:
+                assert (lp_dict2[key] != value).nnz == 0
+            elif isinstance(value, np.ndarray):
+                np.testing.assert_array_equal(lp_dict2[key], value)
+            else:
+                assert lp_dict2[key] == value
+
+    # small chunks split the integer markers blocks between workers
+    filename = tmp_path / "test.mps"
+    filename.write_text(TEST_MPS)
+    lp_dict = mps_parser(io.StringIO(TEST_MPS))
+    for chunk_size in [10, 100]:
+        lp_dict2 = mps_parser(open(filename, "r"), nb_workers=2, chunk_size=chunk_size)
+        assert_same_problem(lp_dict, lp_dict2)
+
+    filename = os.path.join(__folder__, "..", "pysparselp", "data", "netlib", "SC50A.SIF")
+    lp_dict = mps_parser(open(filename, "r"))
+    lp_dict2 = mps_parser(open(filename, "rb"), nb_workers=2, chunk_size=500)
+    assert_same_problem(lp_dict, lp_dict2)
+    with open(filename, "rb") as f:
+        content = f.read()
+    lp_dict2 = mps_parser(io.BytesIO(content), nb_workers=2, chunk_size=500)
+    assert_same_problem(lp_dict, lp_dict2)
+
+
+def test_read_perplex_solution():
+    content = """* Solution file generated by perPlex Version 1.00
+* Objvalue : -3/2
+
+- Variables
+
+V Name     : X1
+V Type     : Lower
+V State    : Basic
+V Value    : 0.255e2 = 51/2
+
+V Name     : X2
+V State    : on lower
+V Redcost  : 0.2e1 = 2
+
+V Name     : X3
+V State    : on upper
+
+V Name     : X4
+V State    : on both
+
+V Name     : X5
+V State    : Basic
+V Value    : 0.15e1 = nan
+
+- Constraints
+
+C Name     : X1
+C State    : Basic
+Activity  : 0.e0 = 0
+
+- EOF
+"""
+    variable_index = {b"X%d" % i: i for i in range(7)}
+    lower_bounds = np.array([0, 0, -1, 0, 3, 0, 0])
+    upper_bounds = np.array([np.inf, np.inf, 1, 2, 3, 1, 1])
+    solution = read_perplex_solution(
+        io.StringIO(content), variable_index, lower_bounds, upper_bounds
+    )
+    np.testing.assert_array_equal(solution, [np.nan, 25.5, -1, 2, 3, 1.5, np.nan])
+
+    # names with spaces are read line by line
+    content2 = content.replace("X5", "X 5")
+    variable_index[b"X 5"] = variable_index.pop(b"X5")
+    solution2 = read_perplex_solution(
+        io.StringIO(content2), variable_index, lower_bounds, upper_bounds
+    )
+    np.testing.assert_array_equal(solution2, solution)
+
+    with pytest.raises(ValueError, match="unknown variable"):
+        read_perplex_solution(
+            io.StringIO(content.replace("X4", "Y4")),
+            variable_index,
+            lower_bounds,
+            upper_bounds,
+        )
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_save_ian_e_h_yen(tmp_path, binary):
+    lp, ids = build_chain_lp()
+    lp.set_bounds_on_variables(ids[:, 0], 0, np.pi)
+    lp.convert_to_one_sided_inequality_system()
+    lp.save_ian_e_h_yen(str(tmp_path), binary=binary, chunk_size=7)
+    lp2 = SparseLP.load_ian_e_h_yen(str(tmp_path))
+
+    # the values are saved exactly and the upper bounds become inequalities
+    bounded = np.flatnonzero(np.isfinite(lp.upper_bounds))
+    nb_bounded = bounded.size
+    np.testing.assert_array_equal(lp2.costsvector, lp.costsvector)
+    np.testing.assert_array_equal(lp2.lower_bounds, 0)
+    np.testing.assert_array_equal(lp2.upper_bounds, np.inf)
+    np.testing.assert_array_equal(lp2.b_equalities, lp.b_equalities)
+    np.testing.assert_array_equal(lp2.b_upper[:-nb_bounded], lp.b_upper)
+    np.testing.assert_array_equal(lp2.b_upper[-nb_bounded:], lp.upper_bounds[bounded])
+    assert np.sum(lp2.b_upper == np.pi) == ids.shape[0]
+    assert lp2.b_lower is None
+    assert (lp2.a_equalities != lp.a_equalities).nnz == 0
+    assert (lp2.a_inequalities[:-nb_bounded] != lp.a_inequalities).nnz == 0
+    np.testing.assert_array_equal(lp2.a_inequalities[-nb_bounded:].indices, bounded)
+    with open(tmp_path / "meta") as f:
+        assert f.read().split() == [
+            "nb",
+            str(lp.nb_variables),
+            "nf",
+            "0",
+            "mI",
+            str(lp2.a_inequalities.shape[0]),
+            "mE",
+            str(lp.a_equalities.shape[0]),
+        ]
+    if not binary:
+        with open(tmp_path / "a_eq") as f:
+            assert f.readline().split() == [str(n) for n in lp.a_equalities.shape] + ["0.0"]
+            assert f.readline().split() == ["1", "1", "1.0"]
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_save_npz(tmp_path, mmap):
+    lp, ids = build_chain_lp()
+    lp.add_variables_array((2, 3), 0, 1, name="extra", is_integer=True)
+    lp.save_npz(str(tmp_path / "lp.npz"))
+    lp2 = SparseLP.load(str(tmp_path / "lp.npz"), mmap=mmap)
+
+    assert lp2.nb_variables == lp.nb_variables
+    for key in [
+        "lower_bounds",
+        "upper_bounds",
+        "costsvector",
+        "is_integer",
+        "b_equalities",
+        "b_lower",
+        "b_upper",
+    ]:
+        np.testing.assert_array_equal(getattr(lp2, key), getattr(lp, key))
+    for key in ["a_equalities", "a_inequalities"]:
+        a = getattr(lp, key)
+        a2 = getattr(lp2, key)
+        assert a2.shape == a.shape
+        assert (a2 != a).nnz == 0
+        assert a2.blocks == a.blocks
+    assert isinstance(lp2.a_inequalities.data, np.memmap) == mmap
+    assert list(lp2.inequalityConstraintNames) == list(lp.inequalityConstraintNames)
+    assert list(lp2.equalityConstraintNames) == list(lp.equalityConstraintNames)
+    assert list(lp2.variables_dict) == ["extra"]
+    np.testing.assert_array_equal(lp2.variables_dict["extra"], lp.variables_dict["extra"])
+
+    # the loaded problem can be modified without changing the file
+    lp2.set_bounds_on_variables(ids[0], 0, 0.5)
+    lp2.add_inequality_constraints(ids[:, :2], np.array([[1, 1]]), None, 1)
+    assert lp2.a_inequalities.shape[0] == lp.a_inequalities.shape[0] + ids.shape[0]
+    lp3 = SparseLP.load(str(tmp_path / "lp.npz"), mmap=mmap)
+    np.testing.assert_array_equal(lp3.upper_bounds, lp.upper_bounds)
+    assert lp3.a_inequalities.shape == lp.a_inequalities.shape
+
+
+def build_selection_lp(nb_groups=10, n=4):
+    """Build an LP selecting at most one variable per group, with bounded variables."""
+    np.random.seed(0)
+    lp = SparseLP()
+    ids = lp.add_variables_array((nb_groups, n), 0, 1, -np.random.rand(nb_groups, n))
+    lp.add_inequality_constraints(ids, np.ones((1, n)), None, 1)
+    # the optimum selects the cheapest variable of each group
+    optimum = np.sum(np.min(lp.costsvector[ids], axis=1))
+    return lp, optimum
+
+
+@pytest.mark.parametrize(
+    "method",
+    [
+        "chambolle_pock_ppd",
+        "pdhg_restarted",
+        "admm",
+        "admm2",
+        "admm_blocks",
+        "dual_gradient_ascent",
+    ],
+)
+def test_solve_tolerances(method):
+    if method == "dual_gradient_ascent":
+        # the dual gradient ascent needs bounded variables and one-sided inequalities
+        lp, optimum = build_selection_lp()
+        lp.convert_to_one_sided_inequality_system()
+    else:
+        lp, _ = build_chain_lp()
+        # optimum obtained with scipy.optimize.linprog
+        optimum = 2.3301639087909676
+
+    nb_iter = 20000
+    result = lp.solve(
+        method=method, nb_iter=nb_iter, tol_primal=1e-4, tol_dual=1e-4, tol_gap=1e-3
+    )
+    # stopped on the tolerances long before the maximum number of iterations
+    assert result.status == "converged"
+    assert result.nb_iterations < nb_iter / 2
+    x = result.x
+    assert lp.max_constraint_violation(x) < 1e-3
+    assert abs(lp.costsvector.dot(x) - optimum) < 1e-2
+    if method in ["chambolle_pock_ppd", "pdhg_restarted"]:
+        assert optimum - 1e-2 < result.lower_bound <= optimum + 1e-9
+
+
+@pytest.mark.parametrize(
+    "method, nb_max_iter", [("chambolle_pock_ppd", 10000), ("pdhg_restarted", 1000)]
+)
+def test_chambolle_pock_gap(method, nb_max_iter):
+    lp, ids = build_chain_lp()
+    result = lp.solve(method=method, nb_iter=20000, tol_primal=1e-4, tol_gap=1e-4)
+    assert result.nb_iterations < nb_max_iter
+    energy = lp.costsvector.dot(result.x)
+    # the lower bound certifies the accuracy of the nearly feasible solution
+    assert result.lower_bound <= energy
+    assert (energy - result.lower_bound) / abs(energy) <= 1e-4
+
+    # rows with only infinite bounds do not make the lower bound nan
+    lp = SparseLP()
+    lp.add_variables_array(2, 0, 1, costs=np.array([-1.0, -2.0]))
+    a = scipy.sparse.csr_matrix(np.array([[1.0, 1.0], [1.0, -1.0]]))
+    lp.add_inequality_constraints_sparse(a, None, np.array([1.0, np.inf]))
+    result = lp.solve(method=method, nb_iter=3000, tol_gap=1e-5)
+    assert result.status == "converged"
+    assert result.lower_bound == pytest.approx(-2.0)
+
+
+def test_solve_result(caplog):
+    lp, ids = build_chain_lp()
+    iterations = []
+
+    def callback_func(niter, solution, *args):
+        iterations.append(niter)
+
+    with caplog.at_level(logging.INFO, logger="pysparselp"):
+        result = lp.solve(
+            method="chambolle_pock_ppd",
+            nb_iter=50,
+            nb_iter_plot=10,
+            callback_func=callback_func,
+            ground_truth=np.zeros(ids.size),
+            ground_truth_indices=ids.ravel(),
+        )
+    assert result.status == "max_iter"
+    assert result.nb_iterations == 50
+    history = result.history
+    np.testing.assert_array_equal(history["iteration"], [0, 10, 20, 30, 40])
+    assert iterations == [0, 10, 20, 30, 40]
+    assert np.all(np.diff(history["duration"]) >= 0)
+    assert np.all(history["energy2"] <= result.lower_bound)
+    assert np.all(np.isfinite(history["distance_to_ground_truth"]))
+    assert sum("iter" in r.getMessage() for r in caplog.records) == 5
+
+    # the result unpacks like the tuple returned by previous versions
+    x, elapsed = result
+    assert x is result.x and elapsed == result.elapsed
+    assert result[0] is result.x
+    np.testing.assert_array_equal(lp.itrn_curve, history["iteration"])
+
+    dual_result = lp.solve(method="dual_coordinate_ascent", nb_iter=2)
+    assert dual_result.y_eq is not None and dual_result.y_ineq is not None
+    assert result.y_eq is None
+
+    # solving until the timeout does not preallocate the history for nb_iter
+    for nb_iter in [10 ** 10, np.inf]:
+        result = lp.solve(
+            method="chambolle_pock_ppd", nb_iter=nb_iter, max_time=0.2, nb_iter_plot=1
+        )
+        assert result.status == "max_time"
+        assert result.history.size == result.nb_iterations + 1
+
+
+@pytest.mark.parametrize("method", ["admm2", "mehrotra", "chambolle_pock_ppd"])
+def test_solve_timings(method):
+    lp, _ = build_chain_lp()
+    result = lp.solve(method=method, nb_iter=30, nb_iter_plot=10)
+    timings = result.timings
+    phases = {"preprocessing", "conversion", "iterations", "callback", "postprocessing"}
+    if method != "chambolle_pock_ppd":
+        phases.add("factorization")
+    assert phases <= set(timings)
+    assert all(duration >= 0 for duration in timings.values())
+    # the callbacks are called from the iterations loop
+    assert timings["callback"] <= timings["iterations"] <= result.elapsed
+    assert result.profiler.counts["callback"] == len(result.history)
+
+
+def test_chrome_trace(tmp_path):
+    lp, _ = build_chain_lp()
+    result = lp.solve(
+        method="chambolle_pock_ppd", nb_iter=30, nb_iter_plot=10, record_trace=True
+    )
+    filename = str(tmp_path / "trace.json")
+    result.save_chrome_trace(filename)
+    with open(filename) as f:
+        trace = json.load(f)
+    spans = {}
+    for event in trace["traceEvents"]:
+        if event["ph"] == "X":
+            spans.setdefault(event["name"], []).append(event)
+    assert {
+        "preprocessing",
+        "conversion",
+        "preconditioning",
+        "iterations",
+        "iteration_batch",
+        "callback",
+        "postprocessing",
+    } <= set(spans)
+    assert len(spans["iteration_batch"]) == 3
+    assert len(spans["callback"]) == 3
+
+    def contains(parent, child):
+        return (
+            parent["ts"] <= child["ts"]
+            and child["ts"] + child["dur"] <= parent["ts"] + parent["dur"] + 1e-3
+        )
+
+    (iterations,) = spans["iterations"]
+    for batch, callback in zip(spans["iteration_batch"], spans["callback"]):
+        assert contains(iterations, batch) and contains(batch, callback)
+
+    with pytest.raises(ValueError):
+        lp.solve(method="chambolle_pock_ppd", nb_iter=1).profiler.chrome_trace()
+
+
+def test_metrics_policy():
+    lp, ids = build_chain_lp()
+    ground_truth = np.zeros(ids.size)
+    solutions = []
+
+    def callback_func(niter, solution, *args):
+        solutions.append(solution.copy())
+
+    result = lp.solve(
+        method="chambolle_pock_ppd",
+        nb_iter=100,
+        nb_iter_plot=10,
+        callback_func=callback_func,
+        ground_truth=ground_truth,
+        ground_truth_indices=ids.ravel(),
+        metrics_policy=MetricsPolicy(every=30),
+    )
+    history = result.history
+    evaluated = np.isfinite(history["distance_to_ground_truth"])
+    np.testing.assert_array_equal(history["iteration"][evaluated], [0, 30, 60, 90])
+    assert result.profiler.counts["metrics"] == 4
+    # the violations computed by the solver are reused at each report
+    np.testing.assert_allclose(
+        history["max_violated_constraint"],
+        [lp.max_constraint_violation(solution) for solution in solutions],
+        atol=1e-10,
+    )
+
+    result = lp.solve(
+        method="admm2",
+        nb_iter=100,
+        nb_iter_plot=10,
+        metrics_policy=MetricsPolicy(max_overhead=0),
+    )
+    evaluated = np.isfinite(result.history["max_violated_constraint"])
+    np.testing.assert_array_equal(result.history["iteration"][evaluated], [0])
+
+
+def test_csr_matvec():
+    a = scipy.sparse.random(30, 20, density=0.2, format="csr", random_state=0)
+    x = np.random.RandomState(0).randn(20)
+    y = np.random.RandomState(1).randn(30)
+    out = np.full(30, np.nan)
+    assert csr_matvec(a, x, out) is out
+    np.testing.assert_array_equal(out, a * x)
+    np.testing.assert_array_equal(csr_rmatvec(y, a, np.full(20, np.nan)), y * a)
+
+
+def test_chambolle_pock_solutions_not_overwritten():
+    lp, _ = build_chain_lp()
+    lp.finalize()
+    solutions = []
+
+    def callback_func(niter, solution, *args):
+        solutions.append(solution)
+
+    chambolle_pock_ppd(
+        lp.costsvector,
+        lp.a_equalities,
+        lp.b_equalities,
+        lp.a_inequalities,
+        lp.b_lower,
+        lp.b_upper,
+        lp.lower_bounds,
+        lp.upper_bounds,
+        nb_max_iter=30,
+        callback_func=callback_func,
+        nb_iter_plot=10,
+    )
+    # the iterations are done in place but the reported solutions are copies
+    assert len(solutions) == 3
+    assert not np.array_equal(solutions[0], solutions[2])
+
+
+def test_solve_operations():
+    lp, _ = build_chain_lp()
+    nnz = lp.a_equalities.nnz + lp.a_inequalities.nnz
+    result = lp.solve(method="chambolle_pock_ppd", nb_iter=30, nb_iter_plot=10)
+    operations = result.operations
+    # one product by each constraint matrix and by its transpose per iteration, and
+    # one more product by each matrix to evaluate the constraints every 10 iterations
+    assert operations["spmv_transposed"] == 2 * 30
+    assert operations["spmv"] == 2 * 30 + 2 * 3
+    # the ranged inequalities are not duplicated
+    assert operations["spmv_nnz"] == (30 + 30 + 3) * nnz
+    assert "factorizations" not in operations
+
+    result = lp.solve(method="admm2", nb_iter=30, nb_iter_plot=10)
+    operations = result.operations
+    assert operations["factorizations"] == 1
+    assert operations["solves"] == 31
+    assert operations["solve_nnz"] == 31 * operations["factorization_nnz"]
+
+
+@pytest.mark.parametrize(
+    "method", ["chambolle_pock_ppd", "pdhg_restarted", "admm", "dual_gradient_ascent"]
+)
+def test_parallel_sparse_operator(method):
+    a = scipy.sparse.random(50, 40, density=0.1, format="csc", random_state=0)
+    x = np.random.RandomState(0).randn(40)
+    y = np.random.RandomState(1).randn(50)
+    operator = ParallelSparseOperator(a, nb_threads=3)
+    out = np.full(50, np.nan)
+    assert operator.matvec(x, out) is out
+    np.testing.assert_array_equal(out, a * x)
+    np.testing.assert_array_equal(operator.rmatvec(y), y * a)
+    operator.close()
+
+    # the rows are split between the threads so the solutions do not change
+    lp, _ = build_chain_lp()
+    lp.convert_to_one_sided_inequality_system()
+    x1 = lp.solve(method=method, nb_iter=50, nb_threads=1).x
+    x2 = lp.solve(method=method, nb_iter=50, nb_threads=2).x
+    np.testing.assert_array_equal(x1, x2)
+
+
+def test_cached_matrix():
+    lp, _ = build_chain_lp()
+    a = lp.a_inequalities
+    stacked = scipy.sparse.vstack((lp.a_equalities, a)).tocsr()
+    csc = lp.cached_matrix("constraints", "csc")
+    assert csc.format == "csc"
+    assert (csc != stacked).nnz == 0
+    assert lp.cached_matrix("constraints", "csc") is csc
+    assert (lp.cached_matrix("a_inequalities", "transpose") != a.T).nnz == 0
+    assert (lp.cached_matrix("a_inequalities", "gram") != a.T * a).nnz == 0
+    np.testing.assert_allclose(
+        lp.cached_matrix("a_inequalities", "row_norms"),
+        np.sqrt(np.asarray(a.multiply(a).sum(axis=1)).ravel()),
+    )
+
+    # the cache is invalidated when the constraints or the variables change
+    lp.add_equality_constraints(np.array([[0, 1]]), np.array([[1.0, 1.0]]), 1)
+    assert lp.cached_matrix("constraints", "csc").shape[0] == csc.shape[0] + 1
+    csc = lp.cached_matrix("constraints", "csc")
+    lp.add_variables_array(3, 0, 1)
+    assert lp.cached_matrix("constraints", "csc").shape[1] == csc.shape[1] + 3
+    lp.a_inequalities = 2 * lp.a_inequalities
+    assert lp.cached_matrix("a_inequalities", "csr").max() == 2 * a.max()
+
+    with pytest.raises(ValueError):
+        lp.cached_matrix("a_inequalities", "dense")
+
+
+if __name__ == "__main__":
+    test_buffered_constraints()
+    test_constraint_names()
+    test_add_variables_array_growth()
+    test_add_constraints_coo()
+    test_affine_expressions()
+    test_crd_matrix_validation()
+    test_save_mps(pathlib.Path(tempfile.mkdtemp()))
+    test_mps_parser()
+    test_mps_parser_chunked(pathlib.Path(tempfile.mkdtemp()))
+    test_read_perplex_solution()
+    test_save_ian_e_h_yen(pathlib.Path(tempfile.mkdtemp()), binary=False)
+    test_save_npz(pathlib.Path(tempfile.mkdtemp()), mmap=True)
+    test_solve_tolerances("chambolle_pock_ppd")
+    test_chambolle_pock_gap("pdhg_restarted", 1000)
+    test_solve_timings("admm2")
+    test_chrome_trace(pathlib.Path(tempfile.mkdtemp()))
+    test_metrics_policy()
+    test_solve_operations()
+    test_csr_matvec()
+    test_chambolle_pock_solutions_not_overwritten()
+    test_parallel_sparse_operator("chambolle_pock_ppd")
+    test_cached_matrix()